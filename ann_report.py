@@ -0,0 +1,98 @@
+#근사 검색(IVF) 백엔드의 recall / 지연 시간 보고서 생성 파일.
+
+import json
+import time
+import argparse
+import numpy as np
+
+from fingerprinting import read_record_store
+from search_backends import HybridSearchEngine, IVFSearchEngine
+
+
+def make_queries(rssi_matrix, n_queries, noise_db, rng):
+    """DB 레코드에 가우시안 잡음을 더해 실측과 비슷한 쿼리 샘플을 만듭니다."""
+    rows = rng.integers(0, len(rssi_matrix), n_queries)
+    return rssi_matrix[rows] + rng.normal(0, noise_db, (n_queries, rssi_matrix.shape[1]))
+
+
+def scale_up(rssi_matrix, n_records, noise_db, rng):
+    """대규모 배치 환경을 흉내 내기 위해 레코드를 잡음과 함께 n_records개까지 복제합니다."""
+    if n_records <= len(rssi_matrix):
+        return rssi_matrix
+    rows = rng.integers(0, len(rssi_matrix), n_records - len(rssi_matrix))
+    extra = rssi_matrix[rows] + rng.normal(0, noise_db, (len(rows), rssi_matrix.shape[1]))
+    return np.vstack([rssi_matrix, extra.astype(rssi_matrix.dtype)])
+
+
+def timed_query(engine, queries, k, batch_size, **kwargs):
+    """배치 단위로 검색하고 (결과 인덱스, 쿼리당 평균 지연 ms)를 반환합니다."""
+    idx = []
+    start = time.perf_counter()
+    for s in range(0, len(queries), batch_size):
+        idx.append(engine.query(queries[s:s + batch_size], k, **kwargs)[0])
+    elapsed = time.perf_counter() - start
+    return np.vstack(idx), elapsed / len(queries) * 1000
+
+
+def recall_at_k(approx_idx, exact_idx):
+    k = exact_idx.shape[1]
+    hits = [len(np.intersect1d(a, e)) for a, e in zip(approx_idx, exact_idx)]
+    return float(np.sum(hits) / (len(exact_idx) * k))
+
+
+def build_report(db_path, k=5, nprobes=(1, 2, 4, 8, 16, 32), n_lists=None, n_queries=500,
+                 noise_db=3.0, n_records=None, batch_size=64, seed=0):
+    rng = np.random.default_rng(seed)
+    rssi_matrix = np.asarray(read_record_store(db_path).rssi, dtype=np.float32)
+    if n_records:
+        rssi_matrix = scale_up(rssi_matrix, n_records, noise_db, rng)
+    queries = make_queries(rssi_matrix, n_queries, noise_db, rng)
+
+    start = time.perf_counter()
+    exact = HybridSearchEngine(rssi_matrix)
+    exact_build = time.perf_counter() - start
+    exact_idx, exact_ms = timed_query(exact, queries, k, batch_size)
+
+    start = time.perf_counter()
+    ivf = IVFSearchEngine(rssi_matrix, n_lists=n_lists)
+    ivf_build = time.perf_counter() - start
+
+    rows = []
+    for nprobe in nprobes:
+        if nprobe > ivf.n_lists:
+            continue
+        idx, ms = timed_query(ivf, queries, k, batch_size, nprobe=nprobe)
+        rows.append({'nprobe': nprobe, 'recall_at_k': recall_at_k(idx, exact_idx),
+                     'top1_agreement': float((idx[:, 0] == exact_idx[:, 0]).mean()),
+                     'latency_ms': ms, 'speedup': exact_ms / ms})
+
+    return {
+        'db_path': db_path, 'n_records': len(rssi_matrix), 'n_beacons': rssi_matrix.shape[1],
+        'k': k, 'n_queries': n_queries, 'noise_db': noise_db, 'batch_size': batch_size,
+        'exact': {'build_s': exact_build, 'latency_ms': exact_ms},
+        'ivf': {'n_lists': ivf.n_lists, 'build_s': ivf_build, 'results': rows},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="IVF 근사 검색의 recall-지연 시간 보고서를 만듭니다.")
+    parser.add_argument('db_path', nargs='?', default='fingerprint_db_4dir.json')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--n-lists', type=int, default=None, help="IVF 목록 수 (기본: sqrt(레코드 수))")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=3.0, help="쿼리/복제 레코드에 더할 잡음 표준편차 (dB)")
+    parser.add_argument('--scale', type=int, default=None, help="레코드를 이 개수까지 복제해 대규모 DB를 흉내 냅니다.")
+    parser.add_argument('--output', default='ann_report.json')
+    args = parser.parse_args()
+
+    report = build_report(args.db_path, args.k, args.nprobe, args.n_lists, args.queries, args.noise, args.scale)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    print(f"레코드 {report['n_records']}개, IVF 목록 {report['ivf']['n_lists']}개, k={report['k']}")
+    print(f"exact: {report['exact']['latency_ms']:.3f} ms/쿼리")
+    for row in report['ivf']['results']:
+        print(f"nprobe={row['nprobe']:>3}: recall@{report['k']}={row['recall_at_k']:.3f}, "
+              f"{row['latency_ms']:.3f} ms/쿼리 (x{row['speedup']:.1f})")
+    print(f"✅ 보고서를 '{args.output}'에 저장했습니다.")
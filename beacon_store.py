@@ -0,0 +1,368 @@
+#비콘 MAC 인터닝과 배열 기반 레코드 저장소 파일.
+
+import numpy as np
+
+
+class BeaconRegistry:
+    """
+    비콘 MAC 주소를 작은 정수 ID(0, 1, 2, ...)로 인터닝하는 레지스트리.
+    FingerprintDB, LGBM 학습, 히트맵 등 모든 계층이 같은 레지스트리를 공유하면
+    MAC 문자열 해싱은 입력 경계에서 한 번만 일어나고 내부에서는 정수 열 인덱스만 사용합니다.
+    """
+    def __init__(self, macs=()):
+        self.macs = []
+        self._ids = {}
+        for mac in macs:
+            self.intern(mac)
+
+    def intern(self, mac):
+        """MAC의 ID를 반환합니다. 처음 보는 MAC이면 새 ID를 할당합니다."""
+        beacon_id = self._ids.get(mac)
+        if beacon_id is None:
+            beacon_id = len(self.macs)
+            self._ids[mac] = beacon_id
+            self.macs.append(mac)
+        return beacon_id
+
+    def get(self, mac, default=None):
+        return self._ids.get(mac, default)
+
+    def __len__(self):
+        return len(self.macs)
+
+    def __contains__(self, mac):
+        return mac in self._ids
+
+    def __iter__(self):
+        return iter(self.macs)
+
+
+class CSRMatrix:
+    """
+    희소 RSSI 행렬 (CSR: 행 포인터 / 비콘 ID / RSSI). 저장되지 않은 칸은 missing 값(-100)으로 봅니다.
+    비콘이 수백 개여도 레코드마다 실제로 수신된 비콘 수만큼만 저장·계산합니다.
+    """
+    def __init__(self, indptr, indices, data, n_columns, missing=-100.0):
+        # indptr[0] == 0, len(indices) == len(data) == nnz 인 정규형만 다룹니다.
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.n_columns = n_columns
+        self.missing = missing
+        self._postings = None
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def shape(self):
+        return (len(self), self.n_columns)
+
+    @property
+    def nnz(self):
+        return int(self.indptr[-1])
+
+    @classmethod
+    def from_dense(cls, matrix, missing=-100.0):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        rows, cols = np.nonzero(matrix != missing)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(matrix)))])
+        return cls(indptr, cols, matrix[rows, cols], matrix.shape[1], missing)
+
+    def row_ids(self):
+        """저장된 각 값의 행 번호 (nnz,)"""
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def toarray(self):
+        dense = np.full(self.shape, self.missing, dtype=np.float32)
+        dense[self.row_ids(), self.indices] = self.data
+        return dense
+
+    def __getitem__(self, rows):
+        """행 선택 (slice 또는 정수 인덱스 배열) → 새 CSRMatrix"""
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(len(self))
+            if step == 1:
+                lo, hi = self.indptr[start], self.indptr[max(stop, start)]
+                return CSRMatrix(self.indptr[start:max(stop, start) + 1] - lo, self.indices[lo:hi],
+                                 self.data[lo:hi], self.n_columns, self.missing)
+            rows = np.arange(start, stop, step)
+        rows = np.asarray(rows, dtype=np.intp)
+        counts = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        within = np.arange(indptr[-1]) - np.repeat(indptr[:-1], counts)
+        take = np.repeat(self.indptr[rows], counts) + within
+        return CSRMatrix(indptr, self.indices[take], self.data[take], self.n_columns, self.missing)
+
+    def column_postings(self):
+        """
+        비콘(열)별 역색인 (CSC): (열 포인터, 행 번호, RSSI).
+        비콘 j를 수신한 레코드는 rows[col_ptr[j]:col_ptr[j + 1]] 입니다.
+        """
+        if self._postings is None:
+            order = np.argsort(self.indices, kind='stable')
+            col_ptr = np.concatenate([[0], np.cumsum(np.bincount(self.indices, minlength=self.n_columns))])
+            self._postings = (col_ptr, self.row_ids()[order], self.data[order])
+        return self._postings
+
+
+class RecordStore:
+    """
+    핑거프린트 레코드를 미리 할당한 연속 배열에 저장하는 저장소.
+    - rssi: float32 (레코드 수 x 비콘 수), 수신되지 않은 비콘은 MISSING_RSSI
+    - xy: int16 (레코드 수 x 2), 측정 그리드 좌표
+    - direction: int8 (레코드 수), direction_labels 인덱스 (방향 없음: -1)
+    레코드당 (비콘 수 x 4 + 5) 바이트로, dict 레코드의 수백 바이트 오버헤드가 없습니다.
+    용량이 차면 행/열을 두 배씩 늘리므로 append는 상각 O(1)입니다.
+    """
+    MISSING_RSSI = -100.0
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, registry=None, capacity=None):
+        self.registry = registry if registry is not None else BeaconRegistry()
+        self.direction_labels = []
+        self._direction_ids = {}
+        self.size = 0
+        capacity = max(capacity or self.INITIAL_CAPACITY, 1)
+        self._init_rssi(capacity)
+        self._xy = np.zeros((capacity, 2), dtype=np.int16)
+        self._direction = np.full(capacity, -1, dtype=np.int8)
+
+    def _init_rssi(self, capacity):
+        self._rssi = np.full((capacity, max(len(self.registry), 1)), self.MISSING_RSSI, dtype=np.float32)
+
+    def __len__(self):
+        return self.size
+
+    # --- 조회 (복사 없는 view) ---
+    @property
+    def rssi(self):
+        self._ensure_columns(len(self.registry))
+        return self._rssi[:self.size, :len(self.registry)]
+
+    def csr(self):
+        """수신된 비콘만 담은 CSRMatrix (조밀 저장소에서는 변환해서 만듭니다)."""
+        return CSRMatrix.from_dense(self.rssi, self.MISSING_RSSI)
+
+    @property
+    def xy(self):
+        return self._xy[:self.size]
+
+    @property
+    def direction_codes(self):
+        return self._direction[:self.size]
+
+    def directions(self):
+        """방향 레이블 배열. 방향이 없는 레코드가 하나라도 있으면 None."""
+        codes = self.direction_codes
+        if self.size == 0 or (codes < 0).any():
+            return None
+        return np.array(self.direction_labels)[codes]
+
+    @property
+    def nbytes(self):
+        return self._rssi.nbytes + self._xy.nbytes + self._direction.nbytes
+
+    # --- 추가 ---
+    def _intern_direction(self, direction):
+        direction_id = self._direction_ids.get(direction)
+        if direction_id is None:
+            direction_id = len(self.direction_labels)
+            self._direction_ids[direction] = direction_id
+            self.direction_labels.append(direction)
+        return direction_id
+
+    def _ensure_rows(self, n_rows):
+        capacity = len(self._xy)
+        if n_rows <= capacity and self._writeable():
+            return
+        new_capacity = max(n_rows, capacity * 2)
+        self._grow_rssi(new_capacity)
+        xy = np.zeros((new_capacity, 2), dtype=np.int16)
+        xy[:self.size] = self._xy[:self.size]
+        direction = np.full(new_capacity, -1, dtype=np.int8)
+        direction[:self.size] = self._direction[:self.size]
+        self._xy, self._direction = xy, direction
+
+    def _writeable(self):
+        return self._rssi.flags.writeable and self._xy.flags.writeable
+
+    def _grow_rssi(self, new_capacity):
+        rssi = np.full((new_capacity, self._rssi.shape[1]), self.MISSING_RSSI, dtype=np.float32)
+        rssi[:self.size] = self._rssi[:self.size]
+        self._rssi = rssi
+
+    def _ensure_columns(self, n_columns):
+        if n_columns <= self._rssi.shape[1]:
+            return
+        rssi = np.full((self._rssi.shape[0], max(n_columns, self._rssi.shape[1] * 2)), self.MISSING_RSSI, dtype=np.float32)
+        rssi[:, :self._rssi.shape[1]] = self._rssi
+        self._rssi = rssi
+
+    @staticmethod
+    def _split_pos(pos):
+        x, y = pos[0], pos[1]
+        if float(x) != int(x) or float(y) != int(y):
+            raise ValueError(f"측정 위치는 정수 그리드 좌표여야 합니다: {pos}")
+        return int(x), int(y), (pos[2] if len(pos) >= 3 else None)
+
+    def append(self, pos, rssi_vector):
+        """pos: (x, y[, direction]), rssi_vector: dict MAC->RSSI"""
+        x, y, direction = self._split_pos(pos)
+        ids = [self.registry.intern(mac) for mac in rssi_vector]
+        self._ensure_rows(self.size + 1)
+        self._ensure_columns(len(self.registry))
+        row = self.size
+        self._write_rssi(row, ids, list(rssi_vector.values()))
+        self._xy[row] = (x, y)
+        self._direction[row] = -1 if direction is None else self._intern_direction(direction)
+        self.size += 1
+        return row
+
+    def extend(self, rssi_matrix, xy, directions=None, macs=None):
+        """
+        행렬 단위로 레코드를 추가합니다.
+        rssi_matrix: (n, len(macs)) RSSI, macs: 열 순서 MAC 목록 (None이면 레지스트리 순서)
+        directions: 길이 n의 방향 레이블 (없으면 None)
+        """
+        rssi_matrix = np.asarray(rssi_matrix, dtype=np.float32)
+        n_rows = rssi_matrix.shape[0]
+        columns = np.arange(rssi_matrix.shape[1]) if macs is None else [self.registry.intern(mac) for mac in macs]
+        self._ensure_rows(self.size + n_rows)
+        self._ensure_columns(len(self.registry))
+        rows = slice(self.size, self.size + n_rows)
+        self._write_rssi_rows(rows, columns, rssi_matrix)
+        self._xy[rows] = np.asarray(xy, dtype=np.int16)
+        if directions is not None:
+            labels, codes = np.unique(np.asarray(directions), return_inverse=True)
+            table = np.array([self._intern_direction(str(label)) for label in labels], dtype=np.int8)
+            self._direction[rows] = table[codes]
+        self.size += n_rows
+
+    def _write_rssi(self, row, ids, values):
+        self._rssi[row, ids] = values
+
+    def _write_rssi_rows(self, rows, columns, rssi_matrix):
+        self._rssi[rows, columns] = rssi_matrix
+
+    # --- 변환 ---
+    @classmethod
+    def from_records(cls, records, registry=None):
+        """JSON 레코드 리스트({'pos': [...], 'rssi': {...}})로부터 저장소를 만듭니다."""
+        store = cls(registry, capacity=len(records))
+        for rec in records:
+            store.append(rec['pos'], rec['rssi'])
+        return store
+
+    @classmethod
+    def from_arrays(cls, rssi, xy, direction_codes, direction_labels, registry):
+        """
+        이미 만들어진 배열(예: np.memmap)을 복사 없이 감싸는 저장소를 만듭니다.
+        읽기 전용 배열이면 첫 append 때 쓰기 가능한 배열로 복사됩니다.
+        """
+        store = cls.__new__(cls)
+        store.registry = registry
+        store.direction_labels = list(direction_labels)
+        store._direction_ids = {label: i for i, label in enumerate(store.direction_labels)}
+        store.size = len(rssi)
+        store._rssi, store._xy, store._direction = rssi, xy, direction_codes
+        return store
+
+    def to_records(self):
+        """JSON 레코드 리스트로 변환합니다. 수신되지 않은 비콘(MISSING_RSSI)은 생략합니다."""
+        records = []
+        macs = self.registry.macs
+        csr = self.csr()
+        for row in range(self.size):
+            pos = [int(v) for v in self._xy[row]]
+            if self._direction[row] >= 0:
+                pos.append(self.direction_labels[self._direction[row]])
+            lo, hi = csr.indptr[row], csr.indptr[row + 1]
+            records.append({'pos': pos, 'rssi': {macs[j]: float(v) for j, v in zip(csr.indices[lo:hi], csr.data[lo:hi])}})
+        return records
+
+
+class SparseRecordStore(RecordStore):
+    """
+    수신된 비콘만 CSR 배열(행 포인터 / 비콘 ID int32 / RSSI float32)로 저장하는 저장소.
+    건물 전체에 비콘이 수백 개 있어도 레코드당 메모리는 (수신 비콘 수 x 8 + 13) 바이트 정도이고,
+    조밀 행렬(rssi)은 필요할 때만 만들어 캐시합니다.
+    """
+    INITIAL_NNZ_PER_RECORD = 8
+
+    def _init_rssi(self, capacity):
+        self._indptr = np.zeros(capacity + 1, dtype=np.int64)
+        self._indices = np.empty(capacity * self.INITIAL_NNZ_PER_RECORD, dtype=np.int32)
+        self._values = np.empty(capacity * self.INITIAL_NNZ_PER_RECORD, dtype=np.float32)
+        self._dense_cache = None
+
+    @classmethod
+    def from_dense(cls, store):
+        """조밀 RecordStore(예: .fpdb memmap)를 같은 레지스트리·방향 레이블을 쓰는 희소 저장소로 변환합니다."""
+        sparse = cls(store.registry, capacity=len(store))
+        sparse.extend(store.rssi, store.xy)
+        sparse._direction[:len(store)] = store.direction_codes
+        sparse.direction_labels = list(store.direction_labels)
+        sparse._direction_ids = dict(store._direction_ids)
+        return sparse
+
+    @property
+    def nnz(self):
+        return int(self._indptr[self.size])
+
+    @property
+    def rssi(self):
+        key = (self.size, len(self.registry))
+        if self._dense_cache is None or self._dense_cache[0] != key:
+            self._dense_cache = (key, self.csr().toarray())
+        return self._dense_cache[1]
+
+    def csr(self):
+        nnz = self.nnz
+        return CSRMatrix(self._indptr[:self.size + 1], self._indices[:nnz], self._values[:nnz],
+                         len(self.registry), self.MISSING_RSSI)
+
+    @property
+    def nbytes(self):
+        return self._indptr.nbytes + self._indices.nbytes + self._values.nbytes + self._xy.nbytes + self._direction.nbytes
+
+    def _writeable(self):
+        return True
+
+    def _grow_rssi(self, new_capacity):
+        indptr = np.zeros(new_capacity + 1, dtype=np.int64)
+        indptr[:self.size + 1] = self._indptr[:self.size + 1]
+        self._indptr = indptr
+
+    def _ensure_columns(self, n_columns):
+        pass  # 열은 비콘 ID일 뿐이므로 미리 할당할 필요가 없습니다.
+
+    def _ensure_nnz(self, nnz):
+        if nnz <= len(self._indices):
+            return
+        new_size = max(nnz, len(self._indices) * 2)
+        indices = np.empty(new_size, dtype=np.int32)
+        values = np.empty(new_size, dtype=np.float32)
+        indices[:self.nnz] = self._indices[:self.nnz]
+        values[:self.nnz] = self._values[:self.nnz]
+        self._indices, self._values = indices, values
+
+    def _write_rssi(self, row, ids, values):
+        ids = np.asarray(ids, dtype=np.int32)
+        order = np.argsort(ids)
+        start = self._indptr[row]
+        self._ensure_nnz(start + len(ids))
+        self._indices[start:start + len(ids)] = ids[order]
+        self._values[start:start + len(ids)] = np.asarray(values, dtype=np.float32)[order]
+        self._indptr[row + 1] = start + len(ids)
+
+    def _write_rssi_rows(self, rows, columns, rssi_matrix):
+        # 조밀 행렬 입력에서 missing(-100)이 아닌 값만 골라 저장합니다.
+        columns = np.asarray(columns, dtype=np.int32)
+        order = np.argsort(columns)
+        part = CSRMatrix.from_dense(rssi_matrix[:, order], self.MISSING_RSSI)
+        start = self._indptr[rows.start]
+        self._ensure_nnz(start + part.nnz)
+        self._indices[start:start + part.nnz] = columns[order][part.indices]
+        self._values[start:start + part.nnz] = part.data
+        self._indptr[rows.start + 1:rows.stop + 1] = start + part.indptr[1:]
@@ -0,0 +1,244 @@
+#실시간 측위 루프의 샘플당 연산(필터, 측위, 분류, EKF, 경로 탐색) 마이크로 벤치마크 파일.
+#BLE / 시리얼 / Qt 없이 실행되며, 결과를 JSON 기준선으로 저장하고 기준선 대비 성능 저하를 검사합니다.
+
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from itertools import cycle
+
+import numpy as np
+
+from trilateration import SuperFilter, FilterBank, EKF
+from fingerprinting import FingerprintDB, read_record_store
+from lgbm_predictor import LGBM_Classifier_Predictor
+from Astar import find_path, create_distance_map
+from bin import create_binary_map
+from particle_filter import ParticleFilter
+from hmm_localizer import GridHMM
+
+
+def measure(fn, warmup=20, repeat=7, min_time=0.05):
+    """
+    fn()의 호출당 지연 시간(µs) 통계와 호출 한 번의 최대 추가 메모리(KB).
+    반복마다 min_time초 이상 걸리도록 호출 횟수를 정하고(timeit.autorange와 같은 방식), repeat번 잰 값의 통계를 냅니다.
+    """
+    for _ in range(warmup):
+        fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) / number * 1e6)
+
+    # tracemalloc은 실행을 느리게 하므로 시간 측정과 따로 한 번만 잽니다.
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    per_call = np.array(per_call)
+    return {'median_us': float(np.median(per_call)), 'min_us': float(per_call.min()),
+            'mean_us': float(per_call.mean()), 'stdev_us': float(per_call.std()),
+            'calls_per_repeat': number, 'repeat': repeat, 'peak_kb': peak / 1024}
+
+
+def synthetic_records(records, n_records, noise_db, rng):
+    """녹화된 레코드를 잡음과 함께 n_records개까지 복제해 큰 DB를 흉내 냅니다."""
+    if n_records <= len(records):
+        return records[:n_records]
+    out = list(records)
+    for i in rng.integers(0, len(records), n_records - len(records)):
+        rec = records[i]
+        out.append({'pos': rec['pos'], 'rssi': {mac: float(v + rng.normal(0, noise_db)) for mac, v in rec['rssi'].items()}})
+    return out
+
+
+def live_queries(records, n_queries, noise_db, rng):
+    """레코드에 잡음을 더한 실시간 형태의 입력 (dict MAC->RSSI, 방향)"""
+    queries = []
+    for i in rng.integers(0, len(records), n_queries):
+        rec = records[i]
+        rssi = {mac: float(v + rng.normal(0, noise_db)) for mac, v in rec['rssi'].items()}
+        queries.append((rssi, rec['pos'][2] if len(rec['pos']) >= 3 else None))
+    return queries
+
+
+def scaled_grid(grid, scale):
+    """지도 격자를 scale배로 키운 합성 지도 (각 칸을 scale x scale 칸으로)"""
+    return np.kron(np.asarray(grid), np.ones((scale, scale), dtype=int)) if scale > 1 else np.asarray(grid)
+
+
+def far_free_cells(grid):
+    """경로 탐색 벤치마크용 출발/도착: 길(0) 칸 중 서로 가장 먼 두 모서리 쪽 칸"""
+    free = np.argwhere(grid == 0)
+    start = free[np.argmin(free.sum(axis=1))]
+    end = free[np.argmax(free.sum(axis=1))]
+    return tuple(int(v) for v in start), tuple(int(v) for v in end)
+
+
+def build_cases(db_path, model_path, map_path, db_sizes, map_scales, k=3, noise_db=3.0, seed=0):
+    """(이름, 호출할 함수) 목록. 이름에 입력 종류와 크기가 들어가므로 기준선 비교의 키가 됩니다."""
+    rng = np.random.default_rng(seed)
+    records = read_record_store(db_path).to_records()
+    queries = live_queries(records, 512, noise_db, rng)
+    cases = []
+
+    # --- RSSI 필터: 녹화된 비콘 하나의 RSSI 순서 그대로 ---
+    mac = next(iter(records[0]['rssi']))
+    stream = cycle([rec['rssi'][mac] for rec in records if mac in rec['rssi']])
+    rssi_filter = SuperFilter()
+    cases.append(('superfilter.filtering[recorded]', lambda: rssi_filter.filtering(next(stream))))
+
+    # --- 필터 뱅크: 녹화된 광고 순서(레코드마다 모든 비콘) 그대로, 한 개씩과 한꺼번에 ---
+    bank = FilterBank(records[0]['rssi'])
+    adverts = [(bank.index[m], v) for rec in records for m, v in rec['rssi'].items() if m in bank.index]
+    advert_stream = cycle(adverts)
+    cases.append(('filterbank.update[recorded]', lambda: bank.update(*next(advert_stream))))
+    replay_idx, replay_rssi = np.array([i for i, _ in adverts]), np.array([v for _, v in adverts])
+    replay_bank = FilterBank(records[0]['rssi'])
+    cases.append((f'filterbank.update_many[recorded,samples={len(adverts)}]',
+                  lambda: replay_bank.update_many(replay_idx, replay_rssi)))
+
+    # --- 핑거프린트 kNN: 녹화 DB와 합성 확대 DB ---
+    for n_records in db_sizes:
+        db = FingerprintDB()
+        db.records = synthetic_records(records, n_records, noise_db, rng)
+        db.build_index()
+        kind = 'recorded' if n_records <= len(records) else 'synthetic'
+        it = cycle(queries)
+
+        def get_position(db=db, it=it):
+            rssi, heading = next(it)
+            return db.get_position(rssi, k=k, heading=heading)
+        cases.append((f'fingerprintdb.get_position[{kind},records={len(db.store)}]', get_position))
+
+    # --- LGBM 분류 (실행 환경과 같은 모델 파일) ---
+    # 모델을 못 불러오면 항목을 빼지 않고 멈춥니다. (빠진 항목은 --compare에서도 드러나지 않습니다.)
+    predictor = LGBM_Classifier_Predictor()
+    if model_path is None:
+        model_path = predictor.load_default_model()
+    elif not predictor.load_model(model_path):
+        model_path = None
+    if model_path is None:
+        raise RuntimeError("LGBM 모델을 불러오지 못했습니다. train_model.py로 lgbm_predictor.pkl을 먼저 만드세요.")
+    it = cycle([{**rssi, 'direction': heading} for rssi, heading in queries])
+    cases.append((f'lgbm.predict[{model_path}]', lambda: predictor.predict(next(it))))
+
+    # --- EKF ---
+    ekf = EKF(1.0)
+    yaws = cycle(rng.uniform(0, 360, 256).tolist())
+    measurements = cycle(rng.uniform(0, 4, (256, 2)))
+    cases.append(('ekf.predict[synthetic]', lambda: ekf.predict(next(yaws), 0.5)))
+    cases.append(('ekf.update[synthetic]', lambda: ekf.update(next(measurements))))
+    replay = np.column_stack([np.arange(1000) % 2, rng.uniform(0, 360, 1000), rng.uniform(0, 1.5, 1000)])
+    replay[1::2, 1:] = rng.uniform(0, 4, (500, 2))
+    cases.append(('ekf.run_sequence[synthetic,events=1000]', lambda: EKF(1.0).run_sequence(replay)))
+
+    # --- 지도: map.png 격자와 합성 확대 격자 ---
+    base_grid = create_binary_map(map_path, block_size=10)
+    if base_grid is not None:
+        # 파티클 필터 (config.yaml 기본 축척: 190 px/m, 블록 10 px)
+        pf = ParticleFilter(base_grid, (10 / 190, 10 / 190), n_particles=5000, seed=seed)
+        start_m = np.array(far_free_cells(np.asarray(base_grid))[0][::-1]) * 10 / 190
+        pf.reset(start_m, spread=0.1)
+        cases.append(('particle_filter.predict[recorded,particles=5000]', lambda: pf.predict(next(yaws), 0.3)))
+        proba = rng.dirichlet(np.ones(12))
+        class_positions = rng.uniform(0, 3, (12, 2))
+        cases.append(('particle_filter.update_proba[synthetic,particles=5000,classes=12]',
+                      lambda: pf.update_proba(proba, class_positions)))
+        for block in (4, 1):
+            hmm = GridHMM(base_grid, (10 / 190, 10 / 190), block=block)
+
+            def hmm_step(hmm=hmm):
+                hmm.predict(next(yaws), 0.3)
+                hmm.update_proba(proba, class_positions)
+            cases.append((f'grid_hmm.step[recorded,states={hmm.n}]', hmm_step))
+        for scale in map_scales:
+            grid = scaled_grid(base_grid, scale)
+            kind = 'recorded' if scale == 1 else 'synthetic'
+            shape = f'{grid.shape[0]}x{grid.shape[1]}'
+            cases.append((f'astar.create_distance_map[{kind},{shape}]', lambda grid=grid: create_distance_map(grid)))
+            distance_map, max_dist = create_distance_map(grid)
+            distance_map = np.array(distance_map)
+            start, end = far_free_cells(grid)
+            cases.append((f'astar.find_path[{kind},{shape}]',
+                          lambda grid=grid, d=distance_map, m=max_dist, s=start, e=end: find_path(grid, s, e, d, m, 2.5)))
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """기준선보다 median 지연(또는 peak 메모리)이 threshold 비율 넘게 늘어난 항목 목록"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        ratio = current['median_us'] / base['median_us']
+        if ratio > 1 + threshold:
+            regressions.append({'case': name, 'metric': 'median_us', 'baseline': base['median_us'],
+                                'current': current['median_us'], 'ratio': ratio})
+        # 수 KB 이하의 할당은 실행마다 흔들리므로 비교하지 않습니다.
+        if base['peak_kb'] >= 4 and current['peak_kb'] / base['peak_kb'] > 1 + threshold:
+            regressions.append({'case': name, 'metric': 'peak_kb', 'baseline': base['peak_kb'],
+                                'current': current['peak_kb'], 'ratio': current['peak_kb'] / base['peak_kb']})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="실시간 측위 루프의 연산별 마이크로 벤치마크 (헤드리스)")
+    parser.add_argument('--db', default='fingerprint_db_4dir.json')
+    parser.add_argument('--model', default=None, help="모델 경로 (기본: lgbm_predictor.pkl을 컴파일한 lgbm_predictor.npz)")
+    parser.add_argument('--map', default='map.png')
+    parser.add_argument('--db-sizes', type=int, nargs='+', default=[2401, 20000],
+                        help="kNN DB 레코드 수. 녹화 DB보다 크면 잡음을 더해 복제합니다.")
+    parser.add_argument('--map-scales', type=int, nargs='+', default=[1, 2], help="map.png 격자 확대 배율")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--min-time', type=float, default=0.05, help="반복 한 번의 최소 측정 시간 (초)")
+    parser.add_argument('--filter', default=None, help="이 문자열이 이름에 들어간 항목만 실행합니다.")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--save-baseline', default=None, help="결과를 기준선 파일로도 저장합니다.")
+    parser.add_argument('--compare', default=None, help="비교할 기준선 JSON 파일")
+    parser.add_argument('--threshold', type=float, default=0.2, help="성능 저하로 볼 증가 비율 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    cases = build_cases(args.db, args.model, args.map, args.db_sizes, args.map_scales)
+    results = {}
+    for name, fn in cases:
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.warmup, args.repeat, args.min_time)
+        r = results[name]
+        print(f"{name:60s} {r['median_us']:12.2f} µs (±{r['stdev_us']:.2f})  peak {r['peak_kb']:8.1f} KB")
+
+    report = {'meta': {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+                       'machine': platform.machine(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'results': results}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"✅ 결과를 '{args.output}'에 저장했습니다.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            for r in regressions:
+                print(f"⚠️ 성능 저하: {r['case']} {r['metric']} {r['baseline']:.2f} → {r['current']:.2f} (x{r['ratio']:.2f})")
+            raise SystemExit(1)
+        print(f"✅ 기준선 '{args.compare}' 대비 {args.threshold:.0%} 넘게 느려진 항목이 없습니다.")
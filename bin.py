@@ -46,18 +46,17 @@ def create_binary_map(image_path, block_size=10, wall_threshold=128):
     
 
 
-# --- 사용 예시 ---
-# 지도 이미지 파일 경로
-map_image_file = 'map.png'  
-
-# 함수 호출하여 이진 맵 생성
-# 이미지 크기가 700x500이고 block_size가 20이면, 결과는 25x35 크기의 2차원 리스트가 됩니다.
-binary_grid = create_binary_map(map_image_file)
-
-# 결과 출력
-if binary_grid:
-    for row in binary_grid:
-        # 각 숫자를 공백으로 구분하여 보기 좋게 출력
-        print(' '.join(map(str, row)))
-
-
+if __name__ == '__main__':
+    # --- 사용 예시 ---
+    # 지도 이미지 파일 경로
+    map_image_file = 'map.png'  
+
+    # 함수 호출하여 이진 맵 생성
+    # 이미지 크기가 700x500이고 block_size가 20이면, 결과는 25x35 크기의 2차원 리스트가 됩니다.
+    binary_grid = create_binary_map(map_image_file)
+
+    # 결과 출력
+    if binary_grid:
+        for row in binary_grid:
+            # 각 숫자를 공백으로 구분하여 보기 좋게 출력
+            print(' '.join(map(str, row)))
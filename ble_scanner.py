@@ -1,19 +1,20 @@
 #멀티쓰레딩을 통해 RSSI 신호를 받는 파일. 
 
 import sys
+import time
 import asyncio
 from PyQt5.QtCore import QThread, pyqtSignal, Qt
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout
 from bleak import BleakScanner, BleakError
 from collections import deque
-from trilateration import SuperFilter
+from trilateration import FilterBank
 from app_config import load_config
-from trilateration import KalmanFilter
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 class BLEScanThread(QThread): # 멀티쓰레딩으로 RSSI 신호를 받고, 저장된 mac주소와 일치하다면 필터링 후 시그널 외부로 전달.
     detected = pyqtSignal(dict)
+    detected_at = pyqtSignal(dict, float) # 같은 값 + 수신 시각(time.monotonic()). event_fusion.EventFusion이 시각 순서로 융합할 때 씀.
 #   시그널 정의, 딕셔너리 인자로 저장
 #   클래스 내부에서 발생한 신호를 외부로 전달!
 #    main.py, calib.py에서 connect로 전달받음.
@@ -24,9 +25,9 @@ class BLEScanThread(QThread): # 멀티쓰레딩으로 RSSI 신호를 받고, 저
 
         
         if kalman_filters is None: 
-            self.filters = {mac: SuperFilter() for mac in config['beacon_macs']} #yaml 파일에 있는 mac 주소를 key로 하는 딕셔너리 생성 
-        else:                                                                    #각 비콘마다 별도의 필터 객체 생성. filters : {mac: SuperFilter()...} key: mac이고 value는 SuperFilter 객체.
-            self.filters = kalman_filters #객체를 받으면 그냥 씀.
+            self.filters = FilterBank(config['beacon_macs']) #yaml 파일에 있는 mac 주소마다 칼만+이동평균 필터(SuperFilter와 같은 출력) 한 줄씩.
+        else:                                                #비콘별 필터 상태는 FilterBank 배열 안에 모여 있음. filters.index : {mac: 행 번호}
+            self.filters = kalman_filters #FilterBank를 받으면 그냥 씀. (calib.py는 이동평균 없는 칼만필터만)
 
         self.windows = {mac: deque(maxlen=config['filter_window']) for mac in config['beacon_macs']} #양방향 큐 선언. maxlwen = 5 각 비콘마다 크기가 5인 큐 선언..
         self.scanning = False
@@ -34,14 +35,16 @@ class BLEScanThread(QThread): # 멀티쓰레딩으로 RSSI 신호를 받고, 저
     def detection_callback(self, device, adv): #콜백함수. BLE 광고 패킷을 받을 때마다 호출된다..!!
         addr = device.address
         if addr in self.windows: #등록된 mac 주소와 같다면. 6개
+            received_at = time.monotonic() #광고 패킷을 받은 시각. GUI 스레드가 바빠 시그널이 늦게 처리돼도 측정 시각은 그대로.
             rssi = adv.rssi  
             
             #self.windows[addr].append(rssi)#주소 큐에 rssi값 추가. 
             #avg = sum(self.windows[addr]) / len(self.windows[addr]) #평균필터 -> 칼만필터 내부에서 처리해주므로 사용 X
-            filt = self.filters[addr].filtering(rssi) #칼만필터 및 이동평균필터 적용. 
+            filt = self.filters.filtering(addr, rssi) #칼만필터 및 이동평균필터 적용. 
             # print(f"\"Detected {addr}: {rssi}, {filt}\",") 
             #self.detected.emit({addr: filt}) #주소와 필터링된 rssi값을 딕셔너리 형태로 emit. -> BLEScanThread 클래스의 detected 시그널을 발생시킴.
             self.detected.emit({addr: filt})
+            self.detected_at.emit({addr: filt}, received_at)
     async def scan_loop(self): #스캔 루프.
         scanner = BleakScanner() # 비동기 ble 라이브러리.
         scanner.register_detection_callback(self.detection_callback) #콜백함수 직접 등록. ->detection_callback
@@ -1,6 +1,7 @@
 # 핑거프린팅 캘리브래이션 파일 (4방향 자동 측정 버전)
 
 import sys
+import math
 import os
 from PyQt5.QtCore import QCoreApplication, Qt, QRectF, QTimer
 from PyQt5.QtGui import QPixmap, QKeySequence, QColor, QFont
@@ -9,8 +10,9 @@ from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QGr
 # --- 다른 모듈 import (실제 환경에 맞게 경로 설정 필요) ---
 from app_config import load_config
 from ble_scanner import BLEScanThread
-from trilateration import KalmanFilter
+from trilateration import FilterBank
 from fingerprinting import FingerprintDB
+from beacon_store import BeaconRegistry
 from map_viewer import MapViewer
 
 # --- 이 코드를 스크립트 최상단에 추가 (Qt 플러그인 오류 방지) ---
@@ -100,8 +102,11 @@ class CalibrationWindow(QWidget):
     def __init__(self):
         super().__init__()
         self.cfg = load_config()
-        self.kf = {mac: KalmanFilter() for mac in self.cfg['beacon_macs']}
-        self.fpdb = FingerprintDB(required_samples=50)
+        self.kf = FilterBank(self.cfg['beacon_macs'], smoothing=False)  # KalmanFilter와 같은 출력 (이동평균 없음)
+        # config의 비콘 목록으로 ID를 미리 고정해 두면 DB 열 순서가 스캔 순서와 무관해집니다.
+        self.beacon_registry = BeaconRegistry(self.cfg['beacon_macs'])
+        # 증분 색인 모드: 수집한 샘플을 바로 검색할 수 있어 측정 중에도 실시간 측위 품질을 볼 수 있습니다.
+        self.fpdb = FingerprintDB(required_samples=50, registry=self.beacon_registry, incremental=True)
         self.thread = BLEScanThread(self.cfg, self.kf)
         self.thread.detected.connect(self.on_scan)
 
@@ -219,6 +224,7 @@ class CalibrationWindow(QWidget):
             current_count = len(self.fpdb._acc_buffer.get(pos_key, [])) + 1
             total_samples = self.fpdb.required_samples
             status_text = f"({self.current_x}, {self.current_y}, '{self.current_direction}') 수집 중: {current_count} / {total_samples}"
+            status_text += self._live_quality_text()
             self.status_label.setText(status_text)
             ### -------------------------- ###
             
@@ -230,6 +236,14 @@ class CalibrationWindow(QWidget):
                 self.thread.stop()
                 QTimer.singleShot(100, self._on_collection_finished)
 
+    def _live_quality_text(self):
+        """이번 샘플을 DB에 넣기 전에 지금까지 수집한 DB로 측위해 현재 지점과의 오차를 보여줍니다."""
+        if self.fpdb.engine is None:
+            return ""
+        est, _, _ = self.fpdb.get_position(self.tmp_vec, k=3)
+        err = math.hypot(est[0] - self.current_x, est[1] - self.current_y)
+        return f"  |  실시간 측위: ({est[0]:.1f}, {est[1]:.1f}), 오차 {err:.2f}칸"
+
     def _on_collection_finished(self):
         self.completed_directions.add(self.current_direction)
         remaining_dirs = [d for d in self.directions if d not in self.completed_directions]
@@ -254,6 +268,7 @@ class CalibrationWindow(QWidget):
     def finish(self):
         if not self.thread.isRunning():
             self.thread.stop()
+            self.fpdb.wait_for_merge()
             self.fpdb.build_index()
             path = self.cfg.get('fingerprint_db_path', 'fingerprint_db_4dir.json')
             self.fpdb.save(path)
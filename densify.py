@@ -0,0 +1,191 @@
+#라디오 맵 고밀도화(가상 핑거프린트 생성) 파일.
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from beacon_store import RecordStore
+from fingerprinting import CellPrototypes, read_record_store
+
+
+class DenseRadioMap:
+    """
+    고밀도 격자 위의 가상 핑거프린트.
+    - points: (M, 2) 측정 좌표계(측정 셀 인덱스 단위, 셀 중심 = 정수)의 실수 좌표
+    - directions: (M,) 방향 레이블 또는 None
+    - rssi: (M, 비콘 수) float32, 열 순서는 macs
+    """
+    def __init__(self, macs, points, rssi, directions=None, source_hash=None):
+        self.macs = list(macs)
+        self.points = np.asarray(points, dtype=float)
+        self.rssi = np.asarray(rssi, dtype=np.float32)
+        self.directions = None if directions is None else np.asarray(directions)
+        self.source_hash = source_hash
+
+    def __len__(self):
+        return len(self.points)
+
+    def matrix_for(self, registry):
+        """레지스트리(비콘 ID) 열 순서의 RSSI 행렬. 가상 맵에 없는 비콘은 -100으로 채웁니다."""
+        for mac in self.macs:
+            registry.intern(mac)
+        matrix = np.full((len(self), len(registry)), RecordStore.MISSING_RSSI, dtype=np.float32)
+        matrix[:, [registry.get(mac) for mac in self.macs]] = self.rssi
+        return matrix
+
+    def nearest_cells(self):
+        """각 가상 핑거프린트에 가장 가까운 측정 셀 (x, y) 정수 좌표."""
+        return np.rint(self.points).astype(int)
+
+    def save(self, path):
+        np.savez(path, macs=np.array(self.macs), points=self.points, rssi=self.rssi,
+                 directions=np.array([]) if self.directions is None else self.directions,
+                 source_hash=np.array(self.source_hash or ''))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            directions = data['directions'] if data['directions'].size else None
+            return cls(data['macs'].tolist(), data['points'], data['rssi'], directions,
+                       str(data['source_hash']) or None)
+
+
+def file_hash(path):
+    """DB 파일 내용의 SHA-1 해시 (캐시 키용)."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class RadioMapDensifier:
+    """
+    측정 셀별 (이상치 제거) 평균 RSSI를 방향·비콘마다 공간 보간해 고밀도 격자의 가상 핑거프린트를 만듭니다.
+    method: 'idw' (역거리 가중) 또는 'gp' (RBF 커널 가우시안 프로세스 회귀)
+    resolution: 가상 격자 간격 (m)
+    grid_size: 측정 셀 크기 (m). 측정 셀 (x, y)의 중심은 ((x + 0.5) * grid_size) m 입니다. (calib.py 마커 위치와 동일)
+    wall_grid: bin.create_binary_map 결과(1 = 벽). 주어지면 벽 블록 위의 가상 점은 버립니다.
+    px_per_m, block_size: wall_grid 블록과 미터 좌표 변환용 (main.py와 같은 값)
+    """
+    def __init__(self, method='idw', resolution=0.05, grid_size=(1.0, 1.0), idw_power=2.0,
+                 gp_length_scale=1.0, gp_noise=4.0, wall_grid=None, px_per_m=(190, 190), block_size=10,
+                 cache_dir='dense_cache'):
+        if method not in ('idw', 'gp'):
+            raise ValueError(f"지원하지 않는 보간 방식입니다: {method}")
+        self.method = method
+        self.resolution = resolution
+        self.grid_size = grid_size
+        self.idw_power = idw_power
+        self.gp_length_scale = gp_length_scale
+        self.gp_noise = gp_noise
+        self.wall_grid = None if wall_grid is None else np.asarray(wall_grid)
+        self.px_per_m = px_per_m
+        self.block_size = block_size
+        self.cache_dir = cache_dir
+
+    def _params_key(self):
+        params = {'method': self.method, 'resolution': self.resolution, 'grid_size': list(self.grid_size),
+                  'idw_power': self.idw_power, 'gp_length_scale': self.gp_length_scale, 'gp_noise': self.gp_noise,
+                  'px_per_m': list(self.px_per_m), 'block_size': self.block_size}
+        if self.wall_grid is not None:
+            params['wall_grid'] = hashlib.sha1(np.ascontiguousarray(self.wall_grid, dtype=np.uint8).tobytes()).hexdigest()
+        return json.dumps(params, sort_keys=True)
+
+    # --- 격자 ---
+    def _fine_grid(self, cell_xy):
+        """측정 영역(셀 경계 포함)을 덮는 가상 격자점 (M, 2), 측정 좌표계 단위. 벽 위의 점은 제외합니다."""
+        gx, gy = self.grid_size
+        lo = cell_xy.min(axis=0)
+        hi = cell_xy.max(axis=0) + 1
+        xs = np.arange(lo[0] * gx + self.resolution / 2, hi[0] * gx, self.resolution)
+        ys = np.arange(lo[1] * gy + self.resolution / 2, hi[1] * gy, self.resolution)
+        mx, my = np.meshgrid(xs, ys)
+        meters = np.column_stack([mx.ravel(), my.ravel()])
+        if self.wall_grid is not None:
+            cols = (meters[:, 0] * self.px_per_m[0] // self.block_size).astype(int)
+            rows = (meters[:, 1] * self.px_per_m[1] // self.block_size).astype(int)
+            inside = (rows >= 0) & (rows < self.wall_grid.shape[0]) & (cols >= 0) & (cols < self.wall_grid.shape[1])
+            free = np.zeros(len(meters), dtype=bool)
+            free[inside] = self.wall_grid[rows[inside], cols[inside]] == 0
+            meters = meters[free]
+        return meters / np.array([gx, gy]) - 0.5
+
+    # --- 보간 ---
+    def _interpolate(self, anchors, values, targets):
+        """anchors (C, 2)의 values (C, 비콘 수)를 targets (M, 2)로 보간합니다. 좌표는 미터 단위."""
+        diff = targets[:, np.newaxis, :] - anchors[np.newaxis, :, :]
+        sq_dist = (diff * diff).sum(axis=2)
+        if self.method == 'idw':
+            with np.errstate(divide='ignore'):
+                weights = sq_dist ** (-self.idw_power / 2)
+            # 측정 셀과 정확히 겹치는 점은 그 셀 값을 그대로 씁니다.
+            exact = sq_dist == 0
+            hit = exact.any(axis=1)
+            weights[hit] = exact[hit]
+            return (weights @ values) / weights.sum(axis=1)[:, np.newaxis]
+
+        # GP: 비콘별 평균을 사전 평균으로 두고 잔차를 RBF 커널로 회귀합니다.
+        prior = values.mean(axis=0)
+        scale = 2 * self.gp_length_scale ** 2
+        anchor_diff = anchors[:, np.newaxis, :] - anchors[np.newaxis, :, :]
+        kernel = np.exp(-(anchor_diff * anchor_diff).sum(axis=2) / scale)
+        kernel[np.diag_indices_from(kernel)] += self.gp_noise / max(values.var(), 1e-6)
+        coef = np.linalg.solve(kernel, values - prior)
+        return np.exp(-sq_dist / scale) @ coef + prior
+
+    def densify(self, store, source_hash=None):
+        """RecordStore → DenseRadioMap"""
+        prototypes = CellPrototypes.from_store(store)
+        cell_m = (prototypes.cell_xy + 0.5) * np.array(self.grid_size)
+        targets = self._fine_grid(prototypes.cell_xy)
+        target_m = (targets + 0.5) * np.array(self.grid_size)
+
+        if prototypes.cell_directions is None:
+            groups = [(None, np.arange(len(prototypes)))]
+        else:
+            groups = [(label, np.flatnonzero(prototypes.cell_directions == label))
+                      for label in np.unique(prototypes.cell_directions)]
+
+        points, rssi, directions = [], [], []
+        for label, cells in groups:
+            rssi.append(self._interpolate(cell_m[cells], prototypes.means[cells], target_m))
+            points.append(targets)
+            directions.append(np.full(len(targets), label, dtype=object))
+        directions = None if groups[0][0] is None else np.concatenate(directions).astype(str)
+        return DenseRadioMap(store.registry.macs, np.vstack(points), np.vstack(rssi), directions, source_hash)
+
+    def densify_file(self, db_path, use_cache=True):
+        """DB 파일을 고밀도화합니다. 결과는 (DB 해시 + 파라미터) 키로 cache_dir에 .npz로 캐시됩니다."""
+        source_hash = file_hash(db_path)
+        key = hashlib.sha1((source_hash + self._params_key()).encode('utf-8')).hexdigest()[:16]
+        cache_path = os.path.join(self.cache_dir, f"dense_{key}.npz")
+        if use_cache and os.path.exists(cache_path):
+            return DenseRadioMap.load(cache_path)
+
+        dense = self.densify(read_record_store(db_path), source_hash)
+        if use_cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            dense.save(cache_path)
+        return dense
+
+
+if __name__ == '__main__':
+    import argparse
+    from bin import create_binary_map
+
+    parser = argparse.ArgumentParser(description="핑거프린트 DB를 고밀도 가상 핑거프린트로 보간합니다.")
+    parser.add_argument('db_path', nargs='?', default='fingerprint_db_4dir.json')
+    parser.add_argument('--method', choices=['idw', 'gp'], default='idw')
+    parser.add_argument('--resolution', type=float, default=0.05, help="가상 격자 간격 (m)")
+    parser.add_argument('--map', default=None, help="벽 마스킹에 쓸 지도 이미지 (예: map.png)")
+    parser.add_argument('--output', default=None, help="결과 .npz 경로 (지정하지 않으면 캐시에만 저장)")
+    args = parser.parse_args()
+
+    wall_grid = create_binary_map(args.map) if args.map else None
+    densifier = RadioMapDensifier(method=args.method, resolution=args.resolution, wall_grid=wall_grid)
+    dense = densifier.densify_file(args.db_path)
+    if args.output:
+        dense.save(args.output)
+    print(f"✅ 가상 핑거프린트 {len(dense)}개 생성 (비콘 {len(dense.macs)}개, 방법: {args.method})")
@@ -0,0 +1,165 @@
+#측위 방식별(kNN 핑거프린트, LGBM 분류, LGBM+EKF 융합) 위치 오차 / 추론 지연 평가 파일.
+
+import os
+import json
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fingerprinting import FingerprintDB, read_record_store, HEADING_CENTERS
+from lgbm_predictor import LGBM_Classifier_Predictor
+from trilateration import EKF
+
+METHODS = ('knn', 'lgbm', 'ekf_lgbm')
+
+# 작업 프로세스마다 한 번만 받는 평가 데이터 (_init_worker 참고)
+_data = None
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def load_samples(db_path):
+    """
+    평가 샘플. 방향이 있는 레코드만, 저장소(수집) 순서대로 씁니다.
+    반환: dict(records, X (LGBM 피처 DataFrame), labels, xy (셀 좌표), cells (셀 레이블))
+    """
+    store = read_record_store(db_path)
+    records = [r for r in store.to_records() if len(r['pos']) >= 3]
+    X, y = LGBM_Classifier_Predictor()._prepare_data(db_path)
+    xy = np.array([r['pos'][:2] for r in records], dtype=np.float64)
+    return {'records': records, 'X': X, 'labels': y.to_numpy().astype(str), 'xy': xy,
+            'cells': np.array([f"{int(x)}_{int(y)}" for x, y in xy])}
+
+
+def make_folds(data, scheme='loco', n_splits=5, seed=0):
+    """
+    'loco': 셀 하나((x, y)의 모든 방향)를 통째로 빼는 leave-one-cell-out. 학습에 없는 셀을 얼마나 가까이 맞히는지 봅니다.
+    'kfold': 샘플을 무작위로 n_splits개로 나눕니다. 모든 셀이 학습에 들어가므로 측정 지점 위에서의 정확도를 봅니다.
+    """
+    if scheme == 'loco':
+        return [(np.flatnonzero(data['cells'] != cell), np.flatnonzero(data['cells'] == cell))
+                for cell in np.unique(data['cells'])]
+    if scheme == 'kfold':
+        order = np.random.default_rng(seed).permutation(len(data['cells']))
+        parts = np.array_split(order, n_splits)
+        return [(np.sort(np.concatenate(parts[:i] + parts[i + 1:])), np.sort(parts[i])) for i in range(n_splits)]
+    raise ValueError(f"알 수 없는 평가 방식입니다: {scheme}")
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _run_fold(task):
+    """작업 프로세스: 한 폴드의 학습 데이터로 각 방식을 만들고 검증 샘플을 한 개씩 측위합니다."""
+    fold, train_idx, test_idx, k, grid_size, ekf_dt, params = task
+    records, cell_size = _data['records'], np.asarray(grid_size, dtype=np.float64)
+    true_m = (_data['xy'][test_idx] + 0.5) * cell_size
+    pos = {m: np.empty((len(test_idx), 2)) for m in METHODS}
+    latency = {m: np.empty(len(test_idx)) for m in METHODS}
+
+    db = FingerprintDB(grid_size=grid_size)
+    db.records = [records[i] for i in train_idx]
+    db.build_index()
+    predictor = LGBM_Classifier_Predictor()
+    predictor.fit(_data['X'].iloc[train_idx], _data['labels'][train_idx], params)
+    predictor.use_compiled()
+    start_m = (_data['xy'][train_idx].mean(axis=0) + 0.5) * cell_size
+
+    ekf, group = None, None
+    for n, i in enumerate(test_idx):
+        rec = records[i]
+        heading = rec['pos'][2]
+        (knn_xy, _, _), latency['knn'][n] = _timed(db.get_position, rec['rssi'], k=k, heading=heading)
+        pos['knn'][n] = (np.asarray(knn_xy) + 0.5) * cell_size
+
+        label, latency['lgbm'][n] = _timed(predictor.predict, {**rec['rssi'], 'direction': heading})
+        pos['lgbm'][n] = (np.array(label.split('_'), dtype=np.float64) + 0.5) * cell_size
+
+        # 같은 자리/방향에서 연속으로 측정한 샘플을 정지 상태(속도 0)의 시퀀스로 보고 EKF에 차례로 넣습니다.
+        # 측정 지점마다 학습 셀들의 중심에서 다시 시작하므로 수렴 과정의 오차까지 포함됩니다.
+        if (rec['pos'][0], rec['pos'][1], heading) != group:
+            group = (rec['pos'][0], rec['pos'][1], heading)
+            ekf = EKF(ekf_dt)
+            ekf.x[:2] = start_m
+        start = time.perf_counter()
+        ekf.predict(HEADING_CENTERS[heading], 0.0)
+        ekf.update(pos['lgbm'][n])
+        latency['ekf_lgbm'][n] = (time.perf_counter() - start) * 1000 + latency['lgbm'][n]
+        pos['ekf_lgbm'][n] = ekf.get_state()[:2]
+
+    errors = {m: np.linalg.norm(pos[m] - true_m, axis=1) for m in METHODS}
+    return fold, test_idx, errors, latency
+
+
+def summarize(errors, latency, cells):
+    by_cell = defaultdict(list)
+    for cell, e in zip(cells, errors):
+        by_cell[cell].append(e)
+    return {
+        'mean_error_m': float(errors.mean()), 'median_error_m': float(np.median(errors)),
+        'p90_error_m': float(np.percentile(errors, 90)), 'max_error_m': float(errors.max()),
+        'latency_ms_mean': float(latency.mean()), 'latency_ms_p99': float(np.percentile(latency, 99)),
+        'cell_errors_m': {cell: float(np.mean(v)) for cell, v in sorted(by_cell.items())},
+    }
+
+
+def evaluate(db_path, scheme='loco', n_splits=5, k=3, grid_size=(1.0, 1.0), ekf_dt=1.0, params=None,
+             workers=None, seed=0):
+    data = load_samples(db_path)
+    folds = make_folds(data, scheme, n_splits, seed)
+    tasks = [(f, train_idx, test_idx, k, tuple(grid_size), ekf_dt, params)
+             for f, (train_idx, test_idx) in enumerate(folds)]
+    workers = workers or os.cpu_count() or 1
+    print(f"{scheme}: 폴드 {len(folds)}개, 샘플 {len(data['cells'])}개 (프로세스 {workers}개)")
+
+    n = len(data['cells'])
+    errors = {m: np.full(n, np.nan) for m in METHODS}
+    latency = {m: np.full(n, np.nan) for m in METHODS}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+        for fold, test_idx, fold_errors, fold_latency in pool.map(_run_fold, tasks):
+            for m in METHODS:
+                errors[m][test_idx] = fold_errors[m]
+                latency[m][test_idx] = fold_latency[m]
+    elapsed = time.perf_counter() - start
+
+    tested = ~np.isnan(errors[METHODS[0]])
+    return {
+        'db_path': db_path, 'scheme': scheme, 'n_folds': len(folds), 'n_samples': int(tested.sum()),
+        'k': k, 'grid_size': list(grid_size), 'ekf_dt': ekf_dt, 'params': params, 'workers': workers,
+        'elapsed_s': elapsed,
+        'methods': {m: summarize(errors[m][tested], latency[m][tested], data['cells'][tested]) for m in METHODS},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="kNN / LGBM / LGBM+EKF 측위의 위치 오차와 지연 시간을 같은 데이터로 비교합니다.")
+    parser.add_argument('db_path', nargs='?', default='fingerprint_db_4dir.json', help="핑거프린트 DB (.json 또는 .fpdb)")
+    parser.add_argument('--scheme', choices=['loco', 'kfold'], default='loco')
+    parser.add_argument('--splits', type=int, default=5, help="kfold 폴드 수")
+    parser.add_argument('--k', type=int, default=3, help="kNN 이웃 수")
+    parser.add_argument('--grid-size', type=float, nargs=2, default=(1.0, 1.0), help="측정 셀 크기 (m)")
+    parser.add_argument('--ekf-dt', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=None, help="프로세스 수 (기본: CPU 코어 수)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='evaluation_report.json')
+    args = parser.parse_args()
+
+    report = evaluate(args.db_path, args.scheme, args.splits, args.k, args.grid_size, args.ekf_dt,
+                      workers=args.workers, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    for name, r in report['methods'].items():
+        print(f"{name:9s} 평균 {r['mean_error_m']:.2f} m, p90 {r['p90_error_m']:.2f} m, "
+              f"지연 {r['latency_ms_mean']:.3f} ms (p99 {r['latency_ms_p99']:.3f} ms)")
+    print(f"✅ 평가 결과를 '{args.output}'에 저장했습니다. ({report['elapsed_s']:.1f}초)")
@@ -0,0 +1,126 @@
+#센서 이벤트 시각 기준 비동기 융합 파일.
+#BLE / IMU / 로봇 측정을 받은 스레드에서 시각을 찍어 넣으면, 짧은 재정렬 버퍼를 거쳐 시각 순서대로 융합 엔진(EKF 등)에 적용합니다.
+#이벤트 사이의 실제 경과 시간(dt)으로 예측하고, 재정렬 대기 시간보다 늦게 도착한 BLE 측정은 그 시각으로 되돌아가 다시 적용합니다.
+
+import time
+import heapq
+import threading
+from collections import deque
+
+
+class EventFusion:
+    """
+    이벤트 종류 (push(t, kind, *data)):
+      'yaw'      (yaw_deg,)                 - IMU 방향. 다음 이벤트까지 유지됩니다.
+      'speed'    (speed,)                   - IMU 속도. 다음 이벤트까지 유지됩니다.
+      'position' (z,)                       - 위치 측정 [x, y] (m) → engine.update(z)
+      'proba'    (proba, class_positions)   - 분류기 확률 → engine.update_proba(...) (ParticleFilter, GridHMM)
+      'robot'    (px, py)                   - 로봇 위치. 엔진에는 넣지 않고 시각 순서대로 self.robot에 기록합니다.
+      'correction' (dx, dy, cov_scale)      - 위치 직접 보정 → engine.shift(...) (EKF, main.py의 벽 회피)
+    엔진 상태를 바꾸는 것은 모두 이벤트로 넣어야 합니다. 밖에서 엔진을 직접 고치면 늦은 측정으로 되돌릴 때 사라집니다.
+    각 이벤트를 적용하기 전에 마지막 이벤트 시각부터 그 시각까지, 유지 중인 yaw/속도로 engine.predict(..., dt)를 부릅니다.
+    engine은 predict(yaw, speed, dt) / update / get_state / snapshot / restore를 제공해야 합니다 (EKF, ParticleFilter, GridHMM).
+    """
+    KINDS = ('yaw', 'speed', 'position', 'proba', 'robot', 'correction')
+
+    def __init__(self, engine, reorder_delay=0.15, history=3.0, max_dt=1.0, clock=time.monotonic):
+        self.engine = engine
+        self.reorder_delay = reorder_delay  # 이 시간만큼 기다렸다가 시각 순서로 처리합니다 (s)
+        self.history = history              # 늦은 측정을 되돌려 적용할 수 있는 기간 (s)
+        self.max_dt = max_dt                # 이벤트가 끊겼다 다시 올 때 한 번에 예측할 최대 시간 (s)
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._pending = []                  # (t, seq, kind, data) 힙
+        self._seq = 0
+        # 적용한 이벤트와 적용 직전 상태: (t, seq, kind, data, engine_snapshot, hold)
+        self._applied = deque()
+        self.t = None                       # 엔진 상태의 시각
+        self.yaw, self.speed = 0.0, 0.0
+        self.robot = None                   # (t, px, py)
+        self.stats = {'applied': 0, 'late': 0, 'rollbacks': 0, 'reapplied': 0, 'dropped': 0}
+
+    def push(self, t, kind, *data):
+        """센서 스레드에서 부릅니다. t는 측정을 받은 시각 (self.clock과 같은 기준, 보통 time.monotonic())."""
+        if kind not in self.KINDS:
+            raise ValueError(f"알 수 없는 이벤트 종류입니다: {kind}")
+        with self._lock:
+            heapq.heappush(self._pending, (t, self._seq, kind, data))
+            self._seq += 1
+
+    def _hold(self):
+        return self.t, self.yaw, self.speed, self.robot
+
+    def _apply(self, t, kind, data):
+        if self.t is not None and t > self.t:
+            self.engine.predict(self.yaw, self.speed, dt=min(t - self.t, self.max_dt))
+        if self.t is None or t > self.t:
+            self.t = t
+        if kind == 'yaw':
+            self.yaw = data[0]
+        elif kind == 'speed':
+            self.speed = data[0]
+        elif kind == 'position':
+            self.engine.update(data[0])
+        elif kind == 'proba':
+            self.engine.update_proba(*data)
+        elif kind == 'correction':
+            self.engine.shift(*data)
+        else:
+            self.robot = (t,) + tuple(data)
+
+    def _apply_recorded(self, event):
+        t, seq, kind, data = event
+        self._applied.append((t, seq, kind, data, self.engine.snapshot(), self._hold()))
+        self._apply(t, kind, data)
+
+    def _rollback(self, event):
+        """이미 적용한 이벤트보다 이른 이벤트: 그 시각 직전 상태로 되돌리고 늦은 이벤트부터 다시 차례로 적용합니다."""
+        key = event[:2]
+        applied = self._applied
+        if not applied or applied[0][:2] > key:
+            # 되돌릴 수 있는 기간(history)보다 오래된 측정은 버립니다.
+            self.stats['dropped'] += 1
+            return
+        # 늦은 이벤트보다 나중 이벤트들을 (보통 몇 개뿐이므로) 뒤에서부터 꺼냅니다.
+        later = []
+        while applied and applied[-1][:2] > key:
+            later.append(applied.pop())
+        later.reverse()
+        self.engine.restore(later[0][4])
+        self.t, self.yaw, self.speed, self.robot = later[0][5]
+        self.stats['rollbacks'] += 1
+        self.stats['reapplied'] += len(later)
+        self._apply_recorded(event)
+        for t, seq, kind, data, _, _ in later:
+            self._apply_recorded((t, seq, kind, data))
+
+    def process(self, now=None):
+        """
+        재정렬 대기 시간이 지난 이벤트를 시각 순서로 적용합니다. GUI 타이머 등에서 주기적으로 부릅니다.
+        반환: 이번에 적용한 이벤트 수 (0이면 엔진 상태가 바뀌지 않았습니다.)
+        """
+        now = self.clock() if now is None else now
+        ready = []
+        with self._lock:
+            while self._pending and self._pending[0][0] <= now - self.reorder_delay:
+                ready.append(heapq.heappop(self._pending))
+        for event in ready:
+            if self._applied and event[:2] < self._applied[-1][:2]:
+                self.stats['late'] += 1
+                self._rollback(event)
+            else:
+                self._apply_recorded(event)
+            self.stats['applied'] += 1
+        # 되돌리기에 필요한 기간만 남깁니다.
+        if self.t is not None:
+            while self._applied and self._applied[0][0] < self.t - self.history:
+                self._applied.popleft()
+        return len(ready)
+
+    def flush(self):
+        """대기 중인 이벤트를 모두 적용합니다 (종료나 오프라인 재생 끝에)."""
+        return self.process(float('inf'))
+
+    def get_state(self):
+        return self.engine.get_state()
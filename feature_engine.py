@@ -0,0 +1,250 @@
+#비콘별 RSSI 시계열 통계(평균, 표준편차, 최소/최대, 기울기, 경과 라운드)를 링 버퍼로 계산하는 피처 엔진 파일.
+
+import time
+from collections import deque
+
+import numpy as np
+
+from beacon_store import RecordStore
+
+
+class RollingWindow:
+    """
+    최근 size개 샘플의 링 버퍼. 합 / 제곱합 / (순번 x 값)의 합을 유지해 push마다 O(1)로 통계를 갱신합니다.
+    최소/최대는 단조 덱(분할 상환 O(1))으로 구합니다.
+    버퍼가 한 바퀴 돌 때마다 누적 합을 버퍼에서 다시 계산해 부동소수점 오차가 쌓이지 않게 합니다. (분할 상환 O(1))
+    """
+    __slots__ = ('size', '_buf', '_pos', 'n', '_count', '_sum', '_sumsq', '_sumix', '_min', '_max')
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f"창 크기는 1 이상이어야 합니다: {size}")
+        self.size = size
+        self._buf = np.zeros(size)
+        self.reset()
+
+    def reset(self):
+        self._pos = 0
+        self.n = 0
+        self._count = 0  # 지금까지 들어온 샘플 수 (기울기 계산의 시간 순번)
+        self._sum = self._sumsq = self._sumix = 0.0
+        self._min, self._max = deque(), deque()
+
+    def push(self, x):
+        i = self._count
+        if self.n == self.size:
+            old = self._buf[self._pos]
+            old_i = i - self.size
+            self._sum -= old
+            self._sumsq -= old * old
+            self._sumix -= old_i * old
+        else:
+            self.n += 1
+        self._buf[self._pos] = x
+        self._sum += x
+        self._sumsq += x * x
+        self._sumix += i * x
+        self._count += 1
+        self._pos += 1
+        if self._pos == self.size:
+            self._pos = 0
+            self._resync()
+
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((i, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((i, x))
+        oldest = i - self.n + 1
+        if self._min[0][0] < oldest:
+            self._min.popleft()
+        if self._max[0][0] < oldest:
+            self._max.popleft()
+
+    def _resync(self):
+        # 가득 찬 버퍼가 한 바퀴 돈 직후에는 _buf[0]이 가장 오래된 샘플입니다.
+        first = self._count - self.n
+        values = self._buf[:self.n]
+        self._sum = float(values.sum())
+        self._sumsq = float(values @ values)
+        self._sumix = float(np.arange(first, first + self.n) @ values)
+
+    @property
+    def mean(self):
+        return self._sum / self.n if self.n else RecordStore.MISSING_RSSI
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return 0.0
+        mean = self._sum / self.n
+        return float(np.sqrt(max(self._sumsq / self.n - mean * mean, 0.0)))
+
+    @property
+    def min(self):
+        return self._min[0][1] if self.n else RecordStore.MISSING_RSSI
+
+    @property
+    def max(self):
+        return self._max[0][1] if self.n else RecordStore.MISSING_RSSI
+
+    @property
+    def slope(self):
+        """샘플 순번에 대한 최소제곱 기울기 (dB / 샘플)"""
+        n = self.n
+        if n < 2:
+            return 0.0
+        first = self._count - n
+        sum_i = n * (2 * first + n - 1) / 2
+        # n * sum(i^2) - sum(i)^2 는 연속한 순번에서 시작점과 무관하게 n^2 (n^2 - 1) / 12 입니다.
+        return (n * self._sumix - sum_i * self._sum) / (n * n * (n * n - 1) / 12)
+
+
+class FeatureEngine:
+    """
+    BLE 스캔 '라운드'(비콘별 RSSI 스냅샷, 미수신 -100. calib.py가 레코드 하나를 만드는 단위)를 받아
+    비콘마다 windows 크기의 RollingWindow 통계를 유지합니다. 실시간 경로는 RoundAssembler가 콜백 값을 라운드로 묶습니다.
+    학습(_prepare_data)은 DB 레코드를 측정 지점별 수집 순서대로 다시 흘려 같은 push()/features()를 쓰므로
+    학습 피처와 실시간 피처가 같은 코드로 계산됩니다.
+
+    피처 열 (비콘 열 이름 c = MAC의 ':'를 '_'로 바꾼 것):
+      c              최근 RSSI (미수신 -100, 기존 스냅샷 피처와 같은 열)
+      c__mean{w} / c__std{w} / c__min{w} / c__max{w} / c__slope{w}   최근 w개 수신 샘플의 통계
+      c__age         마지막으로 수신된 뒤 지난 라운드 수 (한 번도 수신되지 않았으면 max_age)
+    """
+    STATS = ('mean', 'std', 'min', 'max', 'slope')
+
+    def __init__(self, beacon_macs, windows=(5, 20)):
+        self.beacon_macs = list(beacon_macs)
+        self.windows = sorted(set(int(w) for w in windows))
+        self.max_age = max(self.windows)
+        self._index = {mac: b for b, mac in enumerate(self.beacon_macs)}
+        self._windows = [[RollingWindow(w) for w in self.windows] for _ in self.beacon_macs]
+        self._last = np.full(len(self.beacon_macs), RecordStore.MISSING_RSSI, dtype=np.float64)
+        self._age = np.full(len(self.beacon_macs), self.max_age, dtype=np.int64)
+
+        self.feature_names = []
+        for mac in self.beacon_macs:
+            column = mac.replace(':', '_')
+            self.feature_names.append(column)
+            self.feature_names += [f"{column}__{stat}{w}" for w in self.windows for stat in self.STATS]
+            self.feature_names.append(f"{column}__age")
+        self._out = np.empty(len(self.feature_names))
+
+    def config(self):
+        """모델 파일에 함께 저장하는 설정. from_config()로 같은 엔진을 다시 만듭니다."""
+        return {'beacon_macs': self.beacon_macs, 'windows': self.windows}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['beacon_macs'], config['windows'])
+
+    def reset(self):
+        for windows in self._windows:
+            for window in windows:
+                window.reset()
+        self._last[:] = RecordStore.MISSING_RSSI
+        self._age[:] = self.max_age
+
+    def push(self, snapshot):
+        """라운드 하나(dict MAC->RSSI)를 반영합니다. 등록되지 않은 MAC과 'direction' 같은 키는 무시합니다."""
+        self._age += 1
+        np.minimum(self._age, self.max_age, out=self._age)
+        for mac, value in snapshot.items():
+            b = self._index.get(mac)
+            if b is None or value <= RecordStore.MISSING_RSSI:
+                continue
+            value = float(value)
+            self._last[b] = value
+            self._age[b] = 0
+            for window in self._windows[b]:
+                window.push(value)
+
+    def feature_vector(self, out=None):
+        """현재 피처를 feature_names 순서의 배열로 반환합니다. (기본: 재사용 버퍼)"""
+        out = self._out if out is None else out
+        j = 0
+        for b, windows in enumerate(self._windows):
+            out[j] = self._last[b]
+            j += 1
+            for window in windows:
+                out[j:j + 5] = (window.mean, window.std, window.min, window.max, window.slope)
+                j += 5
+            out[j] = self._age[b]
+            j += 1
+        return out
+
+    def features(self):
+        """현재 피처 dict (열 이름 -> 값). LGBM_Classifier_Predictor.predict()에 그대로 넘길 수 있습니다."""
+        return dict(zip(self.feature_names, self.feature_vector().tolist()))
+
+    def replay(self, store, rows):
+        """
+        저장소 레코드를 다시 흘려 레코드마다 그 시점의 피처 행을 만듭니다. (학습용)
+        (x, y, 방향)이 바뀌면 엔진을 초기화하므로 각 측정 지점은 수집을 막 시작한 실시간 상태부터 쌓입니다.
+        rows: 사용할 레코드 번호 (저장소 순서 = 수집 순서)
+        """
+        rssi, xy, direction = store.rssi, store.xy, store.direction_codes
+        columns = [store.registry.macs[c] for c in range(rssi.shape[1])]
+        X = np.empty((len(rows), len(self.feature_names)))
+        key = None
+        for n, r in enumerate(rows):
+            row_key = (xy[r, 0], xy[r, 1], direction[r])
+            if row_key != key:
+                self.reset()
+                key = row_key
+            self.push(dict(zip(columns, rssi[r].tolist())))
+            self.feature_vector(X[n])
+        return X
+
+
+class RoundAssembler:
+    """
+    실시간 BLE 콜백 값(dict MAC->RSSI, 보통 비콘 하나씩)을 스캔 라운드로 묶어 FeatureEngine에 넣습니다.
+    라운드는 등록된 비콘이 모두 수신되거나, 첫 값을 받은 뒤 timeout초가 지나면 닫힙니다.
+    닫을 때 못 받은 비콘은 MISSING_RSSI로 채우므로 engine.push()가 그 비콘을 건너뛰고 age를 올립니다.
+    (replay가 DB 레코드의 -100을 다루는 것과 같아, 비콘 하나가 끊겨도 실시간 피처가 계속 나오고 학습 피처와 같습니다.)
+    """
+
+    def __init__(self, engine, timeout=1.0, clock=time.monotonic):
+        self.engine = engine
+        self.timeout = timeout
+        self.clock = clock
+        self._beacons = set(engine.beacon_macs)
+        self._round = {}
+        self._started = None
+
+    def expired(self, now=None):
+        """열린 라운드가 timeout을 넘겼는지"""
+        now = self.clock() if now is None else now
+        return self._started is not None and now - self._started >= self.timeout
+
+    def _close(self):
+        self.engine.push({mac: self._round.get(mac, RecordStore.MISSING_RSSI) for mac in self.engine.beacon_macs})
+        self._round = {}
+        self._started = None
+
+    def add(self, rssi_vec, now=None):
+        """
+        값을 라운드에 넣습니다 (같은 라운드에서 다시 받은 비콘은 마지막 값). 빈 dict면 시간 초과만 확인합니다.
+        반환: 이번 호출로 라운드가 닫혔으면 엔진의 피처 dict, 아니면 None
+        """
+        now = self.clock() if now is None else now
+        closed = False
+        if self.expired(now):
+            self._close()
+            closed = True
+        values = {mac: v for mac, v in rssi_vec.items() if mac in self._beacons}
+        if values:
+            if self._started is None:
+                self._started = now
+            self._round.update(values)
+            if len(self._round) == len(self._beacons):
+                self._close()
+                closed = True
+        return self.engine.features() if closed else None
+
+    def reset(self):
+        self._round = {}
+        self._started = None
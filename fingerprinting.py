@@ -1,23 +1,262 @@
 #핑거프린팅 알고리즘 파일.
 
 import json
+import struct
+import threading
+import zlib
 import numpy as np
-from sklearn.neighbors import BallTree
 from collections import defaultdict
+from beacon_store import BeaconRegistry, CSRMatrix, RecordStore, SparseRecordStore
+from prediction_cache import PredictionCache
+from search_backends import HybridSearchEngine, SparseSearchEngine, make_search_engine
+
+# 바이너리 핑거프린트 DB(.fpdb) 형식
+#   [magic 4B][version uint16][header 길이 uint32][header JSON][0 패딩 (64B 정렬)]
+#   [RSSI 행렬 float32 (레코드 수 x 비콘 수)][위치 코드 int32 (레코드 수)]
+# header: 비콘 MAC 테이블, 위치/방향 테이블, 각 배열의 오프셋
+FPDB_MAGIC = b'FPDB'
+FPDB_VERSION = 1
+FPDB_ALIGN = 64
+_FPDB_PREFIX = struct.Struct('<4sHI')
+
+# 측정 방향별 yaw 중심각 (도). IMU yaw 규약: 0°=E, 90°=S, 180°=W, 270°=N
+HEADING_CENTERS = {'E': 0.0, 'S': 90.0, 'W': 180.0, 'N': 270.0}
+
+
+def direction_from_yaw(yaw):
+    """Yaw 각도를 N, E, S, W 방향으로 변환합니다. (각 방향 중심 ±45°)"""
+    yaw = yaw % 360
+    if 45 <= yaw < 135:
+        return 'S'
+    elif 135 <= yaw < 225:
+        return 'W'
+    elif 225 <= yaw < 315:
+        return 'N'
+    else: # 315 <= yaw or yaw < 45
+        return 'E'
+
+
+def headings_for_yaw(yaw, blend_margin=0.0):
+    """
+    yaw에 해당하는 방향 목록. 방향 경계(45°, 135°, ...)에서 blend_margin도 이내이면
+    경계 건너편의 인접 방향도 함께 반환합니다. 예: yaw=130, margin=10 → ['S', 'W']
+    """
+    primary = direction_from_yaw(yaw)
+    if blend_margin <= 0:
+        return [primary]
+    offset = (yaw - HEADING_CENTERS[primary] + 180) % 360 - 180  # 중심으로부터 -45 ~ 45
+    if 45 - abs(offset) < blend_margin:
+        return [primary, direction_from_yaw(HEADING_CENTERS[primary] + (90 if offset > 0 else -90))]
+    return [primary]
+
+
+def heading_weights(yaw):
+    """
+    yaw에 가장 가까운 두 방향과 각도 거리에 비례한 가중치 [(방향, 가중치), ...] (합 1).
+    방향 중심에서는 한 방향만 1.0이고, 경계(45°, 135°, ...)에서는 두 방향이 0.5씩입니다.
+    예: yaw=30 → [('E', 0.667), ('S', 0.333)]
+    """
+    yaw = yaw % 360
+    primary = direction_from_yaw(yaw)
+    offset = (yaw - HEADING_CENTERS[primary] + 180) % 360 - 180  # 중심으로부터 -45 ~ 45
+    if offset == 0:
+        return [(primary, 1.0)]
+    weight = 1.0 - abs(offset) / 90.0
+    neighbour = direction_from_yaw(HEADING_CENTERS[primary] + (90 if offset > 0 else -90))
+    return [(primary, weight), (neighbour, 1.0 - weight)]
+
+
+def _merge_top_k(idx_parts, dist_parts, k):
+    """여러 부분 검색 결과 (전체 인덱스, 거리)를 합쳐 거리순 top-k를 고릅니다. 먼저 온 부분이 동률에서 앞섭니다."""
+    if len(idx_parts) == 1:
+        return idx_parts[0][:, :k], dist_parts[0][:, :k]
+    idx = np.hstack(idx_parts)
+    dists = np.hstack(dist_parts)
+    order = np.argsort(dists, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(dists, order, axis=1)
+
+
+def _cell_sums(values, cells, n_cells):
+    """(N, D) 값을 셀 번호별로 더해 (셀 수, D) 배열로 만듭니다. (열 단위 bincount)"""
+    return np.stack([np.bincount(cells, weights=values[:, j], minlength=n_cells) for j in range(values.shape[1])], axis=1)
+
+
+def trimmed_cell_stats(matrix, cells, n_cells, covariance=None, trim_sigma=2.0, missing_rssi=-100.0):
+    """
+    여러 셀의 이상치 제거 평균을 한 번에 계산합니다.
+    셀 샘플이 3개 이상이면 비콘별로 (평균 ± trim_sigma x 표준편차) 밖의 값을 버리고 남은 값으로 평균을 냅니다.
+    matrix: (N, 비콘 수) RSSI, cells: (N,) 셀 번호 (0 ~ n_cells-1)
+    covariance: None, 'diag', 'full' - 이상치 제거 후 남은 값으로 분산/공분산도 계산합니다.
+    반환: (평균 (셀 수, 비콘 수), 셀별 샘플 수, 분산 (셀 수, 비콘 수) / 공분산 (셀 수, 비콘 수, 비콘 수) / None)
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    cells = np.asarray(cells, dtype=np.intp)
+    counts = np.bincount(cells, minlength=n_cells)
+    safe_counts = np.maximum(counts, 1)[:, np.newaxis]
+
+    mean = _cell_sums(matrix, cells, n_cells) / safe_counts
+    dev = matrix - mean[cells]
+    std = np.sqrt(_cell_sums(dev * dev, cells, n_cells) / safe_counts)
+    keep = np.abs(dev) <= trim_sigma * std[cells]
+    keep[counts[cells] < 3] = True
+
+    kept = _cell_sums(keep.astype(float), cells, n_cells)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        trimmed = _cell_sums(np.where(keep, matrix, 0.0), cells, n_cells) / kept
+    trimmed = np.where(kept > 0, trimmed, missing_rssi)
+
+    if covariance is None:
+        return trimmed, counts, None
+    dev = np.where(keep, matrix - trimmed[cells], 0.0)
+    if covariance == 'diag':
+        return trimmed, counts, _cell_sums(dev * dev, cells, n_cells) / np.maximum(kept, 1)
+    if covariance != 'full':
+        raise ValueError(f"지원하지 않는 공분산 형식입니다: {covariance}")
+    # 비콘 쌍마다 두 비콘 모두 남아 있는 샘플로 공분산을 계산합니다.
+    n_beacons = matrix.shape[1]
+    cov = np.empty((n_cells, n_beacons, n_beacons))
+    keep_f = keep.astype(float)
+    for i in range(n_beacons):
+        for j in range(i, n_beacons):
+            pair = np.stack([dev[:, i] * dev[:, j], keep_f[:, i] * keep_f[:, j]], axis=1)
+            sums = _cell_sums(pair, cells, n_cells)
+            cov[:, i, j] = cov[:, j, i] = sums[:, 0] / np.maximum(sums[:, 1], 1)
+    return trimmed, counts, cov
+
+
+class CellPrototypes:
+    """
+    (x, y, 방향) 셀마다 이상치 제거 평균 벡터와 대각/전체 공분산을 갖는 가우시안 프로토타입.
+    원시 샘플 대신 셀 수만큼만 비교하므로 셀당 샘플 수(약 50~100)배만큼 검색 비용이 줄고,
+    셀별 로그 우도를 그대로 HMM/파티클 필터 같은 후단 필터의 관측 모델로 쓸 수 있습니다.
+    """
+    # 분산 하한 (dB^2). 값이 거의 변하지 않는 비콘(미수신 -100 등)에서 우도가 발산하지 않도록 합니다.
+    VAR_FLOOR = 4.0
+
+    def __init__(self, rssi_matrix, cells, cell_xy, cell_directions=None, covariance='diag', var_floor=None):
+        self.covariance = covariance
+        self.var_floor = self.VAR_FLOOR if var_floor is None else var_floor
+        self.cell_xy = np.asarray(cell_xy, dtype=float)
+        self.cell_directions = cell_directions
+        n_cells = len(self.cell_xy)
+        self.means, self.counts, cov = trimmed_cell_stats(rssi_matrix, cells, n_cells, covariance)
+        n_beacons = self.means.shape[1]
+
+        if covariance == 'diag':
+            self.variances = np.maximum(cov, self.var_floor)
+            inv_var = 1.0 / self.variances
+            # log N(q; m, v) = sum(-0.5 q^2/v + q m/v) + const  → [q^2, q] 행렬곱 한 번으로 계산합니다.
+            self._quad_cols = np.vstack([(-0.5 * inv_var).T, (self.means * inv_var).T])
+            self._const = -0.5 * ((self.means ** 2) * inv_var + np.log(2 * np.pi * self.variances)).sum(axis=1)
+        else:
+            # 고윳값을 하한으로 잘라 양의 정부호로 만든 뒤 백색화(whitening) 행렬을 미리 계산합니다.
+            w, v = np.linalg.eigh(cov)
+            w = np.maximum(w, self.var_floor)
+            self.covariances = (v * w[:, np.newaxis, :]) @ np.transpose(v, (0, 2, 1))
+            self._whiten = np.transpose(v, (0, 2, 1)) / np.sqrt(w)[:, :, np.newaxis]
+            self._const = -0.5 * (n_beacons * np.log(2 * np.pi) + np.log(w).sum(axis=1))
+
+    def __len__(self):
+        return len(self.cell_xy)
+
+    @classmethod
+    def from_store(cls, store, covariance='diag', var_floor=None):
+        """RecordStore의 레코드를 (x, y, 방향) 셀로 묶어 프로토타입을 만듭니다."""
+        return cls.from_arrays(store.rssi, store.xy, store.direction_codes, store.direction_labels,
+                               covariance, var_floor)
+
+    @classmethod
+    def from_arrays(cls, rssi_matrix, xy, direction_codes, direction_labels, covariance='diag', var_floor=None):
+        """
+        저장소 배열(스냅샷)로 프로토타입을 만듭니다.
+        direction_codes: 레코드별 direction_labels 인덱스 (방향 없음: -1)
+        """
+        keys = np.column_stack([np.asarray(xy, dtype=np.int32), np.asarray(direction_codes, dtype=np.int32)])
+        cell_keys, cells = np.unique(keys, axis=0, return_inverse=True)
+        cell_directions = None
+        if (cell_keys[:, 2] >= 0).all():
+            cell_directions = np.array(direction_labels)[cell_keys[:, 2]]
+        return cls(rssi_matrix, cells.reshape(-1), cell_keys[:, :2], cell_directions, covariance, var_floor)
+
+    def log_likelihoods(self, samples):
+        """samples: (n, 비콘 수) RSSI → (n, 셀 수) 가우시안 로그 우도"""
+        samples = np.asarray(samples, dtype=float)
+        if self.covariance == 'diag':
+            return np.hstack([samples * samples, samples]) @ self._quad_cols + self._const
+        diff = samples[:, np.newaxis, :] - self.means[np.newaxis, :, :]
+        z = np.einsum('cij,ncj->nci', self._whiten, diff)
+        return -0.5 * (z * z).sum(axis=2) + self._const
+
+    def query(self, samples, k=1, cell_mask=None):
+        """로그 우도가 큰 순서로 top-k 셀 인덱스와 로그 우도를 반환합니다. cell_mask가 False인 셀은 제외합니다."""
+        neg = -self.log_likelihoods(samples)
+        if cell_mask is not None:
+            neg[:, ~cell_mask] = np.inf
+        idx, neg = HybridSearchEngine.top_k(neg, k)
+        return idx, -neg
+
 
 class FingerprintDB:
-    def __init__(self, grid_size=(1.0, 1.0), required_samples=100):
-        self.records = []
-        self.tree = None
+    # get_positions_batch 청크당 (샘플 x 레코드) 누적 배열 원소 수 상한. 캐시에 머물 정도로 작게 유지합니다.
+    BATCH_ELEMENT_BUDGET = 131_072
+    # 증분 모드에서 delta 버퍼가 max(merge_threshold, 색인된 레코드 수 x MERGE_RATIO)개를 넘으면 백그라운드 병합합니다.
+    # 병합 간격이 색인 크기에 비례해 늘어나므로 전체 재색인 비용이 측정 수에 대해 선형(상각)으로 유지됩니다.
+    MERGE_RATIO = 0.25
+    # yaw로 검색할 때 방향 경계에서 이 각도(도) 이내이면 인접 방향 파티션도 함께 검색합니다.
+    HEADING_BLEND_MARGIN = 10.0
+
+    def __init__(self, grid_size=(1.0, 1.0), required_samples=100, registry=None, incremental=False, merge_threshold=256,
+                 matching='hybrid', prototype_covariance='diag', search_backend=None, backend_options=None,
+                 sparse=False):
+        self.registry = registry if registry is not None else BeaconRegistry()
+        # 희소 모드: 비콘이 수백 개인 배치용. 수신된 비콘만 CSR로 저장하고 기본 검색 백엔드도 'sparse'가 됩니다.
+        self.sparse = sparse
+        self._store_cls = SparseRecordStore if sparse else RecordStore
+        self.store = self._store_cls(self.registry)  # 레코드 원본 (float32/int16 배열 또는 CSR)
+        self.engine = None
+        self.heading_engines = {}  # 방향 레이블 → (전체 행 인덱스, 해당 방향 레코드만의 검색 엔진)
         self.rssi_matrix = None
         self.normalized_matrix = None
         self.norms = None
-        self.positions = None
+        self.positions = None   # 좌표 (x, y) 실수 배열
+        self.directions = None  # 방향 레이블 배열 (4방향 DB가 아니면 None)
         self.macs = []
         self.grid_size = grid_size
         self._acc_buffer = defaultdict(list) # defaultdict: 없는 키에 접근하면 자동으로 value 생성.
         self.required_samples = required_samples
 
+        # 증분 색인 상태: 저장소의 [0, _indexed_size) 행은 engine, 나머지 행은 delta 버퍼로 검색합니다.
+        self.incremental = incremental
+        self.merge_threshold = merge_threshold
+        self._indexed_size = 0
+        self._delta_cache = None  # (시작 행, 끝 행, delta 검색 엔진)
+        self._index_lock = threading.Lock()
+        self._merge_thread = None
+
+        # 매칭 방식: 'hybrid'(원시 샘플 top-k) 또는 'prototype'(셀별 가우시안 로그 우도)
+        self.matching = matching
+        self.prototype_covariance = prototype_covariance
+        self.prototypes = None
+        self.dense_map = None  # 고밀도 가상 핑거프린트 (use_dense_map 참고)
+
+        # 검색 백엔드: 'exact'(정확 top-k), 'ivf'(근사 top-k, backend_options={'nprobe': ..., 'n_lists': ...})
+        #             또는 'sparse'(CSR 역색인 정확 top-k)
+        self.search_backend = search_backend or ('sparse' if sparse else 'exact')
+        self.backend_options = dict(backend_options or {})
+
+        # get_position 예측 캐시 (enable_cache 참고). 색인을 새로 만들 때마다 index_version이 올라가 캐시가 비워집니다.
+        self.cache = None
+        self.index_version = 0
+
+    @property
+    def records(self):
+        """기존 코드 호환용 dict 레코드 리스트 (매번 저장소에서 새로 만듭니다)."""
+        return self.store.to_records()
+
+    @records.setter
+    def records(self, records):
+        self.store = self._store_cls.from_records(records, self.registry)
+
     def _average_rssi(self, rssi_list):
         if not rssi_list:
             return {}
@@ -27,23 +266,22 @@ class FingerprintDB:
             for j, mac in enumerate(macs):
                 if mac in r:
                     M[i, j] = r[mac]
-        if M.shape[0] >= 3:
-            mean = np.mean(M, axis=0)
-            std = np.std(M, axis=0)
-            mask = np.abs(M - mean) <= 2 * std
-            M = np.where(mask, M, np.nan)
-        col_mean = np.nanmean(M, axis=0)
-        col_mean = np.where(np.isnan(col_mean), -100.0, col_mean)
+        # 한 위치를 셀 하나로 보고 프로토타입과 같은 이상치 제거(평균 ± 2σ) 규칙을 적용합니다.
+        col_mean = trimmed_cell_stats(M, np.zeros(len(M), dtype=np.intp), 1)[0][0]
         return {mac: float(col_mean[j]) for j, mac in enumerate(macs)}
 
     def collect(self, pos, rssi_vector):
         pos_key = tuple(pos) if isinstance(pos, (list, tuple)) else (pos,)
-        
-        # 1. 평균을 내지 않고, 들어온 데이터를 바로 records에 추가합니다.
-        self.records.append({'pos': list(pos_key), 'rssi': rssi_vector.copy()})
+
+        # 1. 평균을 내지 않고, 들어온 데이터를 바로 저장소에 추가합니다.
+        self.store.append(pos_key, rssi_vector)
         
         # 2. 샘플 개수를 세기 위한 로직은 그대로 유지합니다. (캘리브레이션 제어를 위해 필요)
         self._acc_buffer[pos_key].append(1) # 실제 데이터 대신 카운트용 숫자만 넣어도 됩니다.
+
+        if self.incremental:
+            # 증분 모드: 새 샘플은 delta 버퍼로 바로 검색 가능하고, 쌓이면 백그라운드에서 병합됩니다.
+            self._update_incremental_index()
         
         if len(self._acc_buffer[pos_key]) >= self.required_samples:
             # 3. 목표 개수에 도달하면 버퍼를 비우고 True를 반환합니다.
@@ -52,85 +290,587 @@ class FingerprintDB:
             
         return False
 
-    def build_index(self):
-        if not self.records:
+    def build_index(self, index_state=None):
+        """index_state: load_index_state()로 읽은 저장된 색인 상태 (있으면 근사 색인 학습을 건너뜁니다)"""
+        if self.dense_map is not None:
+            # 고밀도 맵 모드: 측정 레코드 대신 가상 핑거프린트를 색인합니다.
+            self.rssi_matrix = self.dense_map.matrix_for(self.registry)
+            self.macs = list(self.registry.macs)
+            self.positions = self.dense_map.points
+            self.directions = self.dense_map.directions
+            self._index_matrix(index_state)
+            return
+        if len(self.store) == 0:
             raise RuntimeError("No records to index")
-        mac_set = set() # 중복된 mac 주소를 제거하기 위한 집합
-        for rec in self.records:
-            mac_set.update(rec['rssi'].keys()) # 딕셔너리의 모든 키 (mac 주소)를 추가.
-        self.macs = sorted(mac_set)
-        self.rssi_matrix = np.array(
-            [[rec['rssi'].get(mac, -100) for mac in self.macs] for rec in self.records]
-            
-        )
+        # 열 순서는 레지스트리의 비콘 ID 순서입니다. (MAC 문자열 정렬/해싱 없음)
+        self.macs = list(self.registry.macs)
+        self.rssi_matrix = self.store.csr() if self.sparse else self.store.rssi
         '''
-        self.records = 
-        [
-            {'rssi': {'A': -70, 'B': -80}}, 
-            {'rssi': {'B': -65, 'C': -90}}, 
-        ] 
-        위에서 아래로 저장.
-        self.rssi_matrix = 
+        레코드 {'rssi': {'A': -70, 'B': -80}}, {'rssi': {'B': -65, 'C': -90}} 를 차례로 추가하면
+        registry: A→0, B→1, C→2 로 인터닝되고 저장소 배열은 위에서 아래로 채워집니다.
+        self.rssi_matrix =
         [
             [-70, -80, -100],  # 첫 rec: A=-70, B=-80, C 없음 → -100
             [-100, -65, -90]   # 두 번째 rec: A 없음 → -100, B=-65, C=-90
         ]
         
         '''
-        self.positions = np.array([rec['pos'] for rec in self.records])
-        self.norms = np.linalg.norm(self.rssi_matrix, axis=1)
-        norm_matrix = self.norms[:, np.newaxis]
-        norm_matrix[norm_matrix == 0] = 1
-        self.normalized_matrix = self.rssi_matrix / norm_matrix
-        self.tree = BallTree(self.normalized_matrix, metric='euclidean')
+        self.positions = self.store.xy.astype(float)
+        self.directions = self.store.directions()
+        self._index_matrix(index_state)
+
+    def _index_matrix(self, index_state=None):
+        """현재 rssi_matrix / directions로 검색 엔진과 방향별 파티션을 만들고 교체합니다."""
+        index_state = index_state or {}
+        heading_engines = self._build_heading_engines(self.rssi_matrix, self.directions, index_state.get('heading'))
+        prototypes = None
+        if self.matching == 'prototype':
+            prototypes = CellPrototypes.from_store(self.store, self.prototype_covariance)
+        with self._index_lock:
+            self._build_engine(index_state.get('main'))
+            self.heading_engines = heading_engines
+            self._indexed_size = len(self.rssi_matrix)
+            self._delta_cache = None
+            if prototypes is not None:
+                self.prototypes = prototypes
+            self.index_version += 1
+
+    def use_dense_map(self, dense):
+        """
+        측정 레코드 대신 고밀도 가상 핑거프린트(densify.DenseRadioMap 또는 저장된 .npz 경로)로 색인합니다.
+        가상 맵은 원본 DB 전체에서 한 번에 만들어지므로 증분 모드는 꺼집니다. None을 주면 측정 레코드로 돌아갑니다.
+        """
+        if isinstance(dense, str):
+            from densify import DenseRadioMap
+            dense = DenseRadioMap.load(dense)
+        self.wait_for_merge()
+        self.dense_map = dense
+        if dense is not None:
+            self.incremental = False
+        self.build_index()
+
+    def build_prototypes(self, covariance=None):
+        """저장소 전체를 (x, y, 방향) 셀별 가우시안 프로토타입으로 압축합니다."""
+        if covariance is not None:
+            self.prototype_covariance = covariance
+        self.prototypes = CellPrototypes.from_store(self.store, self.prototype_covariance)
+        return self.prototypes
+
+    def _make_engine(self, rssi_matrix, state=None):
+        return make_search_engine(self.search_backend, rssi_matrix, state, **self.backend_options)
+
+    def _build_engine(self, state=None):
+        self.engine = self._make_engine(self.rssi_matrix, state)
+        self.norms = self.engine.norms
+        self.normalized_matrix = self.engine.normalized_matrix
+
+    def _build_heading_engines(self, rssi_matrix, directions, states=None):
+        """측정 방향별로 레코드를 나눠 파티션마다 검색 엔진을 만듭니다. (방향 정보가 없으면 빈 dict)"""
+        if directions is None:
+            return {}
+        states = states or {}
+        heading_engines = {}
+        for label in np.unique(directions):
+            rows = np.flatnonzero(directions == label)
+            heading_engines[str(label)] = (rows, self._make_engine(rssi_matrix[rows], states.get(str(label))))
+        return heading_engines
+
+    # --- 검색 색인 영속화 ---
+    def _persists_index(self):
+        """학습된 색인 상태가 있는 백엔드인지 (exact / sparse는 행렬에서 바로 다시 만듭니다)."""
+        return self.search_backend not in ('exact', 'sparse')
+
+    def index_path(self, db_path):
+        """DB 파일 옆에 저장되는 검색 색인 파일 경로 (예: fingerprint_db_4dir.json.ivf.npz)"""
+        return f"{db_path}.{self.search_backend}.npz"
+
+    def _matrix_checksum(self):
+        # load_index_state()와 같은 값이 되도록 희소 행렬도 조밀 행렬 기준으로 계산합니다.
+        rssi = self.rssi_matrix.toarray() if isinstance(self.rssi_matrix, CSRMatrix) else self.rssi_matrix
+        return zlib.crc32(np.ascontiguousarray(rssi).tobytes())
+
+    def save_index(self, path):
+        """메인 엔진과 방향별 파티션 엔진의 색인 상태를 .npz 하나로 저장합니다."""
+        arrays = {'backend': np.array(self.search_backend), 'n_records': np.array(len(self.rssi_matrix)),
+                  'checksum': np.array(self._matrix_checksum())}
+        for key, value in self.engine.state().items():
+            arrays[f"main/{key}"] = value
+        for label, (_, engine) in self.heading_engines.items():
+            for key, value in engine.state().items():
+                arrays[f"heading/{label}/{key}"] = value
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def load_index_state(self, path):
+        """
+        저장된 색인 상태를 읽습니다. 파일이 없거나 백엔드/레코드가 현재 DB와 다르면 None을 반환합니다.
+        build_index() 전에 호출하므로 저장소(또는 고밀도 맵)의 행렬로 검사합니다.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = dict(data)
+        except FileNotFoundError:
+            return None
+        rssi = self.store.rssi if self.dense_map is None else self.dense_map.matrix_for(self.registry)
+        if (str(arrays.pop('backend')) != self.search_backend or int(arrays.pop('n_records')) != len(rssi)
+                or int(arrays.pop('checksum')) != zlib.crc32(np.ascontiguousarray(rssi).tobytes())):
+            print(f"'{path}' 색인이 현재 DB와 맞지 않아 새로 만듭니다.")
+            return None
+        state = {'main': {}, 'heading': defaultdict(dict)}
+        for key, value in arrays.items():
+            parts = key.split('/')
+            if parts[0] == 'main':
+                state['main'][parts[1]] = value
+            else:
+                state['heading'][parts[1]][parts[2]] = value
+        return state
+
+    def _resolve_headings(self, heading=None, yaw=None, blend_margin=None):
+        """heading(방향 레이블) 또는 yaw(도)로부터 검색할 방향 튜플을 정합니다. 제한이 없으면 None."""
+        if heading is not None:
+            headings = (heading,)
+        elif yaw is not None:
+            margin = self.HEADING_BLEND_MARGIN if blend_margin is None else blend_margin
+            headings = tuple(headings_for_yaw(yaw, margin))
+        else:
+            return None
+        known = self.heading_engines
+        if not known:
+            return None  # 방향 정보가 없는 DB: 전체를 검색합니다.
+        unknown = [h for h in headings if h not in known]
+        if unknown:
+            raise ValueError(f"DB에 없는 방향입니다: {unknown} (가능한 방향: {sorted(known)})")
+        return headings
+
+    # --- 증분 색인 ---
+    def _update_incremental_index(self):
+        if self.engine is None or len(self.registry) != len(self.macs):
+            # 첫 색인이거나 새 비콘이 나타나 열 구성이 바뀐 경우에는 동기적으로 전체 재색인합니다.
+            self.wait_for_merge()
+            self.build_index()
+            return
+        pending = len(self.store) - self._indexed_size
+        if pending >= max(self.merge_threshold, int(self._indexed_size * self.MERGE_RATIO)) and not self.is_merging():
+            self._start_merge()
+
+    def is_merging(self):
+        return self._merge_thread is not None and self._merge_thread.is_alive()
+
+    def wait_for_merge(self):
+        """진행 중인 백그라운드 병합이 끝날 때까지 기다립니다."""
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+            self._merge_thread = None
+
+    def _start_merge(self):
+        # 저장소 배열의 view를 스냅샷으로 넘깁니다. 이미 쓰인 행은 바뀌지 않고, 저장소가 커지며
+        # 배열을 재할당해도 기존 view는 이전 버퍼를 그대로 가리키므로 스레드에서 안전하게 읽을 수 있습니다.
+        # 희소 저장소의 CSR 배열도 앞부분은 바뀌지 않으므로 같은 방식으로 안전합니다.
+        stop = len(self.store)
+        rssi_matrix = self.store.csr() if self.sparse else self.store.rssi[:stop]
+        # 방향 레이블 목록은 뒤에만 추가되므로 복사본의 앞부분이 스냅샷의 방향 코드와 일치합니다.
+        snapshot = (rssi_matrix, self.store.xy[:stop], self.store.directions(),
+                    self.store.direction_codes[:stop], list(self.store.direction_labels))
+        self._merge_thread = threading.Thread(target=self._merge, args=snapshot, daemon=True)
+        self._merge_thread.start()
+
+    def _merge(self, rssi_matrix, xy, directions, direction_codes, direction_labels):
+        engine = self._make_engine(rssi_matrix)
+        heading_engines = self._build_heading_engines(rssi_matrix, directions)
+        positions = xy.astype(float)
+        prototypes = None
+        if self.matching == 'prototype':
+            # collect()가 계속 추가하는 self.store 대신 스냅샷으로 만들어야 배열 길이가 맞습니다.
+            dense = rssi_matrix.toarray() if self.sparse else rssi_matrix
+            prototypes = CellPrototypes.from_arrays(dense, xy, direction_codes, direction_labels,
+                                                    self.prototype_covariance)
+        with self._index_lock:
+            # 그 사이 동기 재색인이 더 최신 색인을 만들었다면 버립니다.
+            if len(rssi_matrix) <= self._indexed_size or rssi_matrix.shape[1] != len(self.macs):
+                return
+            self.engine, self.rssi_matrix = engine, rssi_matrix
+            self.heading_engines = heading_engines
+            self.positions, self.directions = positions, directions
+            self.norms, self.normalized_matrix = engine.norms, engine.normalized_matrix
+            self._indexed_size = len(rssi_matrix)
+            self._delta_cache = None
+            if prototypes is not None:
+                self.prototypes = prototypes
+            self.index_version += 1
+
+    def _delta_engine(self, start):
+        """저장소의 start 행 이후(아직 병합되지 않은 샘플)에 대한 brute-force 검색 엔진."""
+        stop = len(self.store)
+        if stop <= start:
+            return None
+        cache = self._delta_cache
+        if cache is None or cache[:2] != (start, stop):
+            if self.sparse:
+                delta = SparseSearchEngine(self.store.csr()[start:stop])
+            else:
+                # delta 버퍼는 샘플이 들어올 때마다 다시 만들므로 가지치기용 군집 없이 전체 거리로 계산합니다.
+                delta = HybridSearchEngine(self.store.rssi[start:stop], prune=False)
+            cache = (start, stop, delta)
+            self._delta_cache = cache
+        return cache[2]
+
+    def _search(self, matrix, k, alpha, beta, strong_threshold, headings=None):
+        """
+        메인 색인과 delta 버퍼를 함께 검색해 전체 레코드 기준 top-k (인덱스, 거리)를 반환합니다.
+        headings가 주어지면 해당 방향 파티션만 검색합니다.
+        """
+        with self._index_lock:
+            engine, n_indexed, heading_engines = self.engine, self._indexed_size, self.heading_engines
+        if headings is None:
+            idx, dists = engine.query(matrix, k, alpha, beta, strong_threshold)
+            idx_parts, dist_parts = [idx], [dists]
+        else:
+            idx_parts, dist_parts = [], []
+            for heading in headings:
+                rows, heading_engine = heading_engines[heading]
+                part_idx, part_dists = heading_engine.query(matrix, k, alpha, beta, strong_threshold)
+                idx_parts.append(rows[part_idx])
+                dist_parts.append(part_dists)
+
+        delta = self._delta_engine(n_indexed) if self.incremental else None
+        if delta is not None:
+            if headings is None:
+                delta_idx, delta_dists = delta.query(matrix, k, alpha, beta, strong_threshold)
+            else:
+                # delta 버퍼는 작으므로 전체 거리를 구한 뒤 다른 방향 레코드를 제외합니다.
+                hybrid = delta.distances(matrix, alpha, beta, strong_threshold)
+                labels = np.array(self.store.direction_labels + [None], dtype=object)
+                delta_dirs = labels[self.store.direction_codes[n_indexed:n_indexed + len(delta)]]
+                hybrid[:, ~np.isin(delta_dirs, headings)] = np.inf
+                delta_idx, delta_dists = HybridSearchEngine.top_k(hybrid, k)
+            # 거리가 같으면 인덱스가 작은 쪽(메인 색인)이 앞에 오도록 합니다. (전체 재색인 결과와 동일)
+            idx_parts.append(delta_idx + n_indexed)
+            dist_parts.append(delta_dists)
+        return _merge_top_k(idx_parts, dist_parts, k)
+
+    def _lookup_positions(self, idx):
+        positions = self.positions
+        if idx.size and idx.max() >= len(positions):
+            # delta 버퍼의 레코드는 아직 positions에 없으므로 저장소 좌표를 직접 읽습니다.
+            return self.store.xy[idx].astype(float)
+        return positions[idx]
+
+    def indexed_record_count(self):
+        """검색 가능한 전체 레코드 수 (증분 모드에서는 delta 버퍼 포함, 프로토타입 모드에서는 셀 수)."""
+        if self.matching == 'prototype':
+            return len(self.prototypes)
+        return len(self.store) if self.incremental else len(self.engine)
+
+    def to_records(self):
+        """저장소의 레코드를 JSON 형식의 레코드 리스트로 변환합니다."""
+        return self.store.to_records()
 
     def save(self, path="fingerprint_db.json"):
-        with open(path, 'w') as f:
-            json.dump(self.records, f, indent=4, ensure_ascii=False)
+        if path.endswith('.fpdb'):
+            self.save_binary(path)
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.to_records(), f, indent=4, ensure_ascii=False)
+        # 근사 검색 백엔드는 학습한 색인을 DB 옆에 함께 저장합니다.
+        if self._persists_index() and self.engine is not None and self.dense_map is None:
+            if self._indexed_size != len(self.store):
+                self.build_index()
+            self.save_index(self.index_path(path))
 
     def load(self, path="fingerprint_db.json"):
-        with open(path, 'r') as f:
-            self.records = json.load(f)
-        self.build_index()
+        self.store = read_record_store(path, self.registry, self.sparse)
+        index_state = None
+        if self._persists_index() and self.dense_map is None:
+            index_state = self.load_index_state(self.index_path(path))
+        self.build_index(index_state)
+
+    def save_binary(self, path="fingerprint_db.fpdb"):
+        """RSSI 행렬과 위치 코드를 열(column) 단위 바이너리(.fpdb)로 저장합니다."""
+        write_fpdb(self.store, path)
+
+    def load_binary(self, path="fingerprint_db.fpdb"):
+        """바이너리 DB를 np.memmap으로 열어 JSON 파싱 없이 바로 색인합니다."""
+        self.store = read_fpdb(path, self.registry)
+        if self.sparse:
+            self.store = SparseRecordStore.from_dense(self.store)
+        index_state = None
+        if self._persists_index():
+            index_state = self.load_index_state(self.index_path(path))
+        self.build_index(index_state)
+
+    def _to_matrix(self, samples):
+        """
+        dict 리스트 또는 (N, 비콘 수) 배열을 self.macs 순서의 RSSI 행렬로 변환합니다.
+        'sparse' 백엔드에서는 dict 샘플을 수신된 비콘만 담은 CSRMatrix로 바로 만듭니다. (조밀 행렬을 거치지 않음)
+        """
+        if isinstance(samples, CSRMatrix):
+            return samples
+        if isinstance(samples, np.ndarray):
+            matrix = np.asarray(samples, dtype=float)
+            if matrix.ndim == 1:
+                matrix = matrix[np.newaxis, :]
+            if matrix.shape[1] != len(self.macs):
+                raise ValueError(f"RSSI 배열의 열 수({matrix.shape[1]})가 비콘 수({len(self.macs)})와 다릅니다.")
+            return matrix
+        mac_index = {mac: j for j, mac in enumerate(self.macs)}
+        if self.search_backend == 'sparse':
+            return self._to_csr(samples, mac_index)
+        matrix = np.full((len(samples), len(self.macs)), -100.0)
+        for i, rssi_vector in enumerate(samples):
+            for mac, rssi in rssi_vector.items():
+                j = mac_index.get(mac)
+                if j is not None:
+                    matrix[i, j] = rssi
+        return matrix
+
+    def _to_csr(self, samples, mac_index):
+        indptr, indices, values = [0], [], []
+        for rssi_vector in samples:
+            row = sorted((mac_index[mac], rssi) for mac, rssi in rssi_vector.items() if mac in mac_index)
+            indices.extend(j for j, _ in row)
+            values.extend(rssi for _, rssi in row)
+            indptr.append(len(indices))
+        return CSRMatrix(indptr, indices, values, len(self.macs), self.store.MISSING_RSSI)
 
-    def get_position(self, rssi_vector, k=1, alpha=0.6, beta=0.8, strong_threshold=-70):
+    def _locate(self, matrix, k, alpha, beta, strong_threshold, headings=None):
+        """RSSI 행렬의 각 행에 대해 top-k 후보와 가중평균 위치를 계산합니다."""
+        if self.matching == 'prototype':
+            return self._locate_prototypes(matrix, k, headings)
+        idx, dists = self._search(matrix, k, alpha, beta, strong_threshold, headings)
+        pts = self._lookup_positions(idx)
+        weights = 1.0 / (dists + 1e-5)
+        ble_pos = (pts * weights[:, :, np.newaxis]).sum(axis=1) / weights.sum(axis=1)[:, np.newaxis]
+        return ble_pos, idx, dists
+
+    def _locate_prototypes(self, matrix, k, headings=None):
+        """프로토타입 모드: 로그 우도 top-k 셀과 사후확률(softmax) 가중평균 위치. 세 번째 값은 로그 우도입니다."""
+        cell_mask = None
+        if headings is not None:
+            cell_mask = np.isin(self.prototypes.cell_directions, headings)
+        if isinstance(matrix, CSRMatrix):
+            matrix = matrix.toarray()
+        idx, loglik = self.prototypes.query(matrix, k, cell_mask)
+        pts = self.prototypes.cell_xy[idx]
+        weights = np.exp(loglik - loglik[:, :1])
+        ble_pos = (pts * weights[:, :, np.newaxis]).sum(axis=1) / weights.sum(axis=1)[:, np.newaxis]
+        return ble_pos, idx, loglik
+
+    def get_cell_likelihoods(self, samples):
+        """
+        셀별 가우시안 로그 우도. (HMM/파티클 필터 등 후단 필터의 관측 모델용)
+        samples: dict MAC->RSSI 하나, dict 리스트 또는 (N, 비콘 수) 배열
+        반환: (로그 우도 (N, 셀 수), 셀 좌표 (셀 수, 2), 셀 방향 (셀 수,) 또는 None)
+        """
+        if self.prototypes is None:
+            self.build_prototypes()
+        matrix = self._to_matrix([samples] if isinstance(samples, dict) else samples)
+        if isinstance(matrix, CSRMatrix):
+            matrix = matrix.toarray()
+        return self.prototypes.log_likelihoods(matrix), self.prototypes.cell_xy, self.prototypes.cell_directions
+
+    def get_position(self, rssi_vector, k=1, alpha=0.6, beta=0.8, strong_threshold=-70,
+                     heading=None, yaw=None, blend_margin=None):
             """
             rssi_vector: dict MAC->RSSI
             k: top-k 후보 개수
             alpha: cosine vs norm_diff 비중 (0.0~1.0)
             beta: weighted L1 비중 (0.0~1.0)
             strong_threshold: '강신호'로 간주할 RSSI 임계치 (dBm)
+            heading: 측정 방향 레이블('N', 'E', 'S', 'W'). 주어지면 해당 방향 레코드만 검색합니다.
+            yaw: heading 대신 yaw 각도(도). 방향 경계에서 blend_margin도 이내이면 인접 방향도 함께 검색합니다.
+            프로토타입 모드에서는 (위치, 후보 셀 좌표, 로그 우도)를 반환하며 alpha/beta/strong_threshold는 쓰이지 않습니다.
             """
-            if self.tree is None:
+            if self.engine is None:
                 raise RuntimeError("FingerprintDB not indexed. Call load() or build_index() first.")
 
-            # 1) raw 샘플 벡터
-            raw = np.array([rssi_vector.get(mac, -100) for mac in self.macs])
-            norm_raw = np.linalg.norm(raw) or 1.0
-            sample_normed = (raw / norm_raw).reshape(1, -1)
+            headings = self._resolve_headings(heading, yaw, blend_margin)
+            if self.cache is not None:
+                key = self.cache.make_key(rssi_vector, (headings, k, alpha, beta, strong_threshold))
+                result = self.cache.get_or_compute(key, self._cache_version(), lambda: self._position(
+                    rssi_vector, k, alpha, beta, strong_threshold, headings))
+                return tuple(np.copy(value) for value in result)
+            return self._position(rssi_vector, k, alpha, beta, strong_threshold, headings)
+
+    def _position(self, rssi_vector, k, alpha, beta, strong_threshold, headings):
+        # 1) raw 샘플 벡터 ('sparse' 백엔드에서는 수신된 비콘만 담은 CSR 한 행)
+        if self.search_backend == 'sparse':
+            raw = self._to_matrix([rssi_vector])
+        else:
+            raw = np.array([rssi_vector.get(mac, -100) for mac in self.macs], dtype=float)[np.newaxis, :]
+
+        # 2) hybrid 거리 계산 + top-k 부분 선택 + 가중평균
+        ble_pos, idx, dists = self._locate(raw, k, alpha, beta, strong_threshold, headings)
+
+        if self.matching == 'prototype':
+            return ble_pos[0], self.prototypes.cell_xy[idx[0]], dists[0]
+        return ble_pos[0], self._lookup_positions(idx[0]), dists[0]
+
+    def enable_cache(self, step_db=1.0, max_size=512):
+        """
+        get_position() 앞에 양자화 입력 LRU 캐시를 둡니다. (prediction_cache.PredictionCache)
+        키에는 검색 방향과 k/alpha/beta/strong_threshold도 들어가고, 색인을 다시 만들면(증분 모드에서는
+        새 샘플이 추가되어도) 캐시가 자동으로 비워집니다. max_size가 0 이하이면 캐시를 끕니다.
+        """
+        self.cache = PredictionCache(step_db, max_size) if max_size > 0 else None
+        return self.cache
+
+    def _cache_version(self):
+        # 증분 모드에서는 delta 버퍼에 들어온 샘플도 바로 검색되므로 레코드 수도 버전에 포함합니다.
+        return (self.index_version, len(self.store)) if self.incremental else self.index_version
+
+    def get_positions_batch(self, samples, k=1, alpha=0.6, beta=0.8, strong_threshold=-70, chunk_size=None,
+                            heading=None, yaw=None, blend_margin=None):
+        """
+        여러 RSSI 샘플을 한 번에 측위합니다. (오프라인 평가, 로그 재생, 다중 키오스크용)
+        samples: (N, 비콘 수) 배열 (열 순서는 self.macs) 또는 dict MAC->RSSI 리스트
+        heading / yaw: 전체 샘플에 공통인 값 하나 또는 샘플별 값 배열 (get_position 참고)
+        chunk_size: 한 번에 계산할 샘플 수. None이면 BATCH_ELEMENT_BUDGET에 맞춰 자동 결정.
+        반환: (위치 (N, 2), 이웃 인덱스 (N, k), hybrid 거리 (N, k))
+              프로토타입 모드에서는 (위치, 셀 인덱스, 로그 우도)
+        """
+        if self.engine is None:
+            raise RuntimeError("FingerprintDB not indexed. Call load() or build_index() first.")
+
+        matrix = self._to_matrix(samples)
+        n_samples = matrix.shape[0]
+        n_records = self.indexed_record_count()
+        k = max(1, min(k, n_records))
+        if chunk_size is None:
+            per_query = getattr(self.engine, 'candidates_per_query', n_records) if self.matching != 'prototype' else n_records
+            chunk_size = max(1, self.BATCH_ELEMENT_BUDGET // max(per_query, 1))
+            # 마지막 조각만 작게 남지 않도록 같은 크기로 나눕니다.
+            chunk_size = -(-max(n_samples, 1) // -(-max(n_samples, 1) // chunk_size))
+
+        # 샘플별 검색 방향을 정하고 같은 방향 조합끼리 묶어 처리합니다.
+        per_sample = np.ndim(heading) > 0 or np.ndim(yaw) > 0
+        if per_sample:
+            headings = [self._resolve_headings(None if heading is None else heading[i],
+                                               None if yaw is None else yaw[i], blend_margin)
+                        for i in range(n_samples)]
+            groups = defaultdict(list)
+            for i, h in enumerate(headings):
+                groups[h].append(i)
+            groups = [(h, np.array(rows)) for h, rows in groups.items()]
+        else:
+            groups = [(self._resolve_headings(heading, yaw, blend_margin), None)]
+
+        ble_pos = np.empty((n_samples, self.positions.shape[1]))
+        idx = np.empty((n_samples, k), dtype=np.intp)
+        dists = np.empty((n_samples, k), dtype=float if self.matching == 'prototype' else self.engine.dtype)
+        for headings, rows in groups:
+            group = np.arange(n_samples) if rows is None else rows
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+                ble_pos[chunk], idx[chunk], dists[chunk] = self._locate(
+                    matrix[chunk], k, alpha, beta, strong_threshold, headings
+                )
+        return ble_pos, idx, dists
+
+
+def write_fpdb(store, path):
+    """RecordStore를 바이너리(.fpdb)로 저장합니다."""
+    rssi = store.rssi
+    n_records, n_beacons = rssi.shape
+
+    # 위치/방향 테이블과 레코드별 위치 코드
+    keys = np.column_stack([store.xy.astype(np.int32), store.direction_codes.astype(np.int32)])
+    unique_keys, codes = np.unique(keys, axis=0, return_inverse=True)
+    codes = codes.reshape(-1).astype('<i4')
+    position_table = [[int(x), int(y)] + ([store.direction_labels[d]] if d >= 0 else [])
+                      for x, y, d in unique_keys]
+
+    header = {'macs': list(store.registry.macs), 'positions': position_table,
+              'n_records': n_records, 'n_beacons': n_beacons}
+    prefix_len = _FPDB_PREFIX.size
+    # 오프셋이 header 길이에 영향을 주므로 자리수가 넉넉한 값으로 한 번 계산한 뒤 확정합니다.
+    header.update(rssi_offset=0, codes_offset=0)
+    header_len = len(json.dumps(header, ensure_ascii=False).encode('utf-8')) + 64
+    rssi_offset = -(-(prefix_len + header_len) // FPDB_ALIGN) * FPDB_ALIGN
+    codes_offset = rssi_offset + n_records * n_beacons * 4
+    header.update(rssi_offset=rssi_offset, codes_offset=codes_offset)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8').ljust(header_len)
+
+    with open(path, 'wb') as f:
+        f.write(_FPDB_PREFIX.pack(FPDB_MAGIC, FPDB_VERSION, header_len))
+        f.write(header_bytes)
+        f.write(b'\0' * (rssi_offset - prefix_len - header_len))
+        f.write(np.ascontiguousarray(rssi, dtype='<f4').tobytes())
+        f.write(codes.tobytes())
+
+
+def read_fpdb(path, registry=None):
+    """
+    바이너리(.fpdb)를 np.memmap 기반 RecordStore로 엽니다.
+    registry의 비콘 순서가 파일과 다르면 레지스트리 순서의 배열로 복사해 재배치합니다.
+    """
+    with open(path, 'rb') as f:
+        magic, version, header_len = _FPDB_PREFIX.unpack(f.read(_FPDB_PREFIX.size))
+        if magic != FPDB_MAGIC:
+            raise ValueError(f"'{path}'은(는) 핑거프린트 바이너리 DB가 아닙니다.")
+        if version != FPDB_VERSION:
+            raise ValueError(f"지원하지 않는 .fpdb 버전입니다: {version}")
+        header = json.loads(f.read(header_len).decode('utf-8'))
+
+    n_records, n_beacons = header['n_records'], header['n_beacons']
+    rssi = np.memmap(path, dtype='<f4', mode='r', offset=header['rssi_offset'], shape=(n_records, n_beacons))
+    codes = np.memmap(path, dtype='<i4', mode='r', offset=header['codes_offset'], shape=(n_records,))
+
+    table = header['positions']
+    xy = np.array([p[:2] for p in table], dtype=np.int16).reshape(-1, 2)[codes]
+    labels = sorted({p[2] for p in table if len(p) >= 3})
+    direction_codes = np.array([labels.index(p[2]) if len(p) >= 3 else -1 for p in table], dtype=np.int8)[codes]
+
+    if registry is None:
+        registry = BeaconRegistry()
+    if len(registry) == 0 or registry.macs == header['macs']:
+        for mac in header['macs']:
+            registry.intern(mac)
+        return RecordStore.from_arrays(rssi, xy, direction_codes, labels, registry)
+    store = RecordStore(registry, capacity=n_records)
+    store.extend(rssi, xy, macs=header['macs'])
+    store.direction_labels = list(labels)
+    store._direction_ids = {label: i for i, label in enumerate(labels)}
+    store._direction[:n_records] = direction_codes
+    return store
+
 
-            # 2) cosine distance
-            cos_dist, idx_all = self.tree.query(sample_normed, k=len(self.records))
-            cos_dist = cos_dist[0]
+def read_record_store(path, registry=None, sparse=False):
+    """
+    JSON 또는 바이너리(.fpdb) 핑거프린트 DB를 RecordStore로 읽습니다.
+    sparse=True이면 수신된 비콘만 저장하는 SparseRecordStore를 반환합니다.
+    """
+    if path.endswith('.fpdb'):
+        store = read_fpdb(path, registry)
+        return SparseRecordStore.from_dense(store) if sparse else store
+    with open(path, 'r') as f:
+        return (SparseRecordStore if sparse else RecordStore).from_records(json.load(f), registry)
 
-            # 3) norm difference
-            norm_diff = np.abs(self.norms - norm_raw)
 
-            # 4) weighted L1 (강신호 AP 절댓값 차이)
-            strong_mask = (raw > strong_threshold).astype(float)
-            repeated = np.repeat(raw.reshape(1, -1), self.rssi_matrix.shape[0], axis=0)
-            abs_diff = np.abs(self.rssi_matrix - repeated)
-            weighted_l1 = (abs_diff * strong_mask).sum(axis=1)
-            weighted_l1 /= max(strong_mask.sum(), 1)
+def convert_json_to_binary(json_path, binary_path=None):
+    """기존 JSON 핑거프린트 DB를 바이너리(.fpdb) 형식으로 변환합니다."""
+    if binary_path is None:
+        binary_path = json_path.rsplit('.', 1)[0] + '.fpdb'
+    db = FingerprintDB()
+    db.load(json_path)
+    db.save_binary(binary_path)
+    print(f"✅ '{json_path}' → '{binary_path}' 변환 완료 ({len(db.rssi_matrix)}개 레코드)")
+    return binary_path
 
-            # 5) hybrid 거리
-            hybrid = alpha * cos_dist + (1 - alpha) * norm_diff + beta * weighted_l1
 
-            # 6) top-k + 가중평균
-            topk = np.argsort(hybrid)[:k]
-            pts = self.positions[topk]
-            dists = hybrid[topk]
-            weights = 1.0 / (dists + 1e-5)
-            ble_pos = np.average(pts, axis=0, weights=weights)
+if __name__ == '__main__':
+    import sys
 
-            return ble_pos, pts, dists
\ No newline at end of file
+    # 사용법: python fingerprinting.py <입력.json|입력.fpdb> [출력 경로]
+    #   .json → .fpdb 변환, .fpdb → .json 내보내기
+    if len(sys.argv) < 2:
+        print("사용법: python fingerprinting.py <입력.json|입력.fpdb> [출력 경로]")
+        sys.exit(1)
+    src_path = sys.argv[1]
+    if src_path.endswith('.fpdb'):
+        dst_path = sys.argv[2] if len(sys.argv) > 2 else src_path[:-len('.fpdb')] + '.json'
+        db = FingerprintDB()
+        db.load_binary(src_path)
+        db.save(dst_path)
+        print(f"✅ '{src_path}' → '{dst_path}' 내보내기 완료")
+    else:
+        convert_json_to_binary(src_path, sys.argv[2] if len(sys.argv) > 2 else None)
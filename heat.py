@@ -1,16 +1,19 @@
-import json
+import sys
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import os
 
+from beacon_store import RecordStore
+from fingerprinting import read_record_store
+
 # --- 실행 전, 파일 이름을 4방향 데이터가 저장된 파일명으로 변경해주세요 ---
 FINGERPRINT_DB_FILE = "fingerprint_db_4dir.json"
 
-# 파일 로드
+# 파일 로드 (JSON 또는 바이너리 .fpdb)
 try:
-    with open(FINGERPRINT_DB_FILE, "r") as f:
-        data = json.load(f)
+    store = read_record_store(FINGERPRINT_DB_FILE)
 except FileNotFoundError:
     print(f"오류: '{FINGERPRINT_DB_FILE}' 파일을 찾을 수 없습니다.")
     input("Press Enter to exit...")
@@ -18,18 +21,19 @@ except FileNotFoundError:
 
 
 # --- 변경된 부분: 방향(direction) 정보 추가 ---
-# 각 위치 및 방향에서 비콘별 RSSI 수집
-records = []
-for entry in data:
-    # 키가 'pos'가 아닌 경우 건너뛰기 (데이터 형식 오류 방지)
-    if 'pos' not in entry or len(entry['pos']) != 3:
-        continue
-    
-    x, y, direction = entry["pos"]
-    for mac, rssi in entry["rssi"].items():
-        records.append({"x": x, "y": y, "direction": direction, "beacon": mac, "rssi": rssi})
-
-df = pd.DataFrame(records)
+# 각 위치 및 방향에서 비콘별 RSSI 수집 (저장소 배열을 long 형식으로 펼칩니다)
+valid = store.direction_codes >= 0  # 방향 정보가 없는 레코드는 건너뛰기
+rssi = store.rssi[valid]
+n_records, n_beacons = rssi.shape
+df = pd.DataFrame({
+    "x": np.repeat(store.xy[valid, 0], n_beacons),
+    "y": np.repeat(store.xy[valid, 1], n_beacons),
+    "direction": np.repeat(np.array(store.direction_labels)[store.direction_codes[valid]], n_beacons),
+    "beacon": np.tile(np.array(store.registry.macs), n_records),
+    "rssi": rssi.ravel(),
+})
+# 수신되지 않은 비콘(-100 채움)은 평균에서 제외합니다.
+df = df[df["rssi"] != RecordStore.MISSING_RSSI]
 
 # --- 변경된 부분: direction을 기준으로 추가하여 그룹화 ---
 # 평균 RSSI로 그룹화
@@ -0,0 +1,205 @@
+#격자 HMM(은닉 마르코프 모델) 측위 파일. 지도의 걸을 수 있는 칸 전체에 대한 확률(belief)을 forward 알고리즘으로 갱신합니다.
+#전이: binary_grid 인접 관계 + IMU 이동량으로 만든 희소 행렬, 방출: 분류기 predict_proba(측정 셀별 확률).
+#LGBM 예측이 현재 위치와 달라도 버리지 않고 모든 예측을 확률로 반영하므로, 위치가 틀어졌을 때도 빨리 돌아옵니다.
+
+import math
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class GridHMM:
+    """
+    EKF와 같은 predict(imu_yaw, imu_speed) / update(z) / get_state() 인터페이스를 가진 격자 HMM 측위기.
+    binary_grid(0 길, 1 벽)의 block x block 칸을 HMM 상태 한 칸으로 묶습니다 (절반 이상이 길이면 걸을 수 있는 칸).
+    한 단계의 비용은 걸을 수 있는 칸 수에 비례합니다 (희소 행렬-벡터 곱과 칸별 배열 연산뿐).
+    """
+    # EKF와 같은 속도 보정 계수
+    speed_scale = 0.65
+    # 이동량별 전이 행렬 캐시 크기
+    max_cached_shifts = 256
+
+    def __init__(self, binary_grid, cell_size_m, block=4, dt=1.0, motion_sigma=0.15, measurement_sigma=0.5,
+                 emission_floor=1e-3):
+        grid = np.asarray(binary_grid, dtype=bool)
+        height, width = -(-grid.shape[0] // block), -(-grid.shape[1] // block)
+        padded = np.ones((height * block, width * block), dtype=bool)
+        padded[:grid.shape[0], :grid.shape[1]] = grid
+        wall_ratio = padded.reshape(height, block, width, block).mean(axis=(1, 3))
+        self.walkable = wall_ratio < 0.5
+        self.shape = (height, width)
+        self.cell_w, self.cell_h = cell_size_m[0] * block, cell_size_m[1] * block
+        self.dt = dt
+        self.motion_sigma = motion_sigma
+        self.measurement_sigma = measurement_sigma
+        # 분류기가 틀렸을 때 belief가 전부 0이 되지 않도록 방출 확률에 더하는 바닥값 (최댓값 대비 비율)
+        self.emission_floor = emission_floor
+
+        # 상태 번호 ↔ (row, col). 걸을 수 있는 칸만 상태로 씁니다.
+        self.cells = np.argwhere(self.walkable)
+        self.n = len(self.cells)
+        if self.n == 0:
+            raise ValueError("지도에 걸을 수 있는 칸이 없습니다.")
+        self.state_index = np.full(self.shape, -1, dtype=np.int64)
+        self.state_index[self.cells[:, 0], self.cells[:, 1]] = np.arange(self.n)
+        self.centers = np.column_stack(((self.cells[:, 1] + 0.5) * self.cell_w, (self.cells[:, 0] + 0.5) * self.cell_h))
+
+        self.diffusion = self._diffusion_matrix()
+        self._shifts = {}
+        self._emissions = (None, None)
+        self.yaw, self.speed = 0.0, 0.0
+        # 아직 belief에 반영하지 않은 이동량 (m)과 시간 (s). predict 참고
+        self._pending = (0.0, 0.0, 0.0)
+        self.reset()
+
+    @classmethod
+    def from_config(cls, config, binary_grid, block_size):
+        """config.yaml의 fusion_engine 설정(hmm_*)과 지도 축척으로 만듭니다."""
+        cfg = config.get('fusion_engine') or {}
+        cell_size_m = (block_size / config['px_per_m_x'], block_size / config['px_per_m_y'])
+        return cls(binary_grid, cell_size_m, block=cfg.get('hmm_block', 4), dt=config.get('ekf_dt', 1.0),
+                   motion_sigma=cfg.get('hmm_motion_sigma', 0.15),
+                   measurement_sigma=cfg.get('measurement_sigma', 0.5))
+
+    def reset(self, position=None, spread=0.5):
+        """position(m) 주변의 가우시안, None이면 걸을 수 있는 칸 전체에 고른 belief로 시작합니다."""
+        self._pending = (0.0, 0.0, 0.0)
+        if position is None:
+            self.belief = np.full(self.n, 1.0 / self.n)
+        else:
+            d2 = ((self.centers - np.asarray(position, dtype=np.float64)[:2]) ** 2).sum(axis=1)
+            belief = np.exp(-0.5 * d2 / spread ** 2)
+            self.belief = belief / belief.sum() if belief.sum() > 0 else np.full(self.n, 1.0 / self.n)
+
+    def _clear(self, src, dst):
+        """상태 src → 칸 (row, col) dst로 가는 직선이 벽 칸이나 지도 밖을 지나지 않는지 (반 칸 간격 샘플링)."""
+        src_rc = self.cells[src].astype(np.float64)
+        delta = dst - src_rc
+        steps = int(math.ceil(np.abs(delta).max() * 2)) + 1 if len(delta) else 1
+        t = np.arange(1, steps + 1) / steps
+        rows = np.rint(src_rc[:, 0, None] + t * delta[:, 0, None]).astype(np.int64)
+        cols = np.rint(src_rc[:, 1, None] + t * delta[:, 1, None]).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        ok = np.zeros(rows.shape, dtype=bool)
+        ok[inside] = self.walkable[rows[inside], cols[inside]]
+        return ok.all(axis=1)
+
+    def _diffusion_matrix(self):
+        """
+        걷는 동안의 위치 불확실성(motion_sigma)을 나타내는 고정 전이 행렬 D (열 확률: D[j, i] = P(j | i)).
+        반경 2σ 안의 걸을 수 있고 벽에 가리지 않은 칸으로만 퍼집니다.
+        """
+        radius = max(1, int(math.ceil(2 * self.motion_sigma / min(self.cell_w, self.cell_h))))
+        offsets = [(dr, dc) for dr in range(-radius, radius + 1) for dc in range(-radius, radius + 1)]
+        src, dst, weight = [], [], []
+        for dr, dc in offsets:
+            target = self.cells + (dr, dc)
+            inside = ((target[:, 0] >= 0) & (target[:, 0] < self.shape[0]) &
+                      (target[:, 1] >= 0) & (target[:, 1] < self.shape[1]))
+            cand = np.flatnonzero(inside)
+            cand = cand[self.walkable[target[cand, 0], target[cand, 1]]]
+            if dr or dc:
+                cand = cand[self._clear(cand, target[cand])]
+            d2 = (dr * self.cell_h) ** 2 + (dc * self.cell_w) ** 2
+            src.append(cand)
+            dst.append(self.state_index[target[cand, 0], target[cand, 1]])
+            weight.append(np.full(len(cand), math.exp(-0.5 * d2 / self.motion_sigma ** 2)))
+        src, dst, weight = np.concatenate(src), np.concatenate(dst), np.concatenate(weight)
+        weight /= np.bincount(src, weights=weight, minlength=self.n)[src]
+        return sp.csr_matrix((weight, (dst, src)), shape=(self.n, self.n))
+
+    def _shift_matrix(self, dr, dc):
+        """모든 칸을 (dr, dc)칸 옮기는 전이 행렬. 벽에 막히거나 지도 밖이면 제자리에 남습니다. 이동량별로 캐시합니다."""
+        key = (dr, dc)
+        if key not in self._shifts:
+            if len(self._shifts) >= self.max_cached_shifts:
+                self._shifts.clear()
+            target = self.cells + key
+            clear = self._clear(np.arange(self.n), target)
+            dst = np.where(clear, self.state_index[np.clip(target[:, 0], 0, self.shape[0] - 1),
+                                                   np.clip(target[:, 1], 0, self.shape[1] - 1)], np.arange(self.n))
+            self._shifts[key] = sp.csr_matrix((np.ones(self.n), (dst, np.arange(self.n))), shape=(self.n, self.n))
+        return self._shifts[key]
+
+    def predict(self, imu_yaw, imu_speed, dt=None):
+        """
+        forward 알고리즘의 전이 단계: IMU 이동량만큼 belief를 옮긴 뒤(소수 칸은 이웃 네 정수 이동에 나눠 담음) 퍼뜨립니다.
+        dt를 주면 self.dt 대신 그 시간만큼 움직입니다. 이동량과 시간을 쌓아 두었다가 self.dt가 찰 때마다 한 단계씩 옮기고
+        퍼뜨리므로, 이벤트마다 짧은 dt로 자주 불러도 belief는 호출 횟수가 아니라 경과 시간에 비례해 퍼집니다.
+        """
+        self.yaw, self.speed = imu_yaw, imu_speed
+        dt = self.dt if dt is None else dt
+        step = imu_speed * self.speed_scale * dt
+        theta = math.radians(imu_yaw)
+        dx, dy, elapsed = self._pending
+        dx, dy, elapsed = dx + step * math.cos(theta), dy + step * math.sin(theta), elapsed + dt
+        # 부동소수점 합 오차로 한 단계가 밀리지 않도록 약간의 여유를 둡니다. (0.02 x 50 = 0.9999...)
+        n_steps = int(elapsed / self.dt + 1e-6)
+        if n_steps == 0:
+            self._pending = (dx, dy, elapsed)
+            return
+        # 채운 단계만큼의 이동량만 반영하고 나머지는 다음 호출로 넘깁니다.
+        done = min(n_steps * self.dt / elapsed, 1.0)
+        self._pending = (dx * (1 - done), dy * (1 - done), max(elapsed - n_steps * self.dt, 0.0))
+        dc, dr = dx * done / self.cell_w, dy * done / self.cell_h
+        r0, c0 = math.floor(dr), math.floor(dc)
+        fr, fc = dr - r0, dc - c0
+        moved = np.zeros(self.n)
+        for (r, c), w in (((r0, c0), (1 - fr) * (1 - fc)), ((r0 + 1, c0), fr * (1 - fc)),
+                          ((r0, c0 + 1), (1 - fr) * fc), ((r0 + 1, c0 + 1), fr * fc)):
+            if w > 1e-9:
+                moved += w * (self._shift_matrix(r, c) @ self.belief)
+        for _ in range(n_steps):
+            moved = self.diffusion @ moved
+        self.belief = moved
+
+    def _apply_emission(self, emission):
+        emission = emission + self.emission_floor * emission.max()
+        belief = self.belief * emission
+        total = belief.sum()
+        # 확률이 수치적으로 모두 사라지면 이번 측정만으로 다시 시작합니다.
+        self.belief = belief / total if total > 0 else emission / emission.sum()
+
+    def _emission_matrix(self, class_positions):
+        """칸 × 클래스 희소 행렬: 칸 중심과 측정 셀 중심 사이의 가우시안 (3σ 밖은 0). 클래스 목록이 같으면 다시 쓰입니다."""
+        class_positions = np.asarray(class_positions, dtype=np.float64)
+        key = class_positions.tobytes()
+        if self._emissions[0] != key:
+            d2 = ((self.centers[:, None, :] - class_positions[None, :, :]) ** 2).sum(axis=2)
+            kernel = np.exp(-0.5 * d2 / self.measurement_sigma ** 2)
+            kernel[d2 > (3 * self.measurement_sigma) ** 2] = 0.0
+            self._emissions = (key, sp.csr_matrix(kernel))
+        return self._emissions[1]
+
+    def update_proba(self, proba, class_positions):
+        """
+        forward 알고리즘의 측정 단계: 분류기 확률(측정 셀별)을 칸별 방출 확률로 바꿔 belief에 곱합니다.
+        class_positions: (C, 2) 각 클래스 셀 중심 (m), proba와 같은 순서.
+        """
+        self._apply_emission(self._emission_matrix(class_positions) @ np.asarray(proba, dtype=np.float64))
+
+    def update(self, z, sigma=None):
+        """위치 측정 z = [x, y] (m)를 가우시안 방출 확률로 반영합니다."""
+        sigma = sigma or self.measurement_sigma
+        d2 = ((self.centers - np.asarray(z, dtype=np.float64)[:2]) ** 2).sum(axis=1)
+        self._apply_emission(np.exp(-0.5 * d2 / sigma ** 2))
+
+    def most_likely(self):
+        """belief가 가장 큰 칸의 중심 (m)"""
+        return self.centers[int(self.belief.argmax())].copy()
+
+    def get_state(self):
+        """
+        EKF.get_state()와 같은 [px, py, theta(rad), v] - 위치는 belief의 기댓값, 방향/속도는 마지막 IMU 값
+        아직 한 단계(self.dt)가 차지 않아 belief에 반영하지 않은 이동량도 위치에 더합니다.
+        """
+        x, y = self.belief @ self.centers + self._pending[:2]
+        return np.array([x, y, math.radians(self.yaw), self.speed * self.speed_scale])
+
+    def snapshot(self):
+        """되돌리기(event_fusion.EventFusion)용 상태 사본"""
+        return self.belief.copy(), self.yaw, self.speed, self._pending
+
+    def restore(self, snapshot):
+        belief, self.yaw, self.speed, self._pending = snapshot
+        self.belief = belief.copy()
@@ -0,0 +1,283 @@
+#여러 키오스크/태블릿이 공유하는 위치 분류 추론 서버 (마이크로 배치) 파일.
+
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+from collections import deque
+
+import numpy as np
+
+from lgbm_predictor import LGBM_Classifier_Predictor
+
+
+class _Request:
+    __slots__ = ('live_rssi_vector', 'want_proba', 'enqueued', 'done', 'label', 'proba')
+
+    def __init__(self, live_rssi_vector, want_proba):
+        self.live_rssi_vector = live_rssi_vector
+        self.want_proba = want_proba
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.label = None
+        self.proba = None
+
+
+class MicroBatcher:
+    """
+    요청을 모아 한 번의 predict_batch 호출로 처리하는 배치기.
+    첫 요청이 도착한 뒤 batch_window_ms 동안(또는 max_batch개가 찰 때까지) 들어온 요청을 한 배치로 묶습니다.
+    예측기는 이 배치 스레드에서만 호출되므로 재사용 버퍼를 쓰는 예측기를 여러 연결이 안전하게 공유합니다.
+    """
+    LATENCY_HISTORY = 10_000
+
+    def __init__(self, predictor, batch_window_ms=2.0, max_batch=64):
+        self.predictor = predictor
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._latencies = deque(maxlen=self.LATENCY_HISTORY)
+        self._started = None
+        self.n_requests = 0
+        self.n_batches = 0
+
+    def start(self):
+        self._running = True
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, live_rssi_vector, want_proba=False, timeout=5.0):
+        """요청 하나를 넣고 결과를 기다립니다. 반환: (레이블, 확률 벡터 또는 None)"""
+        request = _Request(live_rssi_vector, want_proba)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        if not request.done.wait(timeout):
+            raise TimeoutError("추론 서버가 제한 시간 안에 응답하지 않았습니다.")
+        return request.label, request.proba
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            if not self._running:
+                return None
+            deadline = self._pending[0].enqueued + self.batch_window
+            while self._running and len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._pending), self.max_batch)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                labels, proba = self.predictor.predict_batch([r.live_rssi_vector for r in batch])
+            except Exception as e:
+                print(f"배치 추론 중 오류 발생: {e}")
+                labels, proba = [None] * len(batch), [None] * len(batch)
+            finished = time.perf_counter()
+            for request, label, p in zip(batch, labels, proba):
+                request.label = None if label is None else str(label)
+                request.proba = p if request.want_proba else None
+                self._latencies.append(finished - request.enqueued)
+                request.done.set()
+            self.n_requests += len(batch)
+            self.n_batches += 1
+
+    def stats(self):
+        latencies = np.array(self._latencies) * 1000
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            'requests': self.n_requests, 'batches': self.n_batches,
+            'mean_batch_size': self.n_requests / self.n_batches if self.n_batches else 0.0,
+            'throughput_rps': self.n_requests / elapsed if elapsed > 0 else 0.0,
+            'p50_latency_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'p99_latency_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+            'batch_window_ms': self.batch_window * 1000, 'max_batch': self.max_batch,
+        }
+
+
+class _InferenceHandler(socketserver.StreamRequestHandler):
+    """
+    JSON lines 프로토콜. 한 줄에 요청 하나, 응답도 한 줄.
+      요청: {"id": 1, "rssi": {"MAC": -60, ...}, "direction": "N", "proba": false}
+            {"cmd": "stats"}
+      응답: {"id": 1, "label": "2_2"} (proba가 true이면 "proba": {"레이블": 확률, ...} 추가)
+    """
+    def handle(self):
+        batcher = self.server.batcher
+        classes = [str(c) for c in batcher.predictor.classes]
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                if message.get('cmd') == 'stats':
+                    response = batcher.stats()
+                else:
+                    live = dict(message['rssi'])
+                    if message.get('direction') is not None:
+                        live['direction'] = message['direction']
+                    label, proba = batcher.submit(live, bool(message.get('proba')))
+                    response = {'id': message.get('id'), 'label': label}
+                    if proba is not None:
+                        response['proba'] = dict(zip(classes, map(float, proba)))
+            except (ValueError, KeyError, TypeError, TimeoutError) as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+class InferenceServer(socketserver.ThreadingTCPServer):
+    """연결마다 스레드를 두고 모든 요청을 하나의 MicroBatcher로 모으는 TCP 서버."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, predictor, host='127.0.0.1', port=5010, batch_window_ms=2.0, max_batch=64):
+        self.batcher = MicroBatcher(predictor, batch_window_ms, max_batch)
+        super().__init__((host, port), _InferenceHandler)
+
+    def serve_forever(self, poll_interval=0.5):
+        self.batcher.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.batcher.stop()
+
+    def start_background(self):
+        """별도 스레드에서 서버를 실행합니다. (자체 점검/테스트용)"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class InferenceClient:
+    """추론 서버용 간단한 클라이언트 (키오스크 대역, 자체 점검용)."""
+    def __init__(self, host='127.0.0.1', port=5010, timeout=5.0):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile('rwb')
+        self._next_id = 0
+
+    def _call(self, message):
+        self._file.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        self._file.flush()
+        return json.loads(self._file.readline())
+
+    def predict(self, rssi_vector, direction=None, proba=False):
+        self._next_id += 1
+        return self._call({'id': self._next_id, 'rssi': rssi_vector, 'direction': direction, 'proba': proba})
+
+    def stats(self):
+        return self._call({'cmd': 'stats'})
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+def self_test(model_path, db_path, n_clients=8, requests_per_client=200, batch_window_ms=2.0, max_batch=64):
+    """
+    로컬 서버를 띄우고 n_clients개의 대역 클라이언트가 동시에 요청을 보내 결과가 로컬 predict()와 같은지 확인합니다.
+    반환: 서버 통계 dict (+ 불일치 수)
+    """
+    from lgbm_benchmark import make_live_vectors
+
+    predictor = LGBM_Classifier_Predictor()
+    if not predictor.load_model(model_path):
+        return None
+    reference = LGBM_Classifier_Predictor()
+    reference.load_model(model_path)
+    vectors = make_live_vectors(db_path, n_clients * requests_per_client, noise_db=3.0)
+
+    server = InferenceServer(predictor, port=0, batch_window_ms=batch_window_ms, max_batch=max_batch)
+    server.start_background()
+    host, port = server.server_address
+    mismatches = [0] * n_clients
+
+    def run_client(i):
+        client = InferenceClient(host, port)
+        for live in vectors[i::n_clients]:
+            rssi = {mac: v for mac, v in live.items() if mac != 'direction'}
+            response = client.predict(rssi, live.get('direction'))
+            if response.get('label') != str(reference.predict(live)):
+                mismatches[i] += 1
+        client.close()
+
+    threads = [threading.Thread(target=run_client, args=(i,)) for i in range(n_clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = server.batcher.stats()
+    server.shutdown()
+    server.server_close()
+    stats['mismatches'] = sum(mismatches)
+    return stats
+
+
+if __name__ == '__main__':
+    from app_config import load_config
+
+    parser = argparse.ArgumentParser(description="위치 분류 모델 추론 서버 (JSON lines over TCP, 마이크로 배치)")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--model', default=None, help="모델 경로 (기본: lgbm_predictor.pkl을 컴파일한 lgbm_predictor.npz)")
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--batch-window-ms', type=float, default=None)
+    parser.add_argument('--max-batch', type=int, default=None)
+    parser.add_argument('--self-test', action='store_true', help="로컬 대역 클라이언트로 서버를 점검하고 종료합니다.")
+    parser.add_argument('--db', default='fingerprint_db_4dir.json', help="자체 점검용 핑거프린트 DB")
+    parser.add_argument('--clients', type=int, default=8)
+    args = parser.parse_args()
+
+    try:
+        server_cfg = load_config(args.config).get('inference_server') or {}
+    except FileNotFoundError:
+        server_cfg = {}
+    model_path = args.model or server_cfg.get('model')
+    if model_path is None:
+        # .npz가 없거나 .pkl보다 오래되었으면 여기서 한 번 내보냅니다.
+        model_path = LGBM_Classifier_Predictor().load_default_model() or 'lgbm_predictor.pkl'
+    window = args.batch_window_ms if args.batch_window_ms is not None else server_cfg.get('batch_window_ms', 2.0)
+    max_batch = args.max_batch if args.max_batch is not None else server_cfg.get('max_batch', 64)
+
+    if args.self_test:
+        stats = self_test(model_path, args.db, args.clients, batch_window_ms=window, max_batch=max_batch)
+        if stats is None:
+            raise SystemExit(1)
+        print(f"요청 {stats['requests']}개, 평균 배치 {stats['mean_batch_size']:.1f}, "
+              f"처리량 {stats['throughput_rps']:.0f} req/s, p50 {stats['p50_latency_ms']:.2f} ms, "
+              f"p99 {stats['p99_latency_ms']:.2f} ms")
+        print("✅ 모든 응답이 로컬 예측과 같습니다." if stats['mismatches'] == 0
+              else f"⚠️ 로컬 예측과 다른 응답 {stats['mismatches']}개")
+        raise SystemExit(0 if stats['mismatches'] == 0 else 1)
+
+    predictor = LGBM_Classifier_Predictor()
+    if not predictor.load_model(model_path):
+        raise SystemExit(1)
+    host = args.host or server_cfg.get('host', '127.0.0.1')
+    port = args.port if args.port is not None else server_cfg.get('port', 5010)
+    server = InferenceServer(predictor, host, port, window, max_batch)
+    print(f"추론 서버 시작: {host}:{port} (배치 창 {window} ms, 최대 배치 {max_batch})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n서버 통계: {server.batcher.stats()}")
+    finally:
+        server.server_close()
@@ -0,0 +1,78 @@
+#LGBM 실시간 예측 경로(DataFrame vs 미리 계산한 피처 배치)의 호출당 지연 시간 비교 파일.
+
+import json
+import time
+import argparse
+import numpy as np
+
+from fingerprinting import read_record_store
+from lgbm_predictor import LGBM_Classifier_Predictor
+
+
+def make_live_vectors(db_path, n_vectors, noise_db, seed=0):
+    """DB 레코드에 잡음을 더하고 일부 비콘을 빼서 BLE 콜백과 같은 형태(dict + 'direction')의 입력을 만듭니다."""
+    rng = np.random.default_rng(seed)
+    store = read_record_store(db_path)
+    records = store.to_records()
+    vectors = []
+    for i in rng.integers(0, len(records), n_vectors):
+        rec = records[i]
+        live = {mac: float(rssi + rng.normal(0, noise_db)) for mac, rssi in rec['rssi'].items()
+                if rng.random() > 0.1}
+        if len(rec['pos']) >= 3:
+            live['direction'] = rec['pos'][2]
+        vectors.append(live)
+    return vectors
+
+
+def time_per_call(predict, vectors, repeat):
+    """가장 빠른 반복의 호출당 평균 지연 (ms)과 마지막 반복의 예측 결과."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        labels = [predict(v) for v in vectors]
+        best = min(best, time.perf_counter() - start)
+    return best / len(vectors) * 1000, labels
+
+
+def build_report(model_path, db_path, n_vectors=500, noise_db=3.0, repeat=3):
+    predictor = LGBM_Classifier_Predictor()
+    if not predictor.load_model(model_path):
+        return None
+    vectors = make_live_vectors(db_path, n_vectors, noise_db)
+
+    pandas_ms, pandas_labels = time_per_call(predictor._predict_pandas, vectors, repeat)
+    fast_ms, fast_labels = time_per_call(predictor.predict, vectors, repeat)
+    mismatches = sum(a != b for a, b in zip(pandas_labels, fast_labels))
+
+    return {
+        'model_path': model_path, 'db_path': db_path, 'n_calls': n_vectors, 'noise_db': noise_db,
+        'n_features': len(predictor.feature_columns), 'feature_encoding': predictor.feature_encoding,
+        'pandas_ms_per_call': pandas_ms, 'fast_ms_per_call': fast_ms, 'speedup': pandas_ms / fast_ms,
+        'mismatches': mismatches,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="LGBM predict()의 DataFrame 경로와 빠른 경로를 비교합니다.")
+    parser.add_argument('--model', default='lgbm_predictor.pkl')
+    parser.add_argument('--db', default='fingerprint_db_4dir.json')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=3.0, help="입력 RSSI에 더할 잡음 표준편차 (dB)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help="결과를 저장할 JSON 경로")
+    args = parser.parse_args()
+
+    report = build_report(args.model, args.db, args.calls, args.noise, args.repeat)
+    if report is None:
+        raise SystemExit(1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+    print(f"DataFrame 경로: {report['pandas_ms_per_call']:.3f} ms/호출")
+    print(f"빠른 경로:      {report['fast_ms_per_call']:.3f} ms/호출 (x{report['speedup']:.1f})")
+    if report['mismatches']:
+        print(f"⚠️ 예측이 다른 입력 {report['mismatches']}개")
+    else:
+        print(f"✅ {report['n_calls']}개 입력 모두 예측 결과가 같습니다.")
@@ -1,12 +1,16 @@
+import os
 import json
-import pandas as pd
 import numpy as np
-import lightgbm as lgb
-import joblib
 import warnings
 
-from sklearn.metrics import accuracy_score
-from sklearn.model_selection import train_test_split
+from beacon_store import RecordStore
+from fingerprinting import read_record_store, heading_weights
+from feature_engine import FeatureEngine
+from prediction_cache import PredictionCache
+from tree_compiler import CompiledForest
+
+# pandas / lightgbm / sklearn / joblib은 학습과 .pkl 모델에만 필요하므로 사용하는 메소드 안에서 불러옵니다.
+# 컴파일된 모델(.npz)만 쓰는 실행 환경에서는 NumPy만으로 예측합니다.
 
 warnings.filterwarnings('ignore')
 
@@ -15,70 +19,475 @@ class LGBM_Classifier_Predictor:
         self.model = None
         ## [수정] feature_columns만 있으면 충분하므로 beacon_columns는 제거합니다.
         self.feature_columns = None
+        # 'dense': -100으로 채운 DataFrame 피처
+        # 'shifted_sparse': 희소 CSR 피처. 비콘 열은 RSSI + 100 (미수신 = 0), 방향 열은 원-핫 1
+        self.feature_encoding = 'dense'
+        # 시계열 피처 설정 (feature_engine.FeatureEngine.config()). None이면 RSSI 스냅샷 피처만 씁니다.
+        self.feature_engine = None
+        # 방향별 모델 {방향: .npz 경로} (train_heading_models). None이면 dir_ 원-핫 열을 쓰는 단일 모델입니다.
+        self.heading_models = None
+        self._heading_predictors = {}  # 처음 쓰일 때 불러온 방향별 모델
+        self._heading_columns = {}     # 방향별 모델의 클래스 → self.classes 열 번호
+        self.switch_margin = 0.0       # 레이블 히스테리시스 (_predict_with_hysteresis 참고)
+        self._last_index = None
+        # 실시간 예측용 피처 배치 (_compile_layout 참고)
+        self.forest = None  # 컴파일된 트리 평가기 (tree_compiler.CompiledForest, .npz 모델)
+        self.cache = None       # 예측 캐시 (enable_cache 참고)
+        self.model_version = 0  # 모델을 학습/로드할 때마다 증가 (캐시 무효화용)
+        self.classes = None
+        self._proba = None            # (샘플 수, 피처 수) → 클래스 확률 함수 (부스터 또는 CompiledForest)
+        self._slots = None            # MAC(':' 또는 '_' 표기) → 피처 열 번호
+        self._direction_slots = None  # 방향 레이블 → dir_ 열 번호
+        self._template = None         # 아무 비콘도 수신되지 않은 피처 행
+        self._row = None              # 예측마다 다시 쓰는 (1, 피처 수) 버퍼
+        self._rssi_offset = 0.0
 
-    def _prepare_data(self, db_path):
-        """JSON 데이터를 불러와 피처와 '분류용 레이블'로 변환합니다."""
+    def _prepare_data(self, db_path, feature_engine=None):
+        """
+        핑거프린트 DB(JSON 또는 .fpdb)를 불러와 피처와 '분류용 레이블'로 변환합니다.
+        feature_engine: 시계열 피처 설정 dict ({'windows': [...], 'beacon_macs': [...]}).
+                        주어지면 레코드를 수집 순서대로 FeatureEngine에 다시 흘려 실시간과 같은 피처를 만듭니다.
+                        'beacon_macs'가 없으면 DB의 비콘 순서를 써서 설정에 기록합니다.
+        """
+        import pandas as pd
         try:
-            with open(db_path, "r") as f:
-                data = json.load(f)
+            store = read_record_store(db_path)
         except FileNotFoundError:
             print(f"오류: '{db_path}' 파일을 찾을 수 없습니다.")
             return None, None
 
-        records = []
-        for entry in data:
-            if 'pos' not in entry or len(entry['pos']) != 3:
-                continue
-            x, y, direction = entry["pos"]
-            record = {'x': x, 'y': y, 'direction': direction}
-            record.update(entry["rssi"])
-            records.append(record)
-        
-        df = pd.DataFrame(records)
+        # 방향 정보가 있는 레코드만 사용합니다.
+        valid = store.direction_codes >= 0
+        xy = store.xy[valid]
+
         ## [설명] MAC 주소의 ':' 문자를 '_'로 변경하여 컬럼명으로 사용하기 쉽게 만듭니다.
-        df.rename(columns=lambda c: c.replace(':', '_'), inplace=True)
+        # 저장소의 RSSI 배열은 레지스트리(비콘 ID) 순서의 열이고 미수신 비콘은 이미 -100으로 채워져 있습니다.
+        if feature_engine is not None:
+            engine = FeatureEngine(feature_engine.get('beacon_macs') or store.registry.macs, feature_engine['windows'])
+            feature_engine.update(engine.config())
+            X = pd.DataFrame(engine.replay(store, np.flatnonzero(valid)), columns=engine.feature_names)
+        else:
+            beacon_columns = [mac.replace(':', '_') for mac in store.registry.macs]
+            X = pd.DataFrame(store.rssi[valid], columns=beacon_columns)
 
-        df['pos_label'] = df['x'].astype(str) + '_' + df['y'].astype(str)
-        
-        beacon_columns = [col for col in df.columns if col not in ['x', 'y', 'direction', 'pos_label']]
-        df[beacon_columns] = df[beacon_columns].fillna(-100)
-        
         # 'direction' 컬럼을 원-핫 인코딩으로 변환합니다.
-        df = pd.get_dummies(df, columns=['direction'], prefix='dir')
-        
-        X = df.drop(['x', 'y', 'pos_label'], axis=1)
-        y = df['pos_label']
-        
+        directions = pd.Series(np.array(store.direction_labels)[store.direction_codes[valid]])
+        X = pd.concat([X, pd.get_dummies(directions, prefix='dir')], axis=1)
+
+        y = pd.Series(xy[:, 0]).astype(str) + '_' + pd.Series(xy[:, 1]).astype(str)
+
         return X, y
 
-    def train(self, db_path="fingerprint_db_4dir.json", test_size=0.3):
-        """데이터를 불러와 LightGBM 분류 모델을 학습하고 정확도를 평가합니다."""
-        X, y = self._prepare_data(db_path)
+    def _prepare_sparse_data(self, db_path):
+        """
+        _prepare_data의 희소 버전. 비콘이 수백 개여도 레코드마다 수신된 비콘 수만큼만 피처 값을 만듭니다.
+        반환: (scipy CSR 피처 행렬, 피처 이름 목록, 레이블 Series)
+        """
+        import pandas as pd
+        from scipy import sparse as sp
+        try:
+            store = read_record_store(db_path, sparse=True)
+        except FileNotFoundError:
+            print(f"오류: '{db_path}' 파일을 찾을 수 없습니다.")
+            return None, None, None
+
+        valid = np.flatnonzero(store.direction_codes >= 0)
+        csr = store.csr()[valid]
+        n_beacons = len(store.registry)
+        beacons = sp.csr_matrix((csr.data - RecordStore.MISSING_RSSI, csr.indices, csr.indptr),
+                                shape=(len(valid), n_beacons), dtype=np.float32)
+
+        # 방향 원-핫 열 (get_dummies와 같은 정렬 순서)
+        labels = sorted(store.direction_labels)
+        remap = np.array([labels.index(label) for label in store.direction_labels])
+        dir_codes = remap[store.direction_codes[valid]]
+        directions = sp.csr_matrix((np.ones(len(valid), dtype=np.float32), (np.arange(len(valid)), dir_codes)),
+                                   shape=(len(valid), len(labels)))
+
+        feature_columns = [mac.replace(':', '_') for mac in store.registry.macs] + [f"dir_{label}" for label in labels]
+        xy = store.xy[valid]
+        y = pd.Series(xy[:, 0]).astype(str) + '_' + pd.Series(xy[:, 1]).astype(str)
+        return sp.hstack([beacons, directions], format='csr'), feature_columns, y
+
+    def _to_shifted_sparse(self, X):
+        """_prepare_dense_data 결과(-100 채움 DataFrame)를 희소 피처 형식으로 변환합니다."""
+        from scipy import sparse as sp
+        values = X.to_numpy(dtype=np.float32)
+        beacon_cols = [j for j, col in enumerate(self.feature_columns) if not col.startswith('dir_')]
+        values[:, beacon_cols] -= RecordStore.MISSING_RSSI
+        return sp.csr_matrix(values)
+
+    def _prepare_dense_data(self, dense_map, feature_columns, labels):
+        """
+        고밀도 가상 핑거프린트(densify.DenseRadioMap)를 학습 피처로 변환합니다.
+        레이블은 가장 가까운 측정 셀이며, 실제 측정 레이블에 없는 셀로 가는 점은 버립니다.
+        """
+        import pandas as pd
+        X = pd.DataFrame(dense_map.rssi, columns=[mac.replace(':', '_') for mac in dense_map.macs])
+        if dense_map.directions is not None:
+            X = pd.concat([X, pd.get_dummies(pd.Series(dense_map.directions), prefix='dir')], axis=1)
+        X = X.reindex(columns=feature_columns, fill_value=-100)
+        dir_cols = [col for col in feature_columns if col.startswith('dir_')]
+        X[dir_cols] = X[dir_cols].replace(-100, 0)
+
+        cells = dense_map.nearest_cells()
+        y = pd.Series(cells[:, 0].astype(str)) + '_' + pd.Series(cells[:, 1].astype(str))
+        known = y.isin(set(labels)).to_numpy()
+        return X[known].reset_index(drop=True), y[known].reset_index(drop=True)
+
+    DEFAULT_PARAMS = {'objective': 'multiclass', 'n_estimators': 200, 'random_state': 42}
+    # 방향별 모델은 한 방향 데이터(1/4)만 학습하므로 더 작은 모델로 충분합니다.
+    HEADING_PARAMS = {'n_estimators': 100, 'num_leaves': 15}
+    # 방향별 모델을 쓸 때 predict()의 기본 레이블 히스테리시스 (확률 차이)
+    HEADING_SWITCH_MARGIN = 0.2
+
+    def train(self, db_path="fingerprint_db_4dir.json", test_size=0.3, dense_map=None, sparse=False, params=None,
+              temporal_windows=None, heading=None):
+        """
+        데이터를 불러와 LightGBM 분류 모델을 학습하고 정확도를 평가합니다.
+        test_size: None이면 검증 분할 없이 전체 데이터로 학습합니다. (train_pipeline.py의 최종 학습)
+        params: DEFAULT_PARAMS를 덮어쓸 LGBMClassifier 파라미터 (train_pipeline.py의 탐색 결과)
+        dense_map: 고밀도 가상 핑거프린트 (DenseRadioMap 또는 .npz 경로). 주어지면 학습 세트에만 추가하고
+                   검증은 실제 측정 데이터로만 합니다.
+        sparse: True이면 희소 CSR 피처(RSSI + 100, 미수신 = 0)로 학습합니다. 비콘이 많은 배치용이며
+                0과 -100은 트리 분할에서 같은 순서를 가지므로 조밀 피처와 같은 모델 구조가 됩니다.
+        temporal_windows: 예) (5, 20). 주어지면 비콘별 최근 w 라운드의 평균/표준편차/최소/최대/기울기와
+                          경과 라운드를 피처로 씁니다. (feature_engine.FeatureEngine, 조밀 피처 전용)
+        heading: 예) 'N'. 주어지면 그 방향의 레코드만으로 dir_ 열 없이 학습합니다. (train_heading_models)
+        반환: 검증 정확도 (test_size가 None이거나 학습하지 못했으면 None)
+        """
+        import pandas as pd
+        from scipy import sparse as sp
+        from sklearn.metrics import accuracy_score
+        from sklearn.model_selection import train_test_split
+
+        if temporal_windows and (sparse or dense_map is not None):
+            print("오류: 시계열 피처는 희소 피처나 가상 핑거프린트(dense_map)와 함께 쓸 수 없습니다.")
+            return
+        if heading is not None and (sparse or dense_map is not None):
+            print("오류: 방향별 모델은 희소 피처나 가상 핑거프린트(dense_map)와 함께 쓸 수 없습니다.")
+            return
+        self.heading_models = None
+        self.feature_engine = {'windows': list(temporal_windows)} if temporal_windows else None
+
+        if sparse:
+            X, self.feature_columns, y = self._prepare_sparse_data(db_path)
+            self.feature_encoding = 'shifted_sparse'
+        else:
+            X, y = self._prepare_data(db_path, self.feature_engine)
+            self.feature_encoding = 'dense'
         if X is None:
             return
+        if heading is not None:
+            if f"dir_{heading}" not in X:
+                print(f"오류: '{heading}' 방향의 레코드가 없습니다.")
+                return
+            rows = (X[f"dir_{heading}"] == 1).to_numpy()
+            X = X.loc[rows, [col for col in X.columns if not col.startswith('dir_')]].reset_index(drop=True)
+            y = y[rows].reset_index(drop=True)
 
         # 학습에 사용된 최종 피처 컬럼들을 저장합니다. (원-핫 인코딩 포함)
-        self.feature_columns = X.columns.tolist()
+        if not sparse:
+            self.feature_columns = X.columns.tolist()
 
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=test_size, random_state=42, stratify=y
-        )
+        if test_size is None:
+            X_train, X_test, y_train, y_test = X, None, y, None
+        else:
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=test_size, random_state=42, stratify=y
+            )
+
+        if dense_map is not None:
+            if isinstance(dense_map, str):
+                from densify import DenseRadioMap
+                dense_map = DenseRadioMap.load(dense_map)
+            X_dense, y_dense = self._prepare_dense_data(dense_map, self.feature_columns, y.unique())
+            if sparse:
+                X_train = sp.vstack([X_train, self._to_shifted_sparse(X_dense)], format='csr')
+            else:
+                X_train = pd.concat([X_train, X_dense], ignore_index=True)
+            y_train = pd.concat([y_train, y_dense], ignore_index=True)
+            print(f"가상 핑거프린트 {len(X_dense)}개를 학습 데이터에 추가했습니다.")
 
         print("분류 모델 학습을 시작합니다...")
         
-        self.model = lgb.LGBMClassifier(objective='multiclass', n_estimators=200, random_state=42)
-        self.model.fit(X_train, y_train)
+        self.fit(X_train, y_train, params)
         print("위치 분류 모델 학습 완료.")
-        
+        if X_test is None:
+            return
+
         y_pred = self.model.predict(X_test)
         accuracy = accuracy_score(y_test, y_pred)
         print(f"✅ 모델 검증 정확도: {accuracy:.4f}")
+        return accuracy
+
+    def fit(self, X, y, params=None):
+        """
+        이미 만든 피처로 학습합니다. (train, evaluate.py의 폴드별 학습)
+        X: _prepare_data 형식 DataFrame (열 이름이 feature_columns가 됨) 또는 feature_columns를 미리 정한 CSR 행렬
+        """
+        import lightgbm as lgb
+
+        if hasattr(X, 'columns'):
+            self.feature_columns = X.columns.tolist()
+        self.heading_models = None
+        self.model = lgb.LGBMClassifier(**{**self.DEFAULT_PARAMS, **(params or {})})
+        self.model.fit(X, y)
+        self.forest = None
+        self._compile_layout()
+
+    def use_compiled(self):
+        """학습된 부스터를 메모리에서 CompiledForest로 바꿉니다. (.npz를 불러온 것과 같은 실시간 예측 경로)"""
+        if self.model is None:
+            print("오류: 변환할 모델이 없습니다.")
+            return None
+        self.forest = CompiledForest.from_booster(self.model.booster_, self.model.classes_,
+                                                  self.feature_columns, self.feature_encoding, self.feature_engine)
+        self.model = None
+        self._compile_layout()
+        return self.forest
+
+    def train_heading_models(self, db_path="fingerprint_db_4dir.json", prefix="lgbm_predictor", params=None,
+                             test_size=0.3):
+        """
+        방향마다 작은 모델(HEADING_PARAMS)을 따로 학습해 '{prefix}_{방향}.npz'로 내보내고,
+        목록 파일 '{prefix}_headings.json'을 만듭니다. load_model()에 목록 파일을 주면 방향별 모델을 씁니다.
+        반환: 목록 파일 경로 (학습한 방향이 없으면 None)
+        """
+        try:
+            headings = sorted(read_record_store(db_path).direction_labels)
+        except FileNotFoundError:
+            print(f"오류: '{db_path}' 파일을 찾을 수 없습니다.")
+            return None
+
+        models, accuracy, classes = {}, {}, set()
+        for heading in headings:
+            print(f"--- '{heading}' 방향 모델 ---")
+            sub = LGBM_Classifier_Predictor()
+            accuracy[heading] = sub.train(db_path, test_size, params={**self.HEADING_PARAMS, **(params or {})},
+                                          heading=heading)
+            if sub.model is None:
+                continue
+            path = f"{prefix}_{heading}.npz"
+            sub.export_compiled(path)
+            models[heading] = os.path.basename(path)
+            classes.update(str(c) for c in sub.classes)
+        if not models:
+            return None
+
+        manifest_path = f"{prefix}_headings.json"
+        manifest = {'headings': models, 'classes': sorted(classes), 'accuracy': accuracy}
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=4, ensure_ascii=False)
+        print(f"✅ 방향별 모델 목록이 '{manifest_path}' 파일로 저장되었습니다.")
+        self._use_heading_models(manifest, os.path.dirname(manifest_path))
+        return manifest_path
+
+    def _use_heading_models(self, manifest, base_dir):
+        """방향별 모델 목록을 등록합니다. 각 모델 파일은 그 방향이 처음 필요할 때 불러옵니다."""
+        self.heading_models = {h: os.path.join(base_dir, path) for h, path in manifest['headings'].items()}
+        self._heading_predictors, self._heading_columns = {}, {}
+        self.classes = np.array(manifest['classes'])
+        self.model = self.forest = self.feature_columns = self.feature_engine = None
+        self._proba = None
+        self.switch_margin = self.HEADING_SWITCH_MARGIN
+        self._last_index = None
+        self.model_version += 1
+
+    def _compile_layout(self):
+        """
+        feature_columns로부터 실시간 예측용 피처 배치를 미리 계산합니다. (train / load_model 시점에 한 번)
+        MAC과 방향을 바로 열 번호로 찾고, 재사용 버퍼에 값을 써서 DataFrame 없이 부스터를 호출합니다.
+        """
+        self.model_version += 1
+        self._rssi_offset = -RecordStore.MISSING_RSSI if self.feature_encoding == 'shifted_sparse' else 0.0
+        self._slots, self._direction_slots = {}, {}
+        self._template = np.empty(len(self.feature_columns))
+        for j, col in enumerate(self.feature_columns):
+            if col.startswith('dir_'):
+                self._direction_slots[col[len('dir_'):]] = j
+                self._template[j] = 0.0
+            else:
+                self._slots[col] = j
+                self._slots[col.replace('_', ':')] = j
+                self._template[j] = RecordStore.MISSING_RSSI + self._rssi_offset
+        self._row = np.empty((1, len(self.feature_columns)))
+        if self.model is not None:
+            self._proba = self.model.booster_.predict
+            self.classes = self.model.classes_
+        else:
+            self._proba = self.forest.predict_proba
+            self.classes = self.forest.classes
+
+    def _fill_row(self, live_rssi_vector, row=None):
+        """실시간 dict를 피처 한 행(기본: 재사용 버퍼)으로 변환합니다. 학습 때 없던 비콘/방향은 무시합니다."""
+        if row is None:
+            row = self._row[0]
+        row[:] = self._template
+        slots = self._slots
+        for key, value in live_rssi_vector.items():
+            if key == 'direction':
+                slot = self._direction_slots.get(value)
+                if slot is not None:
+                    row[slot] = 1.0
+                continue
+            slot = slots.get(key)
+            if slot is not None:
+                row[slot] = value + self._rssi_offset
+        return row
+
+    def make_feature_engine(self):
+        """
+        학습 때와 같은 설정의 FeatureEngine을 만듭니다. 시계열 피처를 쓰지 않는 모델이면 None.
+        실시간 경로에서는 스캔 라운드마다 engine.push()를 호출하고 engine.features()(+ 'direction')를 predict()에 넘깁니다.
+        """
+        return FeatureEngine.from_config(self.feature_engine) if self.feature_engine else None
+
+    def _heading_predictor(self, heading):
+        sub = self._heading_predictors.get(heading)
+        if sub is None:
+            sub = LGBM_Classifier_Predictor()
+            if not sub.load_model(self.heading_models[heading]):
+                return None
+            index = {c: i for i, c in enumerate(self.classes)}
+            self._heading_columns[heading] = np.array([index[str(c)] for c in sub.classes])
+            self._heading_predictors[heading] = sub
+        return sub
+
+    def _blend_proba(self, live_rssi_vector):
+        """
+        방향별 모델의 확률을 섞습니다. 'yaw'가 있으면 가장 가까운 두 방향 모델을 각도 거리로 가중 평균하므로
+        방향 경계(45°, 135°, ...)를 지나도 확률이 연속적으로 바뀝니다. 'yaw'가 없으면 'direction' 모델만 씁니다.
+        """
+        yaw = live_rssi_vector.get('yaw')
+        weights = heading_weights(yaw) if yaw is not None else [(live_rssi_vector.get('direction'), 1.0)]
+        proba, total = np.zeros(len(self.classes)), 0.0
+        for heading, weight in weights:
+            if weight <= 0 or heading not in self.heading_models:
+                continue
+            sub = self._heading_predictor(heading)
+            if sub is None:
+                continue
+            proba[self._heading_columns[heading]] += weight * sub.predict_proba(live_rssi_vector)
+            total += weight
+        if total == 0:
+            print("오류: 방향별 모델에는 'yaw' 또는 학습된 'direction'이 필요합니다.")
+            return None
+        return proba / total
+
+    def predict_proba(self, live_rssi_vector):
+        """실시간 RSSI 벡터의 위치 레이블별 확률 (self.classes 순서). 재사용 버퍼를 쓰므로 스레드 간에 공유하지 마세요."""
+        if self.heading_models is not None:
+            return self._blend_proba(live_rssi_vector)
+        if self._proba is None:
+            print("오류: 모델이 학습되지 않았습니다. train() 또는 load_model()을 먼저 호출하세요.")
+            return None
+        self._fill_row(live_rssi_vector)
+        return self._proba(self._row)[0]
+
+    def enable_cache(self, step_db=1.0, max_size=512):
+        """
+        predict() 앞에 양자화 입력 LRU 캐시를 둡니다. (prediction_cache.PredictionCache)
+        방향('direction')은 키에 그대로 들어가고, 모델을 다시 불러오면 캐시는 자동으로 비워집니다.
+        max_size가 0 이하이면 캐시를 끕니다.
+        """
+        self.cache = PredictionCache(step_db, max_size) if max_size > 0 else None
+        return self.cache
 
     def predict(self, live_rssi_vector):
-        """실시간 RSSI 벡터를 입력받아 위치 레이블(예: '2_2')을 예측합니다."""
-        if self.model is None or self.feature_columns is None:
+        """
+        실시간 RSSI 벡터를 입력받아 위치 레이블(예: '2_2')을 예측합니다.
+        LGBMClassifier.predict와 같이 확률이 가장 큰 클래스를 고르므로 _predict_pandas()와 결과가 같습니다.
+        방향별 모델은 _predict_with_hysteresis()를 거칩니다.
+        """
+        if self.heading_models is not None and self.switch_margin > 0:
+            return self._predict_with_hysteresis(live_rssi_vector)
+        if self.cache is not None and (self._proba is not None or self.heading_models is not None):
+            return self.cache.get_or_compute(self.cache.make_key(live_rssi_vector), self.model_version,
+                                             lambda: self._predict_label(live_rssi_vector))
+        return self._predict_label(live_rssi_vector)
+
+    def _predict_with_hysteresis(self, live_rssi_vector):
+        """
+        직전 예측 레이블보다 switch_margin 이상 확률이 높은 레이블이 나올 때만 레이블을 바꿉니다.
+        yaw 가중 평균으로 확률이 yaw에 대해 연속이므로, 방향 경계에서 yaw가 몇 도 흔들려도 레이블이 튀지 않습니다.
+        (단일 모델은 경계에서 확률 자체가 불연속으로 바뀌므로 이 방식이 통하지 않습니다.)
+        """
+        if self.cache is not None:
+            proba = self.cache.get_or_compute(self.cache.make_key(live_rssi_vector, 'proba'), self.model_version,
+                                              lambda: self._blend_proba(live_rssi_vector))
+        else:
+            proba = self._blend_proba(live_rssi_vector)
+        if proba is None:
+            return None
+        best, last = int(proba.argmax()), self._last_index
+        if last is not None and best != last and proba[best] < proba[last] + self.switch_margin:
+            best = last
+        self._last_index = best
+        return self.classes[best]
+
+    def _predict_label(self, live_rssi_vector):
+        proba = self.predict_proba(live_rssi_vector)
+        if proba is None:
+            return None
+        return self.classes[int(proba.argmax())]
+
+    def predict_batch(self, live_rssi_vectors):
+        """여러 실시간 dict를 한 번에 예측합니다. (로그 재생, 오프라인 평가용) 반환: (레이블 배열, 확률 행렬)"""
+        if self.heading_models is not None:
+            proba = np.array([self._blend_proba(v) for v in live_rssi_vectors])
+            return self.classes[proba.argmax(axis=1)], proba
+        if self._proba is None:
             print("오류: 모델이 학습되지 않았습니다. train() 또는 load_model()을 먼저 호출하세요.")
+            return None, None
+        X = np.empty((len(live_rssi_vectors), len(self.feature_columns)))
+        for row, live_rssi_vector in zip(X, live_rssi_vectors):
+            self._fill_row(live_rssi_vector, row)
+        proba = self._proba(X)
+        return self.classes[proba.argmax(axis=1)], proba
+
+    def feature_matrix(self, db_path):
+        """DB 레코드를 현재 모델의 피처 열 순서 행렬로 변환합니다. 반환: (피처 행렬, 레이블 배열)"""
+        X, y = self._prepare_data(db_path, dict(self.feature_engine) if self.feature_engine else None)
+        if X is None:
+            return None, None
+        X = X.reindex(columns=self.feature_columns, fill_value=RecordStore.MISSING_RSSI)
+        values = X.to_numpy(dtype=np.float64)
+        for j, col in enumerate(self.feature_columns):
+            if col.startswith('dir_'):
+                values[values[:, j] == RecordStore.MISSING_RSSI, j] = 0.0
+            else:
+                values[:, j] += self._rssi_offset
+        return values, y.to_numpy()
+
+    @staticmethod
+    def holdout_rows(y, test_size=None):
+        """train()과 같은 분할(random_state=42, 레이블 층화)에서 검증 몫의 행 번호. test_size가 None이면 전체."""
+        if test_size is None:
+            return np.arange(len(y))
+        from sklearn.model_selection import train_test_split
+        return np.sort(train_test_split(np.arange(len(y)), test_size=test_size, random_state=42, stratify=y)[1])
+
+    def score(self, db_path, test_size=None):
+        """
+        DB 레코드에 대한 위치 분류 정확도. (재학습 모델 검증용, model_watcher.py)
+        test_size를 주면 train(db_path, test_size)이 학습에서 뺀 검증 몫만으로 평가합니다.
+        """
+        if self.heading_models is not None:
+            records = [r for r in read_record_store(db_path).to_records() if len(r['pos']) >= 3]
+            truth = np.array([f"{r['pos'][0]}_{r['pos'][1]}" for r in records])
+            rows = self.holdout_rows(truth, test_size)
+            labels, _ = self.predict_batch([{**records[i]['rssi'], 'direction': records[i]['pos'][2]} for i in rows])
+            return float(np.mean(labels == truth[rows]))
+        X, y = self.feature_matrix(db_path)
+        if X is None:
             return None
+        rows = self.holdout_rows(y, test_size)
+        return float((self.classes[self._proba(X[rows]).argmax(axis=1)] == y[rows]).mean())
+
+    def _predict_pandas(self, live_rssi_vector):
+        """기존 DataFrame 기반 예측 경로. (lgbm_benchmark.py의 비교 기준, .pkl 모델 전용)"""
+        import pandas as pd
 
         # 1. 실시간 데이터를 DataFrame으로 변환하고 컬럼명을 학습 데이터와 맞게 수정
         sanitized_live_data = {k.replace(':', '_'): v for k, v in live_rssi_vector.items()}
@@ -86,7 +495,8 @@ class LGBM_Classifier_Predictor:
 
         ## [수정] Pandas의 get_dummies와 reindex를 함께 사용하여 전처리 과정을 자동화하고 단순화합니다.
         # 2. 'direction' 컬럼을 원-핫 인코딩 처리
-        live_df = pd.get_dummies(live_df)
+        #    학습 피처와 같은 'dir_' 접두사를 써야 합니다. (기본 접두사 'direction_'이면 방향이 항상 0이 됩니다)
+        live_df = pd.get_dummies(live_df, prefix={'direction': 'dir'} if 'direction' in live_df else None)
 
         # 3. 학습된 전체 피처 컬럼 순서에 맞게 DataFrame을 재구성합니다.
         #    - live_df에 없는 컬럼은 새로 추가되고 fill_value로 채워집니다. (예: 잡히지 않은 비콘, 다른 방향)
@@ -96,14 +506,31 @@ class LGBM_Classifier_Predictor:
         # 4. dir_ 컬럼들의 fill_value가 -100이 아닌 0이 되도록 수정
         dir_cols = [col for col in self.feature_columns if col.startswith('dir_')]
         live_df_aligned[dir_cols] = live_df_aligned[dir_cols].replace(-100, 0)
+        if self.feature_encoding == 'shifted_sparse':
+            beacon_cols = [col for col in self.feature_columns if not col.startswith('dir_')]
+            live_df_aligned[beacon_cols] = live_df_aligned[beacon_cols] + self._rssi_offset
 
         # 5. 예측 수행
-        predicted_label = self.model.predict(live_df_aligned)[0]
+        return self.model.predict(live_df_aligned)[0]
 
-        return predicted_label
+    def export_compiled(self, path="lgbm_predictor.npz"):
+        """
+        학습된 부스터를 NumPy 트리 평가기(.npz)로 내보냅니다.
+        load_model()에 .npz 경로를 주면 lightgbm/pandas/sklearn 없이 밀리초 단위로 불러와 같은 확률을 계산합니다.
+        """
+        if self.model is None:
+            print("오류: 내보낼 모델이 없습니다.")
+            return None
+        forest = CompiledForest.from_booster(self.model.booster_, self.model.classes_,
+                                             self.feature_columns, self.feature_encoding, self.feature_engine)
+        forest.save(path)
+        print(f"✅ 컴파일된 모델이 '{path}' 파일로 저장되었습니다.")
+        return forest
 
     def save_model(self, path="lgbm_predictor.pkl"):
         """학습된 모델과 피처 정보를 파일에 저장합니다."""
+        import joblib
+
         if self.model is None:
             print("오류: 저장할 모델이 없습니다.")
             return
@@ -111,29 +538,79 @@ class LGBM_Classifier_Predictor:
         ## [수정] 꼭 필요한 정보(모델, 피처 컬럼)만 저장하도록 단순화
         model_data = {
             'model': self.model,
-            'feature_columns': self.feature_columns
+            'feature_columns': self.feature_columns,
+            'feature_encoding': self.feature_encoding,
+            'feature_engine': self.feature_engine
         }
         joblib.dump(model_data, path)
         print(f"✅ 모델이 '{path}' 파일로 저장되었습니다.")
 
     def load_model(self, path="lgbm_predictor.pkl"):
-        """파일에서 모델과 피처 정보를 불러옵니다."""
+        """
+        파일에서 모델과 피처 정보를 불러옵니다. .npz(export_compiled 결과)면 lightgbm 없이 불러옵니다.
+        .json(train_heading_models 목록)이면 방향별 모델을 등록하고 각 모델은 처음 쓰일 때 불러옵니다.
+        """
         try:
+            if path.endswith('.json'):
+                with open(path) as f:
+                    self._use_heading_models(json.load(f), os.path.dirname(path))
+                print(f"✅ '{path}' 파일에서 방향별 모델 {len(self.heading_models)}개를 등록했습니다.")
+                return True
+
+            if path.endswith('.npz'):
+                self.forest = CompiledForest.load(path)
+                self.model = None
+                self.heading_models = None
+                self.feature_columns = self.forest.feature_columns
+                self.feature_encoding = self.forest.feature_encoding
+                self.feature_engine = self.forest.feature_engine
+                self._compile_layout()
+                print(f"✅ '{path}' 파일에서 컴파일된 모델을 불러왔습니다.")
+                return True
+
+            import joblib
             model_data = joblib.load(path)
+            self.forest = None
+            self.heading_models = None
             self.model = model_data['model']
             self.feature_columns = model_data['feature_columns']
+            self.feature_encoding = model_data.get('feature_encoding', 'dense')
+            self.feature_engine = model_data.get('feature_engine')
+            self._compile_layout()
             print(f"✅ '{path}' 파일에서 모델을 성공적으로 불러왔습니다.")
             return True
         except FileNotFoundError:
             print(f"오류: '{path}' 파일을 찾을 수 없습니다. train()을 먼저 실행하세요.")
             return False
 
+    def load_default_model(self, path="lgbm_predictor.pkl", compiled_path="lgbm_predictor.npz"):
+        """
+        기본 모델을 불러옵니다. .npz는 빌드 산출물이라 저장소에 두지 않고 여기서 .pkl로부터 만듭니다.
+        .npz가 없거나 .pkl보다 오래되었으면 .pkl을 불러와 컴파일하고 .npz로 내보냅니다. (다음 실행부터는 .npz만 읽음)
+        반환: 실제로 쓴 모델 경로, 불러오지 못하면 None
+        """
+        if os.path.exists(compiled_path) and (not os.path.exists(path)
+                                              or os.path.getmtime(compiled_path) >= os.path.getmtime(path)):
+            return compiled_path if self.load_model(compiled_path) else None
+        if not self.load_model(path):
+            return None
+        try:
+            forest = self.use_compiled()
+        except ValueError as e:
+            # 범주형 분할, 큰 num_leaves 등 컴파일할 수 없는 모델은 부스터로 그대로 예측합니다.
+            print(f"⚠️ '{path}' 모델을 컴파일하지 못해 그대로 씁니다: {e}")
+            return path
+        forest.save(compiled_path)
+        print(f"✅ 컴파일된 모델이 '{compiled_path}' 파일로 저장되었습니다.")
+        return compiled_path
+
 if __name__ == '__main__':
     # --- 1. 모델 학습 후 저장 (최초 한 번만 실행) ---
     print("--- 모델 학습 및 저장 단계 ---")
     predictor_trainer = LGBM_Classifier_Predictor()
     predictor_trainer.train()
     predictor_trainer.save_model()
+    predictor_trainer.export_compiled()
     print("-" * 30)
 
 
@@ -1,4 +1,3 @@
-import joblib
 import sys
 import serial
 import time
@@ -10,8 +9,10 @@ from PyQt5.QtGui import QKeySequence, QColor
 
 # --- 모듈 임포트 ---
 from app_config import load_config
-from fingerprinting import FingerprintDB
-from trilateration import EKF
+from fingerprinting import FingerprintDB, direction_from_yaw
+from particle_filter import ParticleFilter, make_fusion_engine
+from hmm_localizer import GridHMM
+from event_fusion import EventFusion
 from ble_scanner import BLEScanThread
 from map_viewer import MapViewer
 from serial_reader import SerialReader
@@ -20,6 +21,8 @@ from bin import create_binary_map
 from Astar import find_path, create_distance_map
 from robot_tracker import RobotTrackerThread
 from lgbm_predictor import LGBM_Classifier_Predictor
+from feature_engine import RoundAssembler
+from model_watcher import ModelWatcherThread
 
 # --- UDP 수신 스레드 클래스 ---
 class UDPReceiverThread(QThread):
@@ -79,14 +82,36 @@ class IndoorPositioningApp(QWidget):
             self.distance_map = np.array(dist_map_as_list)
         else:
             self.close()
-        self.ekf = EKF(self.config.get('ekf_dt', 1.0))
+        # 위치 융합 엔진: config의 fusion_engine.type이 'particle'이면 지도 제약 파티클 필터, 아니면 EKF.
+        # 둘 다 predict / update / get_state를 같은 모양으로 제공하므로 아래 코드는 self.ekf로 그대로 씁니다.
+        self.ekf = make_fusion_engine(self.config, self.binary_grid, self.BLOCK_SIZE)
+        self.class_positions = (None, None)
+        # 시각 기준 융합: 센서 스레드에서 찍은 시각 순서대로, 실제 경과 시간으로 엔진을 갱신합니다. (늦은 BLE 측정은 되돌려 다시 적용)
+        fusion_cfg = self.config.get('event_fusion') or {}
+        self.event_fusion = EventFusion(self.ekf, fusion_cfg.get('reorder_delay', 0.15), fusion_cfg.get('history', 3.0),
+                                        fusion_cfg.get('max_dt', 1.0)) if fusion_cfg.get('enabled', False) else None
+        self.fusion_timer = QTimer(self)
+        self.ble_timestamp = None
 
         # LGBM Predictor 객체를 먼저 생성하고,
         # 그 객체의 load_model 메소드를 통해 모델과 전처리 정보를 모두 불러옵니다.
+        # 기본 모델은 .pkl을 컴파일한 .npz로 불러옵니다. (처음 한 번 내보낸 뒤로는 lightgbm/pandas 없이 NumPy만 사용)
         self.lgbm_predictor = LGBM_Classifier_Predictor()
-        if not self.lgbm_predictor.load_model('lgbm_predictor.pkl'):
+        # config의 lgbm_model로 방향별 모델 목록(.json, train_heading_models)을 지정할 수 있습니다.
+        model_path = self.config.get('lgbm_model')
+        if model_path:
+            loaded = self.lgbm_predictor.load_model(model_path)
+        else:
+            model_path = self.lgbm_predictor.load_default_model()
+            loaded = model_path is not None
+        if not loaded:
             # load_model()이 파일을 못찾는 등 실패하면(False 반환), lgbm_predictor를 None으로 설정합니다.
             self.lgbm_predictor = None
+        else:
+            # 제자리/저속 보행 중 같은 양자화 입력이 반복되면 이전 예측을 그대로 씁니다.
+            cache_cfg = self.config.get('prediction_cache') or {}
+            self.lgbm_predictor.enable_cache(cache_cfg.get('step_db', 1.0), cache_cfg.get('max_size', 0))
+        self._reset_feature_engine()
 
         self.ble_scanner_thread = BLEScanThread(self.config)
         try:
@@ -98,6 +123,11 @@ class IndoorPositioningApp(QWidget):
 
         self.robot_tracker = RobotTrackerThread(port=self.config.get('robot_udp_port', 5005))
 
+        # 재측정한 DB나 새 모델 파일이 생기면 백그라운드에서 학습/검증 후 lgbm_predictor를 교체합니다.
+        watch_cfg = self.config.get('model_watcher') or {}
+        self.model_watcher = (ModelWatcherThread(self.config, model_path if self.lgbm_predictor else None)
+                              if watch_cfg.get('enabled', False) else None)
+
     def _init_ui(self):
         self.toast_label = QLabel(self); self.toast_label.setObjectName("Toast"); self.toast_label.setAlignment(Qt.AlignCenter); self.toast_label.hide()
 
@@ -169,11 +199,19 @@ class IndoorPositioningApp(QWidget):
         self.setWindowTitle("ODIGA"); self.setFocusPolicy(Qt.StrongFocus); self.load_stylesheet('stylesheet.qss'); self.showFullScreen(); self.setFocus()
 
     def _connect_signals(self):
-        self.ble_scanner_thread.detected.connect(self._on_ble_device_detected)
+        if self.event_fusion:
+            # 수신 시각이 붙은 시그널을 받아 EventFusion에 넣고, fusion_timer마다 시각 순서로 처리합니다.
+            self.ble_scanner_thread.detected_at.connect(self._on_ble_detected_at)
+            if self.serial_reader:
+                self.serial_reader.heading_received_at.connect(self._on_yaw_at)
+                self.serial_reader.speed_received_at.connect(self._on_speed_at)
+            self.fusion_timer.timeout.connect(self._on_fusion_tick)
+        else:
+            self.ble_scanner_thread.detected.connect(self._on_ble_device_detected)
 
-        if self.serial_reader:
-            self.serial_reader.heading_received.connect(self._on_yaw_update)
-            self.serial_reader.speed_received.connect(self._on_speed_update)
+            if self.serial_reader:
+                self.serial_reader.heading_received.connect(self._on_yaw_update)
+                self.serial_reader.speed_received.connect(self._on_speed_update)
         self.nav_btn.clicked.connect(self._show_selection_dialog)
         self.robot_btn.clicked.connect(self._on_robot_call_clicked)
         self.stop_call_btn.clicked.connect(self._on_robot_call_stop_clicked)
@@ -184,7 +222,14 @@ class IndoorPositioningApp(QWidget):
         self.udp_send_timer.timeout.connect(self._send_position_udp)
         self.udp_destination_timer.timeout.connect(self._send_destination_udp)
         self.udp_receiver.message_received.connect(self._on_robot_message_received)
-        self.robot_tracker.robot_position_updated.connect(self._on_robot_position_update)
+        if self.event_fusion:
+            self.robot_tracker.robot_position_updated_at.connect(
+                lambda px, py, t: self.event_fusion.push(t, 'robot', px, py))
+        else:
+            self.robot_tracker.robot_position_updated.connect(self._on_robot_position_update)
+        if self.model_watcher:
+            self.model_watcher.model_ready.connect(self._on_model_ready)
+            self.model_watcher.status.connect(print)
 
         # 벽 회피 타이머의 timeout 신호를 _apply_wall_avoidance 메서드에 연결
         self.wall_avoidance_timer.timeout.connect(self._apply_wall_avoidance)
@@ -209,6 +254,10 @@ class IndoorPositioningApp(QWidget):
                     pts_pixels_qpoint.y() * 19 / px_per_m_y
                 ])
                 print(f"수동 설정 pts_meters: {pts_meters}" )
+                if self.event_fusion:
+                    # 융합 엔진은 시각 순서 이벤트로만 바꿉니다 (직접 고치면 늦은 측정을 되돌릴 때 사라짐).
+                    self.event_fusion.push(time.monotonic(), 'position', pts_meters)
+                    return
                 self.ekf.update(pts_meters)
                 self.fused_pos = self.ekf.get_state()[:2].flatten()
                 self.map_viewer.mark_estimated_position(*self.fused_pos, self.current_yaw)
@@ -218,6 +267,10 @@ class IndoorPositioningApp(QWidget):
         
         elif event.key() in [Qt.Key_Return, Qt.Key_Enter]:
             #print("엔터 키 입력 감지. 걸음 발생을 시뮬레이션합니다 (EKF predict).")
+            if self.event_fusion:
+                # 시각 기준 융합에서는 지금 시각의 속도 이벤트로 넣어, 마지막 이벤트부터 실제 경과 시간만큼 예측합니다.
+                self.event_fusion.push(time.monotonic(), 'speed', self.current_speed)
+                return
             # _on_speed_update는 EKF predict, 위치 업데이트, 경로 재계산을 수행합니다.
             self._on_speed_update(self.current_speed)
             # predict 이후 변경된 위치를 지도에 시각적으로 반영합니다.
@@ -227,8 +280,12 @@ class IndoorPositioningApp(QWidget):
 
     def _start_timers(self):
         self.rssi_clear_timer = QTimer(self); self.rssi_clear_timer.timeout.connect(self._clear_rssi_cache); self.rssi_clear_timer.start(2000)
+        self.feature_round_timer = QTimer(self); self.feature_round_timer.timeout.connect(self._on_feature_round_timer)
+        self.feature_round_timer.start(int(self.config.get('feature_round_timeout', 1.0) * 250))
         self.udp_receiver.start()
         self.robot_tracker.start()
+        if self.model_watcher: self.model_watcher.start()
+        if self.event_fusion: self.fusion_timer.start((self.config.get('event_fusion') or {}).get('process_interval_ms', 20))
 
     # --- [수정됨] ---
     def _on_robot_position_update(self, px, py):
@@ -303,15 +360,8 @@ class IndoorPositioningApp(QWidget):
         self.map_viewer.draw_path(path_pixels)
 
     def _get_direction_from_yaw(self, yaw):
-        """Yaw 각도를 N, E, S, W 방향으로 변환합니다."""
-        if 45 <= yaw < 135:
-            return 'S'
-        elif 135 <= yaw < 225:
-            return 'W'
-        elif 225 <= yaw < 315:
-            return 'N'
-        else: # 315 <= yaw or yaw < 45
-            return 'E'
+        """Yaw 각도를 N, E, S, W 방향으로 변환합니다. (FingerprintDB의 방향 파티션과 같은 규칙)"""
+        return direction_from_yaw(yaw)
 
     def _on_ble_device_detected(self, rssi_vec):
         self.rssi_mutex.lock()
@@ -319,15 +369,42 @@ class IndoorPositioningApp(QWidget):
         local_rssi_copy = self.rssi_data.copy()
         self.rssi_mutex.unlock()
 
-        if len(local_rssi_copy) >= 6:
+        # 시계열 피처 모델은 라운드 조립기가 예측 시점을 정합니다 (비콘이 빠진 라운드도 시간이 지나면 예측).
+        if len(local_rssi_copy) >= 6 or self.feature_engine is not None:
             if self.lgbm_predictor:
                 try:
                     # 1. IMU 센서에서 받은 Yaw 값으로 현재 방향('N' 등)을 결정합니다.
                     direction = self._get_direction_from_yaw(self.current_yaw)
-                    local_rssi_copy['direction'] = direction
+
+                    # 시계열 피처 모델이면 스캔 라운드(등록된 비콘이 모두 수신)가 끝날 때마다 한 번 예측합니다.
+                    if self.feature_engine is not None:
+                        model_input = self._push_feature_round(rssi_vec)
+                        if model_input is None:
+                            return
+                    else:
+                        model_input = local_rssi_copy
+                    model_input['direction'] = direction
+                    if self.lgbm_predictor.heading_models is not None:
+                        # 방향별 모델은 yaw에 가까운 두 방향 모델의 확률을 각도 거리로 섞어 경계에서도 연속적으로 예측합니다.
+                        model_input['yaw'] = self.current_yaw
+
+                    if isinstance(self.ekf, (ParticleFilter, GridHMM)):
+                        # 파티클 필터 / 격자 HMM은 1순위 셀 하나 대신 모든 셀의 확률을 반영하고, 벽은 엔진 안에서 처리합니다.
+                        # (현재 그리드와 다르다고 예측을 버리지 않으므로 위치가 틀어져도 다음 예측들로 회복합니다.)
+                        proba = self.lgbm_predictor.predict_proba(model_input)
+                        if proba is None:
+                            return
+                        if self.event_fusion:
+                            self.event_fusion.push(self.ble_timestamp, 'proba', proba, self._class_positions())
+                            return
+                        self.ekf.update_proba(proba, self._class_positions())
+                        self.fused_pos = self.ekf.get_state()[:2].flatten()
+                        self.map_viewer.mark_estimated_position(*self.fused_pos, self.current_yaw)
+                        self._update_navigation_path()
+                        return
 
                     # 2. Predictor 객체의 predict 메소드를 호출합니다. (내부에서 모든 전처리 수행)
-                    predicted_label = self.lgbm_predictor.predict(local_rssi_copy)
+                    predicted_label = self.lgbm_predictor.predict(model_input)
 
                     # 3. 예측된 레이블('x_y')을 좌표로 변환합니다.
                     x_str, y_str = predicted_label.split('_')
@@ -353,6 +430,9 @@ class IndoorPositioningApp(QWidget):
                         pts_pixels_qpoint.x() / px_per_m_x,
                         pts_pixels_qpoint.y() / px_per_m_y
                     ])
+                    if self.event_fusion:
+                        self.event_fusion.push(self.ble_timestamp, 'position', pts_meters)
+                        return
                     self.ekf.update(pts_meters)
 
                     self.fused_pos = self.ekf.get_state()[:2].flatten()
@@ -364,6 +444,48 @@ class IndoorPositioningApp(QWidget):
                     print(f"LGBM 예측 중 오류 발생: {e}")
 
 
+    def _class_positions(self):
+        """현재 모델의 클래스 레이블('x_y')별 셀 중심 (m). 아래 LGBM 경로의 grid_to_pixels / px_per_m 변환과 같습니다."""
+        classes = self.lgbm_predictor.classes
+        if self.class_positions[0] is not classes:
+            grids = [tuple(int(v) for v in str(label).split('_')) for label in classes]
+            positions = np.array([[(g[1] + 0.5) * self.BLOCK_SIZE / self.config.get('px_per_m_x', 1.0),
+                                   (g[0] + 0.5) * self.BLOCK_SIZE / self.config.get('px_per_m_y', 1.0)] for g in grids])
+            self.class_positions = (classes, positions)
+        return self.class_positions[1]
+
+    def _reset_feature_engine(self):
+        """현재 모델이 시계열 피처를 쓰면 학습 때와 같은 설정의 FeatureEngine과 라운드 조립기를 새로 만듭니다."""
+        self.feature_engine = self.lgbm_predictor.make_feature_engine() if self.lgbm_predictor else None
+        self.feature_rounds = (RoundAssembler(self.feature_engine, self.config.get('feature_round_timeout', 1.0))
+                               if self.feature_engine is not None else None)
+
+    def _push_feature_round(self, rssi_vec):
+        """
+        BLE 콜백 값을 라운드에 모으고, 라운드가 닫히면(모든 비콘 수신 또는 시간 초과) 피처 dict를 반환합니다.
+        시간 초과로 닫힌 라운드의 못 받은 비콘은 학습 때처럼 미수신(-100)으로 들어갑니다.
+        """
+        return self.feature_rounds.add(rssi_vec, time.monotonic())
+
+    def _on_feature_round_timer(self):
+        """광고가 끊겨 콜백이 오지 않아도 시간이 지난 라운드를 닫아 예측합니다."""
+        if self.feature_rounds is not None and self.feature_rounds.expired(time.monotonic()):
+            self._on_ble_device_detected({})
+
+    def _on_model_ready(self, predictor, report):
+        """검증을 통과한 새 모델로 교체합니다. GUI 스레드에서 참조만 바꾸므로 진행 중인 예측과 섞이지 않습니다."""
+        old_stats = self.lgbm_predictor.cache.stats() if self.lgbm_predictor and self.lgbm_predictor.cache else None
+        self.lgbm_predictor = predictor
+        self._reset_feature_engine()
+        accuracy = report.get('accuracy')
+        current = report.get('current_accuracy')
+        print(f"🔄 LGBM 모델 교체 완료: '{report['source']}' → '{report['path']}' "
+              f"(검증 정확도 {'-' if accuracy is None else f'{accuracy:.4f}'}, "
+              f"이전 모델 {'-' if current is None else f'{current:.4f}'}, 검증 세트 {report['validation']}, "
+              f"{report['elapsed_s']:.1f}초)")
+        if old_stats:
+            print(f"이전 모델의 예측 캐시 통계: {old_stats}")
+
     def _on_speed_update(self, speed):
         self.current_speed = speed
         self.ekf.predict(self.current_yaw, self.current_speed)
@@ -374,6 +496,30 @@ class IndoorPositioningApp(QWidget):
         self.current_yaw = yaw
         self.map_viewer.move_to(*self.fused_pos, self.current_yaw)
 
+    def _on_ble_detected_at(self, rssi_vec, received_at):
+        # 이 RSSI로 만든 위치 측정은 예측을 마친 시각이 아니라 광고 패킷을 받은 시각으로 융합합니다.
+        self.ble_timestamp = received_at
+        self._on_ble_device_detected(rssi_vec)
+
+    def _on_yaw_at(self, yaw, received_at):
+        self.event_fusion.push(received_at, 'yaw', yaw)
+        self._on_yaw_update(yaw)
+
+    def _on_speed_at(self, speed, received_at):
+        self.current_speed = speed
+        self.event_fusion.push(received_at, 'speed', speed)
+
+    def _on_fusion_tick(self):
+        """재정렬 대기 시간이 지난 이벤트를 시각 순서로 엔진에 적용하고, 바뀌었으면 위치/경로를 갱신합니다."""
+        robot = self.event_fusion.robot
+        if not self.event_fusion.process():
+            return
+        if self.event_fusion.robot is not robot and self.event_fusion.robot is not None:
+            self._on_robot_position_update(*self.event_fusion.robot[1:])
+        self.fused_pos = self.ekf.get_state()[:2].flatten()
+        self.map_viewer.mark_estimated_position(*self.fused_pos, self.current_yaw)
+        self._update_navigation_path()
+
     def _clear_rssi_cache(self):
         self.rssi_mutex.lock(); self.rssi_data.clear(); self.rssi_mutex.unlock()
 
@@ -508,6 +654,8 @@ class IndoorPositioningApp(QWidget):
             """벽에 가까우면 (1)중심으로 당기고 (2)벽에서 밀어내는 힘을 동시에 적용합니다."""
             if self.fused_pos is None or self.distance_map is None:
                 return
+            if isinstance(self.ekf, (ParticleFilter, GridHMM)):
+                return  # 두 엔진은 벽을 지나는 이동을 predict에서 이미 막으므로 사후 보정이 필요 없습니다.
 
             # --- 보정 로직 실행 여부를 결정하는 부분 (기존 로직 유지) ---
             current_grid = self.meters_to_grid(self.fused_pos)
@@ -558,6 +706,11 @@ class IndoorPositioningApp(QWidget):
             total_correction_m = centering_vector_m + repulsion_vector_m
 
             # 4. fused_pos와 EKF 상태를 동시에 보정합니다.
+            if self.event_fusion:
+                # 시각 기준 융합에서는 보정도 지금 시각의 이벤트로 넣어, 되돌린 뒤 다시 적용할 때도 유지되게 합니다.
+                # (위치/지도 표시는 이벤트가 적용될 때 _on_fusion_tick에서 갱신됩니다.)
+                self.event_fusion.push(time.monotonic(), 'correction', *total_correction_m, 1.2)
+                return
             self.fused_pos += total_correction_m
             try:
                 self.ekf.x[0] = self.fused_pos[0]
@@ -581,6 +734,9 @@ class IndoorPositioningApp(QWidget):
         self.udp_receiver.stop()
         self.ble_scanner_thread.stop()
         if self.serial_reader: self.serial_reader.stop()
+        if self.model_watcher: self.model_watcher.stop()
+        if self.lgbm_predictor and self.lgbm_predictor.cache:
+            print(f"LGBM 예측 캐시 통계: {self.lgbm_predictor.cache.stats()}")
 
         # 프로그램 종료 시 벽 회피 타이머 정지
         if self.wall_avoidance_timer.isActive():
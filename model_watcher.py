@@ -0,0 +1,143 @@
+#핑거프린트 DB/모델 파일 변경을 감시하고 백그라운드 프로세스에서 재학습·검증 후 교체할 모델을 전달하는 스레드 파일.
+
+import os
+import time
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from lgbm_predictor import LGBM_Classifier_Predictor
+from train_pipeline import prepare_candidate
+
+
+class ModelWatcherThread(QThread):
+    """
+    db_path / model_path의 수정 시각을 poll_interval마다 확인합니다.
+    파일이 바뀐 뒤 한 주기 동안 그대로면(복사 중인 파일 제외) 작업 프로세스에서 학습/검증하고,
+    통과한 모델은 이 스레드에서 미리 불러와 model_ready 시그널로 넘깁니다.
+    GUI 스레드는 시그널을 받아 참조만 바꾸므로 이벤트 루프가 막히지 않고 BLE 샘플도 버려지지 않습니다.
+    current_model: 지금 실행 중인 모델 파일. 시작할 때와 교체할 때마다 사본(current_path)을 떠 두고,
+    후보는 항상 이 사본(= 실제로 돌고 있는 모델)과 같은 검증 세트로 비교합니다. 검증하지 못한 후보는 쓰지 않습니다.
+    """
+    model_ready = pyqtSignal(object, dict)  # (새 LGBM_Classifier_Predictor, 검증 보고서)
+    status = pyqtSignal(str)
+
+    def __init__(self, config, current_model=None, parent=None):
+        super().__init__(parent)
+        self.config = config
+        watch_cfg = config.get('model_watcher') or {}
+        self.poll_interval = watch_cfg.get('poll_interval', 5.0)
+        self.db_path = watch_cfg.get('db_path', 'fingerprint_db_4dir.json')
+        self.model_path = watch_cfg.get('model_path', 'lgbm_predictor.npz')
+        self.staging_path = watch_cfg.get('staging_path', 'lgbm_predictor.staging.npz')
+        self.current_path = watch_cfg.get('current_path', 'lgbm_predictor.current')
+        self.current_model = current_model
+        self.validation_db = watch_cfg.get('validation_db')
+        self.holdout = watch_cfg.get('holdout', 0.3)
+        self.min_accuracy = watch_cfg.get('min_accuracy', 0.0)
+        self.tolerance = watch_cfg.get('tolerance', 0.02)
+        self.is_running = True
+        self._seen = {path: self._mtime(path) for path in (self.db_path, self.model_path)}
+        self._changed = {}
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _poll(self):
+        """변경이 확정된 (종류, 경로) 목록. DB 변경을 모델 변경보다 먼저 처리합니다."""
+        ready = []
+        for kind, path in (('db', self.db_path), ('model', self.model_path)):
+            mtime = self._mtime(path)
+            if mtime is None or mtime == self._seen[path]:
+                self._changed.pop(path, None)
+            elif self._changed.get(path) == mtime:
+                ready.append((kind, path))
+            else:
+                self._changed[path] = mtime
+        return ready
+
+    def _accept(self, report):
+        if not report.get('ok'):
+            return False, report.get('error', '알 수 없는 오류')
+        accuracy, current = report['accuracy'], report['current_accuracy']
+        if accuracy is None:
+            return False, "후보 모델을 검증하지 못했습니다"
+        if accuracy < self.min_accuracy:
+            return False, f"검증 정확도 {accuracy:.4f} < 최소 {self.min_accuracy:.4f}"
+        if current is not None and accuracy < current - self.tolerance:
+            return False, f"검증 정확도 {accuracy:.4f}가 현재 모델 {current:.4f}보다 낮습니다"
+        return True, ''
+
+    def _snapshot(self, path, move=False):
+        """
+        실행 중인 모델 파일을 current_path(+ 원래 확장자)로 떠 둡니다. 이후 후보는 이 사본과 비교합니다.
+        방향별 모델 목록(.json)은 개별 모델 파일을 가리키므로 사본 대신 경로를 그대로 씁니다.
+        """
+        if path is None or not os.path.exists(path):
+            self.current_model = None
+            return
+        ext = os.path.splitext(path)[1]
+        if ext == '.json':
+            self.current_model = path
+            return
+        snapshot = self.current_path + ext
+        if move:
+            os.replace(path, snapshot)
+        else:
+            shutil.copyfile(path, snapshot)
+        self.current_model = snapshot
+
+    def _load(self, report):
+        """
+        검증을 통과한 후보를 불러옵니다. DB로 학습한 후보는 model_path로 옮겨 재시작 후에도 쓰이게 합니다.
+        불러온 파일은 다음 비교의 기준(현재 모델 사본)이 됩니다.
+        """
+        path = report['path']
+        if report['kind'] == 'db':
+            os.replace(path, self.model_path)
+            path = self.model_path
+        predictor = LGBM_Classifier_Predictor()
+        if not predictor.load_model(path):
+            return None
+        self._snapshot(path, move=report['kind'] == 'model')
+        cache_cfg = self.config.get('prediction_cache') or {}
+        predictor.enable_cache(cache_cfg.get('step_db', 1.0), cache_cfg.get('max_size', 0))
+        return predictor
+
+    def run(self):
+        # Qt 스레드가 있는 프로세스를 fork하지 않도록 spawn으로 작업 프로세스를 만듭니다.
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        print(f"모델 감시 시작: {self.db_path}, {self.model_path} ({self.poll_interval}초 간격)")
+        self._snapshot(self.current_model)
+        try:
+            while self.is_running:
+                for kind, path in self._poll():
+                    self._seen[path] = self._mtime(path)
+                    self._changed.pop(path, None)
+                    self.status.emit(f"'{path}' 변경 감지. 백그라운드에서 {'재학습' if kind == 'db' else '검증'}합니다.")
+                    future = pool.submit(prepare_candidate, kind, path, self.staging_path, self.current_model,
+                                         self.validation_db, db_path=self.db_path, holdout=self.holdout)
+                    try:
+                        report = future.result()
+                    except Exception as e:
+                        report = {'ok': False, 'error': str(e)}
+                    accepted, reason = self._accept(report)
+                    if not accepted:
+                        self.status.emit(f"⚠️ 새 모델을 적용하지 않았습니다: {reason}")
+                        continue
+                    predictor = self._load(report)
+                    # 방금 교체한 모델 파일을 다시 변경으로 감지하지 않도록 기록합니다.
+                    self._seen[self.model_path] = self._mtime(self.model_path)
+                    if predictor is not None:
+                        self.model_ready.emit(predictor, report)
+                time.sleep(self.poll_interval)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def stop(self): self.is_running = False
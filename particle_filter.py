@@ -0,0 +1,223 @@
+#지도(binary_grid) 제약을 넣은 파티클 필터 파일. EKF 대신 쓸 수 있는 위치 융합 엔진입니다.
+#파티클 N개의 위치/방향을 NumPy 배열로 들고, IMU(yaw, 속도)로 이동 → 벽을 통과한 파티클 제거 → BLE 측위 결과로 가중치 → 계통 리샘플링.
+
+import math
+
+import numpy as np
+
+from trilateration import EKF
+from hmm_localizer import GridHMM
+
+
+class ParticleFilter:
+    """
+    EKF와 같은 predict(imu_yaw, imu_speed) / update(z) / get_state() 인터페이스를 가진 파티클 필터.
+    좌표는 EKF와 같은 미터 단위이고, binary_grid의 한 칸은 cell_size_m (가로, 세로) 미터입니다.
+    """
+    # EKF와 같은 속도 보정 계수
+    speed_scale = 0.65
+
+    def __init__(self, binary_grid, cell_size_m, n_particles=5000, dt=1.0, yaw_noise_deg=10.0, speed_noise=0.2,
+                 position_noise=0.02, measurement_sigma=0.5, resample_threshold=0.5, likelihood_floor=1e-3,
+                 recovery_fraction=0.1, initial_position=None, initial_spread=0.5, seed=None):
+        self.grid = np.asarray(binary_grid, dtype=bool)    # True = 벽
+        self._walls = np.pad(self.grid, 1, constant_values=True).ravel()
+        self.cell_w, self.cell_h = float(cell_size_m[0]), float(cell_size_m[1])
+        self.n = n_particles
+        self.dt = dt
+        self.yaw_noise = math.radians(yaw_noise_deg)
+        self.speed_noise = speed_noise
+        self.position_noise = position_noise
+        self.measurement_sigma = measurement_sigma
+        self.resample_threshold = resample_threshold
+        # 측위 결과가 틀렸을 때 모든 파티클의 가중치가 0이 되지 않도록 섞는 균등 분포 비율
+        self.likelihood_floor = likelihood_floor
+        # 모든 파티클의 우도가 likelihood_floor보다 작으면(위치를 잃음) 이 비율만큼 측정 주변에 다시 뿌립니다.
+        self.recovery_fraction = recovery_fraction
+        self.rng = np.random.default_rng(seed)
+
+        self.pos = np.empty((n_particles, 2))
+        self.theta = np.zeros(n_particles)
+        self.v = np.zeros(n_particles)
+        self.weights = np.full(n_particles, 1.0 / n_particles)
+        self.reset(initial_position, initial_spread)
+
+    @classmethod
+    def from_config(cls, config, binary_grid, block_size):
+        """config.yaml의 fusion_engine 설정과 지도 축척(px_per_m_x/y, 블록 크기)으로 만듭니다."""
+        cfg = config.get('fusion_engine') or {}
+        cell_size_m = (block_size / config['px_per_m_x'], block_size / config['px_per_m_y'])
+        return cls(binary_grid, cell_size_m, n_particles=cfg.get('particles', 5000), dt=config.get('ekf_dt', 1.0),
+                   yaw_noise_deg=cfg.get('yaw_noise_deg', 10.0), speed_noise=cfg.get('speed_noise', 0.2),
+                   position_noise=cfg.get('position_noise', 0.02),
+                   measurement_sigma=cfg.get('measurement_sigma', 0.5),
+                   resample_threshold=cfg.get('resample_threshold', 0.5),
+                   recovery_fraction=cfg.get('recovery_fraction', 0.1),
+                   initial_position=cfg.get('initial_position'), seed=cfg.get('seed'))
+
+    def reset(self, position=None, spread=0.5):
+        """position(m) 주변에 spread 표준편차로, None이면 지도의 길(0) 칸 전체에 고르게 파티클을 뿌립니다."""
+        if position is None:
+            free = np.argwhere(~self.grid)
+            if len(free) == 0:
+                raise ValueError("지도에 길(0) 칸이 없습니다.")
+            cells = free[self.rng.integers(0, len(free), self.n)]
+            self.pos[:, 0] = (cells[:, 1] + self.rng.random(self.n)) * self.cell_w
+            self.pos[:, 1] = (cells[:, 0] + self.rng.random(self.n)) * self.cell_h
+        else:
+            self.pos[:] = np.asarray(position, dtype=np.float64) + self.rng.normal(0, spread, (self.n, 2))
+        self.theta[:] = 0.0
+        self.v[:] = 0.0
+        self.weights[:] = 1.0 / self.n
+
+    def _cells(self, xy):
+        """미터 좌표 (..., 2) → (row, col). main.py의 meters_to_grid와 같은 칸 (지도 밖은 -1)."""
+        col = np.floor(xy[..., 0] / self.cell_w).astype(np.int64)
+        row = np.floor(xy[..., 1] / self.cell_h).astype(np.int64)
+        inside = (row >= 0) & (row < self.grid.shape[0]) & (col >= 0) & (col < self.grid.shape[1])
+        return np.where(inside, row, -1), np.where(inside, col, -1), inside
+
+    def blocked(self, start, end):
+        """
+        각 파티클의 이동 선분 start→end가 벽 칸이나 지도 밖을 지나는지 (N,) bool.
+        가장 긴 이동에 맞춰 반 칸 간격으로 모든 선분을 같은 수의 점으로 나눠 한 번에 검사합니다.
+        지도 둘레에 벽 한 줄을 덧댄 격자(_walls)를 1차원으로 펼쳐 두어, 지도 밖 검사도 인덱스 clip 한 번으로 끝냅니다.
+        """
+        delta = end - start
+        longest = np.max(np.abs(delta) / (self.cell_w, self.cell_h)) if len(delta) else 0.0
+        steps = int(math.ceil(longest * 2)) + 1
+        t = np.arange(1, steps + 1) / steps
+        height, width = self.grid.shape
+        col = np.floor((start[:, 0, None] + t * delta[:, 0, None]) / self.cell_w).astype(np.int64)
+        row = np.floor((start[:, 1, None] + t * delta[:, 1, None]) / self.cell_h).astype(np.int64)
+        np.clip(col, -1, width, out=col)
+        np.clip(row, -1, height, out=row)
+        return self._walls[(row + 1) * (width + 2) + (col + 1)].any(axis=1)
+
+    def predict(self, imu_yaw, imu_speed, dt=None):
+        """
+        IMU yaw(도)와 속도로 모든 파티클을 잡음과 함께 옮기고, 벽을 통과한 파티클의 가중치를 0으로 만듭니다.
+        dt를 주면 self.dt 대신 그 시간만큼 옮기고, 위치 잡음도 sqrt(dt / self.dt)배로 맞춥니다.
+        """
+        n, rng = self.n, self.rng
+        dt = self.dt if dt is None else dt
+        self.theta = math.radians(imu_yaw) + rng.normal(0, self.yaw_noise, n)
+        self.v = np.maximum(imu_speed * self.speed_scale * (1 + rng.normal(0, self.speed_noise, n)), 0.0)
+        step = self.v * dt
+        moved = self.pos + np.column_stack((step * np.cos(self.theta), step * np.sin(self.theta)))
+        moved += rng.normal(0, self.position_noise * math.sqrt(dt / self.dt), (n, 2))
+
+        hit = self.blocked(self.pos, moved)
+        if hit.all() or not self.weights[~hit].any():
+            # 모든 파티클이 벽에 막히면 이번 이동은 버리고 제자리에 둡니다 (IMU 잡음이나 지도 오차로 보고 필터를 살립니다).
+            return
+        self.pos[~hit] = moved[~hit]
+        self.weights[hit] = 0.0
+        self._normalize_and_resample()
+
+    def _lost(self, likelihood):
+        """측정이 모든 파티클에서 멀면(최대 우도 < likelihood_floor) 바닥값 때문에 가중치가 균등해져 회복하지 못하므로 재배치가 필요합니다."""
+        return self.recovery_fraction > 0 and likelihood.max() < self.likelihood_floor
+
+    def _inject(self, centers, probs, sigma):
+        """
+        recovery_fraction만큼의 파티클을 측정 위치(centers 중 probs 비율로 고름) 주변 N(0, sigma²)에 다시 뿌립니다.
+        벽이나 지도 밖에 떨어진 파티클은 측정 위치 자체에 둡니다. 나머지 파티클은 그대로 두어 측정이 틀렸을 때도 돌아갈 수 있습니다.
+        """
+        m = max(1, int(self.recovery_fraction * self.n))
+        idx = self.rng.choice(self.n, m, replace=False)
+        center = centers[self.rng.choice(len(centers), m, p=probs)]
+        pos = center + self.rng.normal(0, sigma, (m, 2))
+        row, col, inside = self._cells(pos)
+        bad = ~inside
+        bad[inside] = self.grid[row[inside], col[inside]]
+        pos[bad] = center[bad]
+        self.pos[idx] = pos
+        self.weights[:] = 1.0 / self.n
+
+    def _apply_likelihood(self, likelihood):
+        likelihood = (1 - self.likelihood_floor) * likelihood + self.likelihood_floor
+        weights = self.weights * likelihood
+        if weights.sum() <= 0:
+            return
+        self.weights = weights
+        self._normalize_and_resample()
+
+    def update(self, z, sigma=None):
+        """위치 측정 z = [x, y] (m, 핑거프린트 kNN이나 분류 결과의 셀 중심)로 가우시안 가중치를 줍니다."""
+        sigma = sigma or self.measurement_sigma
+        z = np.asarray(z, dtype=np.float64)[:2]
+        likelihood = np.exp(-0.5 * ((self.pos - z) ** 2).sum(axis=1) / sigma ** 2)
+        if self._lost(likelihood):
+            self._inject(z[None], None, sigma)
+            likelihood = np.exp(-0.5 * ((self.pos - z) ** 2).sum(axis=1) / sigma ** 2)
+        self._apply_likelihood(likelihood)
+
+    def update_proba(self, proba, class_positions, sigma=None):
+        """
+        분류기 확률로 가중치를 줍니다: 우도 = Σ_c proba_c · N(파티클; 셀 c 중심, sigma²).
+        예측 하나만 쓰는 것과 달리 확률이 비슷한 여러 셀을 함께 유지하므로, 틀린 1순위 예측에 끌려가지 않습니다.
+        class_positions: (C, 2) 각 클래스 셀 중심 (m), proba와 같은 순서.
+        """
+        sigma = sigma or self.measurement_sigma
+        proba = np.asarray(proba, dtype=np.float64)
+        keep = proba > 1e-3 * proba.max()       # 확률이 거의 0인 셀은 계산에서 뺍니다.
+        centers = np.asarray(class_positions, dtype=np.float64)[keep]
+        probs = proba[keep] / proba[keep].sum()
+        likelihood = self._mixture_likelihood(centers, probs, sigma)
+        if self._lost(likelihood):
+            self._inject(centers, probs, sigma)
+            likelihood = self._mixture_likelihood(centers, probs, sigma)
+        self._apply_likelihood(likelihood)
+
+    def _mixture_likelihood(self, centers, probs, sigma):
+        d2 = ((self.pos[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * d2 / sigma ** 2) @ probs
+
+    def effective_size(self):
+        return 1.0 / float(np.dot(self.weights, self.weights))
+
+    def _normalize_and_resample(self):
+        self.weights /= self.weights.sum()
+        if self.effective_size() < self.resample_threshold * self.n:
+            self.resample()
+
+    def resample(self):
+        """계통(systematic) 리샘플링: 균등 간격 포인터 N개로 누적 가중치를 한 번에 훑습니다."""
+        positions = (self.rng.random() + np.arange(self.n)) / self.n
+        cumulative = np.cumsum(self.weights)
+        cumulative[-1] = 1.0
+        idx = np.searchsorted(cumulative, positions)
+        self.pos = self.pos[idx]
+        self.theta = self.theta[idx]
+        self.v = self.v[idx]
+        self.weights = np.full(self.n, 1.0 / self.n)
+
+    def get_state(self):
+        """EKF.get_state()와 같은 [px, py, theta(rad), v] - 가중 평균 (방향은 원형 평균)"""
+        w = self.weights
+        x, y = w @ self.pos
+        theta = math.atan2(float(w @ np.sin(self.theta)), float(w @ np.cos(self.theta)))
+        return np.array([x, y, theta, float(w @ self.v)])
+
+    def snapshot(self):
+        """되돌리기(event_fusion.EventFusion)용 상태 사본. 난수 상태까지 담아 다시 적용한 결과가 같게 합니다."""
+        return (self.pos.copy(), self.theta.copy(), self.v.copy(), self.weights.copy(),
+                self.rng.bit_generator.state)
+
+    def restore(self, snapshot):
+        pos, theta, v, weights, rng_state = snapshot
+        self.pos, self.theta, self.v, self.weights = pos.copy(), theta.copy(), v.copy(), weights.copy()
+        self.rng.bit_generator.state = rng_state
+
+
+def make_fusion_engine(config, binary_grid, block_size):
+    """config.yaml의 fusion_engine.type에 따라 EKF(기본), ParticleFilter 또는 GridHMM을 만듭니다."""
+    engine = (config.get('fusion_engine') or {}).get('type', 'ekf')
+    if engine == 'particle':
+        return ParticleFilter.from_config(config, binary_grid, block_size)
+    if engine == 'hmm':
+        return GridHMM.from_config(config, binary_grid, block_size)
+    if engine == 'ekf':
+        return EKF(config.get('ekf_dt', 1.0))
+    raise ValueError(f"알 수 없는 fusion_engine.type입니다: {engine}")
@@ -0,0 +1,76 @@
+#양자화한 RSSI 입력을 키로 하는 위치 예측 LRU 캐시 파일.
+
+import math
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    위치 예측 결과의 LRU 캐시.
+    필터링된 RSSI는 콜백마다 1 dB 미만으로만 바뀌므로, 입력을 step_db 단위로 양자화한 키(+ 방향 등 추가 키)가 같으면
+    이전 예측을 그대로 돌려줍니다. 키가 같은 입력끼리는 같은 결과를 쓰므로 step_db가 클수록 적중률이 높고 정밀도는 낮아집니다.
+    version: 모델/DB를 다시 불러오면 소유 객체가 버전을 올리고, 버전이 바뀐 첫 조회에서 캐시 전체를 비웁니다.
+    """
+    def __init__(self, step_db=1.0, max_size=512):
+        if step_db <= 0:
+            raise ValueError(f"step_db는 0보다 커야 합니다: {step_db}")
+        self.step_db = step_db
+        self.max_size = max_size
+        self._inv_step = 1.0 / step_db
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def make_key(self, rssi_vector, extra=None):
+        """dict MAC->RSSI를 양자화한 키. 숫자가 아닌 값(예: 'direction')은 그대로 키에 들어갑니다."""
+        inv = self._inv_step
+        items = []
+        for mac, value in rssi_vector.items():
+            if isinstance(value, str):
+                items.append((mac, value))
+            else:
+                items.append((mac, math.floor(value * inv + 0.5)))
+        items.sort()
+        return tuple(items), extra
+
+    def get_or_compute(self, key, version, compute):
+        """key의 캐시된 결과를 반환하고, 없으면 compute()로 계산해 저장합니다."""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = value
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries), 'max_size': self.max_size, 'step_db': self.step_db,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
@@ -1,3 +1,4 @@
+import time
 import socket
 import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal
@@ -8,6 +9,8 @@ class RobotTrackerThread(QThread):
     OpenCV를 사용하지 않습니다.
     """
     robot_position_updated = pyqtSignal(float, float)
+    # 같은 좌표 + 수신 시각(time.monotonic())
+    robot_position_updated_at = pyqtSignal(float, float, float)
 
     def __init__(self, port=5006, parent=None):
         super().__init__(parent)
@@ -88,6 +91,7 @@ class RobotTrackerThread(QThread):
         while self.is_running:
             try:
                 data, _ = sock.recvfrom(1024)
+                received_at = time.monotonic()
                 message = data.decode().strip()
                 
                 if message:
@@ -96,6 +100,7 @@ class RobotTrackerThread(QThread):
                         x, y = float(parts[0]), float(parts[1])
                         px, py = self.transform_coordinates(x, y)
                         self.robot_position_updated.emit(px, py)
+                        self.robot_position_updated_at.emit(px, py, received_at)
 
             except socket.timeout:
                 continue
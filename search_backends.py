@@ -0,0 +1,751 @@
+#핑거프린트 검색 백엔드(정확 / 근사 top-k) 파일.
+
+import numpy as np
+
+from beacon_store import CSRMatrix
+
+
+def _sq_dists(samples, centroids, centroid_sq):
+    """샘플과 중심 사이의 제곱 유클리드 거리 (샘플 수 x 중심 수)"""
+    d = samples @ (-2 * centroids.T)
+    d += centroid_sq
+    d += (samples * samples).sum(axis=1)[:, np.newaxis]
+    return d
+
+
+def _kmeans(matrix, n_lists, seed, iterations=20, max_samples=65_536, dtype=np.float32):
+    """k-means 중심 (n_lists x 비콘 수). 큰 행렬에서는 무작위 부분 표본 max_samples개로만 학습합니다."""
+    rng = np.random.default_rng(seed)
+    if len(matrix) > max_samples:
+        matrix = matrix[rng.choice(len(matrix), max_samples, replace=False)]
+    centroids = matrix[rng.choice(len(matrix), n_lists, replace=False)].astype(dtype)
+    for _ in range(iterations):
+        assign = _sq_dists(matrix, centroids, (centroids * centroids).sum(axis=1)).argmin(axis=1)
+        counts = np.bincount(assign, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, matrix)
+        empty = counts == 0
+        updated = sums[~empty] / counts[~empty, np.newaxis]
+        moved = not np.allclose(updated, centroids[~empty])
+        centroids[~empty] = updated
+        if empty.any():
+            # 빈 목록은 임의의 레코드로 다시 시작합니다.
+            centroids[empty] = matrix[rng.choice(len(matrix), int(empty.sum()), replace=False)]
+        elif not moved:
+            break
+    return centroids
+
+
+def _kmeans_assign(matrix, n_clusters, dtype=np.float32):
+    """k-means(시드 0)로 학습한 중심 중 가장 가까운 중심 번호 (레코드 수)"""
+    centroids = _kmeans(matrix, n_clusters, 0, dtype=dtype)
+    return _sq_dists(matrix, centroids, (centroids * centroids).sum(axis=1)).argmin(axis=1)
+
+
+class HybridSearchEngine:
+    """
+    하이브리드 거리(cosine + norm 차이 + 강신호 weighted L1) 기반 정확한 top-k 검색 엔진.
+    build_index 시점에 정규화 행렬/노름/열 우선(column-major) 사본을 미리 계산해 두고,
+    쿼리마다 (샘플 x 레코드) 크기의 누적 배열 하나에 세 거리 항을 비콘 열 단위로 더한 뒤 부분 선택으로 top-k만 정렬합니다.
+    색인을 만들 때 레코드를 k-means 군집과 그 안의 잎(LEAF_SIZE칸)으로도 묶어 두고, 여러 샘플을 한 번에 검색할 때는
+    군집 상자와 잎 상자까지의 거리로 구한 하한(lower bound)으로 후보를 두 번 거른 뒤 남은 잎의 레코드만 정확히 계산합니다.
+    어느 경로든 (샘플, 레코드) 쌍마다 같은 순서로 연산하므로 단일 샘플과 배치 결과가 비트 단위로 동일합니다.
+    RSSI는 dB 단위로 유효숫자가 적으므로 메모리 대역폭을 줄이기 위해 float32로 계산합니다.
+    """
+    dtype = np.float32
+
+    # k가 이 값 이하이면 argpartition 대신 argmin을 k번 반복합니다. (작은 k에서 훨씬 빠름)
+    ARGMIN_TOPK_MAX = 16
+    # 샘플 수와 레코드 수가 각각 이 값 이상이면 하한 가지치기 경로를 사용합니다. (작은 delta 버퍼 등은 전체 거리로 계산)
+    PRUNE_MIN_SAMPLES = 2
+    PRUNE_MIN_RECORDS = 512
+    # 가지치기 경로: 레코드를 평균 CLUSTER_SIZE개씩의 k-means 군집으로 묶고, 군집을 다시 LEAF_SIZE칸 잎으로 잘라 계산합니다.
+    CLUSTER_SIZE = 16
+    LEAF_SIZE = 8
+    # 군집이 이보다 많으면 k-means를 두 단계로 나눠 학습합니다. (_cluster_groups 참고)
+    FLAT_KMEANS_MAX = 256
+
+    def __init__(self, rssi_matrix, prune=True, _groups=None):
+        self.rssi_matrix = np.asarray(rssi_matrix, dtype=self.dtype)
+        self.norms = np.linalg.norm(self.rssi_matrix, axis=1)
+        safe_norms = np.where(self.norms == 0, 1, self.norms).astype(self.dtype)
+        self.normalized_matrix = self.rssi_matrix / safe_norms[:, np.newaxis]
+        self.normalized_sq = (self.normalized_matrix * self.normalized_matrix).sum(axis=1)
+        # 비콘 열을 연속 메모리로 두어 열 단위 broadcast가 캐시 친화적으로 동작하도록 합니다.
+        self._rssi_cols = np.ascontiguousarray(self.rssi_matrix.T)
+        self._normalized_cols = np.ascontiguousarray(self.normalized_matrix.T)
+        # 가지치기용 군집은 색인을 만들 때 함께 만들어 검색 엔진과 같이 교체되게 합니다.
+        # prune=False(자주 다시 만드는 delta 버퍼 등)이면 만들지 않고 항상 전체 거리로 계산합니다.
+        self._leaf_records = None
+        if prune and len(self) >= self.PRUNE_MIN_RECORDS:
+            self._build_clusters(_groups)
+
+    def __len__(self):
+        return self.rssi_matrix.shape[0]
+
+    def _sample_terms(self, samples, beta, strong_threshold):
+        """샘플별 노름, 정규화 벡터, 강신호 마스크, weighted L1 배율을 계산합니다."""
+        sample_norms = np.linalg.norm(samples, axis=1)
+        sample_norms[sample_norms == 0] = 1
+        sample_normed = samples / sample_norms[:, np.newaxis]
+        strong_mask = samples > strong_threshold
+        l1_scale = (beta / np.maximum(strong_mask.sum(axis=1), 1)).astype(self.dtype)
+        return sample_norms, sample_normed, strong_mask, l1_scale
+
+    def distances(self, samples, alpha=0.6, beta=0.8, strong_threshold=-70):
+        """
+        samples: (n, 비콘 수) RSSI 행렬
+        반환: (n, 레코드 수) hybrid 거리 행렬
+        """
+        samples = np.asarray(samples, dtype=self.dtype)
+        n_samples, n_records = samples.shape[0], len(self)
+        sample_norms, sample_normed, strong_mask, l1_scale = self._sample_terms(samples, beta, strong_threshold)
+
+        dot = np.zeros((n_samples, n_records), dtype=self.dtype)
+        weighted_l1 = np.zeros((n_samples, n_records), dtype=self.dtype)
+        tmp = np.empty((n_samples, n_records), dtype=self.dtype)
+        for j in range(samples.shape[1]):
+            # cosine용 내적 누적
+            np.multiply(sample_normed[:, j, np.newaxis], self._normalized_cols[j], out=tmp)
+            dot += tmp
+            # 강신호 AP 절댓값 차이 누적 (해당 열이 강신호인 샘플만)
+            strong_rows = strong_mask[:, j]
+            if not strong_rows.any():
+                continue
+            np.subtract(self._rssi_cols[j], samples[:, j, np.newaxis], out=tmp)
+            np.abs(tmp, out=tmp)
+            if not strong_rows.all():
+                tmp *= strong_rows[:, np.newaxis]
+            weighted_l1 += tmp
+
+        # 1) cosine distance (정규화 벡터 간 유클리드 거리, 기존 BallTree 결과와 동일)
+        hybrid = dot
+        hybrid *= -2
+        hybrid += self.normalized_sq
+        hybrid += (sample_normed * sample_normed).sum(axis=1)[:, np.newaxis]
+        np.maximum(hybrid, 0, out=hybrid)
+        np.sqrt(hybrid, out=hybrid)
+        hybrid *= self.dtype(alpha)
+
+        # 2) norm difference
+        np.subtract(self.norms, sample_norms[:, np.newaxis], out=tmp)
+        np.abs(tmp, out=tmp)
+        tmp *= self.dtype(1 - alpha)
+        hybrid += tmp
+
+        # 3) weighted L1
+        weighted_l1 *= l1_scale[:, np.newaxis]
+        hybrid += weighted_l1
+        return hybrid
+
+    def leaf_distances(self, samples, leaf_counts, leaves, alpha=0.6, beta=0.8, strong_threshold=-70, terms=None):
+        """
+        잎 단위 후보에 대한 hybrid 거리. distances()와 같은 순서로 연산하므로 같은 쌍에 대해 값이 동일합니다.
+        leaves: 샘플 순서로 이어 붙인 잎 번호, leaf_counts: 샘플별 잎 수, terms: _sample_terms() 결과 (없으면 계산)
+        반환: 잎마다 LEAF_SIZE칸씩 이어 붙인 거리 (len(leaves) * LEAF_SIZE,). 빈 칸(잎 유효 마스크 False)의 값은 쓰지 않습니다.
+        레코드 쪽 값은 잎 순서로 미리 모아 둔 표에서 잎 행 단위로, 샘플 쪽 값은 np.repeat로 펼쳐
+        모든 연산이 후보 길이의 연속 1차원 배열에서 이뤄지게 합니다.
+        """
+        samples = np.asarray(samples, dtype=self.dtype)
+        if terms is None:
+            terms = self._sample_terms(samples, beta, strong_threshold)
+        sample_norms, sample_normed, strong_mask, l1_scale = terms
+        repeats = leaf_counts * self.LEAF_SIZE
+
+        def take(table):
+            return np.take(table, leaves, axis=0).ravel()
+
+        def spread(values):
+            return np.repeat(values, repeats)
+
+        n_pairs = len(leaves) * self.LEAF_SIZE
+        dot = np.zeros(n_pairs, dtype=self.dtype)
+        weighted_l1 = np.zeros(n_pairs, dtype=self.dtype)
+        tmp = np.empty(n_pairs, dtype=self.dtype)
+        for j in range(samples.shape[1]):
+            np.multiply(spread(sample_normed[:, j]), take(self._leaf_normalized[j]), out=tmp)
+            dot += tmp
+            strong_rows = strong_mask[:, j]
+            if not strong_rows.any():
+                continue
+            np.subtract(take(self._leaf_rssi[j]), spread(samples[:, j]), out=tmp)
+            np.abs(tmp, out=tmp)
+            if not strong_rows.all():
+                tmp *= spread(strong_rows)
+            weighted_l1 += tmp
+
+        hybrid = dot
+        hybrid *= -2
+        hybrid += take(self._leaf_normalized_sq)
+        hybrid += spread((sample_normed * sample_normed).sum(axis=1))
+        np.maximum(hybrid, 0, out=hybrid)
+        np.sqrt(hybrid, out=hybrid)
+        hybrid *= self.dtype(alpha)
+
+        np.subtract(take(self._leaf_norms), spread(sample_norms), out=tmp)
+        np.abs(tmp, out=tmp)
+        tmp *= self.dtype(1 - alpha)
+        hybrid += tmp
+
+        weighted_l1 *= spread(l1_scale)
+        hybrid += weighted_l1
+        return hybrid
+
+    @property
+    def candidates_per_query(self):
+        """
+        배치 검색에서 샘플당 계산하는 하한/정확 거리 수의 추정치 (FingerprintDB 배치 크기 결정용).
+        군집 하한 수 + 정확히 계산하는 씨앗/후보 칸 수 (밀집한 DB에서 군집 6개 분량 정도)
+        """
+        if self._leaf_records is None:
+            return len(self)
+        return -(-len(self) // self.CLUSTER_SIZE) + 6 * self.CLUSTER_SIZE
+
+    def _build_clusters(self, groups=None):
+        """
+        가지치기용 군집. 레코드를 k-means로 묶고, 군집 안에서는 첫 주성분 순서로 세워 LEAF_SIZE칸씩 잎으로 자릅니다.
+        잎 순서로 레코드 값을 모은 표와, 잎/군집마다 상자(비콘별 RSSI 최소/최대, 노름 범위)를 만듭니다.
+        (잎의 남는 칸은 유효 마스크 False이고 상자에서 빠집니다.)
+        groups: 저장된 (군집 순서로 놓은 레코드 번호, 군집 크기). 주어지면 k-means를 건너뜁니다.
+        """
+        size = self.LEAF_SIZE
+        order, sizes = groups if groups is not None else self._cluster_groups()
+        starts = np.cumsum(sizes) - sizes
+        leaf_counts = -(-sizes // size)
+        self._cluster_leaf_start = np.cumsum(leaf_counts) - leaf_counts
+        self._cluster_leaf_count = leaf_counts
+        leaf_cluster = np.repeat(np.arange(len(sizes)), leaf_counts)
+        first = starts[leaf_cluster] + (np.arange(leaf_counts.sum()) - self._cluster_leaf_start[leaf_cluster]) * size
+        slots = first[:, np.newaxis] + np.arange(size)
+        self._leaf_valid = slots < (starts + sizes)[leaf_cluster][:, np.newaxis]
+        leaf_records = order[np.where(self._leaf_valid, slots, 0)]
+        self._leaf_rssi = np.ascontiguousarray(self._rssi_cols[:, leaf_records])
+        self._leaf_normalized = np.ascontiguousarray(self._normalized_cols[:, leaf_records])
+        self._leaf_normalized_sq = self.normalized_sq[leaf_records]
+        self._leaf_norms = self.norms[leaf_records]
+
+        valid = self._leaf_valid[:, :, np.newaxis]
+        rssi, norms = self.rssi_matrix[leaf_records], self.norms[leaf_records][:, :, np.newaxis]
+        rssi_lo, rssi_hi = np.where(valid, rssi, np.inf).min(axis=1), np.where(valid, rssi, -np.inf).max(axis=1)
+        norm_lo, norm_hi = np.where(valid, norms, np.inf).min(axis=1), np.where(valid, norms, -np.inf).max(axis=1)
+        # 잎 상자는 잎마다 한 행 [RSSI 최소 | RSSI 최대 | 노름 최소 | 노름 최대], 군집 상자는 같은 항목의 열 우선 (항목 x 군집 수)
+        self._leaf_boxes = np.hstack([rssi_lo, rssi_hi, norm_lo, norm_hi])
+        leaf_start = self._cluster_leaf_start
+        self._cluster_boxes = np.ascontiguousarray(np.hstack([
+            np.minimum.reduceat(rssi_lo, leaf_start), np.maximum.reduceat(rssi_hi, leaf_start),
+            np.minimum.reduceat(norm_lo, leaf_start), np.maximum.reduceat(norm_hi, leaf_start)]).T)
+        self._leaf_records = leaf_records
+
+    def _cluster_groups(self):
+        """k-means 군집 (군집 순서로 놓은 레코드 번호, 군집 크기). 군집 안은 첫 주성분 순서입니다."""
+        n_clusters = max(1, min(len(self), int(round(len(self) / self.CLUSTER_SIZE))))
+        if n_clusters <= self.FLAT_KMEANS_MAX:
+            assign = _kmeans_assign(self.rssi_matrix, n_clusters, self.dtype)
+        else:
+            # k-means 비용은 (레코드 수 x 군집 수)라 레코드 수의 제곱으로 늘어납니다. 약 sqrt(군집 수)개로 먼저 나누고
+            # 나눈 묶음마다 따로 군집을 만들면 비용이 레코드 수 x sqrt(군집 수) 정도로 줄어듭니다.
+            coarse = _kmeans_assign(self.rssi_matrix, int(round(np.sqrt(n_clusters))), self.dtype)
+            assign = np.empty(len(self), dtype=np.int64)
+            offset = 0
+            for members in np.split(np.argsort(coarse, kind='stable'), np.cumsum(np.bincount(coarse))[:-1]):
+                count = max(1, int(round(len(members) / self.CLUSTER_SIZE)))
+                assign[members] = offset + _kmeans_assign(self.rssi_matrix[members], count, self.dtype)
+                offset += count
+        order = np.argsort(assign, kind='stable')
+        sizes = np.bincount(assign)
+        sizes = sizes[sizes > 0]
+        for start, count in zip(np.cumsum(sizes) - sizes, sizes):
+            if count > self.LEAF_SIZE:
+                members = order[start:start + count]
+                centered = self.rssi_matrix[members] - self.rssi_matrix[members].mean(axis=0)
+                principal = np.linalg.svd(centered, full_matrices=False)[2][0]
+                order[start:start + count] = members[np.argsort(centered @ principal, kind='stable')]
+        return order, sizes
+
+    def _box_bound(self, weighted_l1, norm_gap, l1_scale, alpha):
+        """
+        상자까지의 강신호 L1 합과 노름 차이를 hybrid 거리 하한으로 합칩니다. (입력 배열을 덮어씀)
+        cosine 항은 0 이상이므로 하한에서 뺍니다. float32 반올림 여유는 _prune_threshold()에서 둡니다.
+        """
+        bound = weighted_l1
+        bound *= l1_scale
+        norm_gap *= self.dtype(1 - alpha)
+        bound += norm_gap
+        return bound
+
+    def _prune_threshold(self, tau):
+        """
+        하한과 비교할 가지치기 기준. 합산 순서에 따른 float32 반올림 차이로 하한이 실제 거리를 넘을 수 있으므로
+        tau를 오차 한계만큼 늘려 둡니다. (하한 배열 전체 대신 샘플별 tau 하나만 고칩니다.)
+        """
+        eps = np.finfo(self.dtype).eps
+        return ((tau.astype(np.float64) + 1e-3) * (1 + 128 * eps)).astype(self.dtype)
+
+    def cluster_bounds(self, samples, alpha=0.6, beta=0.8, strong_threshold=-70, terms=None):
+        """(샘플 x 군집) hybrid 거리 하한. 노름 차이와 강신호 L1을 군집 상자 범위까지의 거리로 구합니다."""
+        samples = np.asarray(samples, dtype=self.dtype)
+        if terms is None:
+            terms = self._sample_terms(samples, beta, strong_threshold)
+        sample_norms, _, strong_mask, l1_scale = terms
+        boxes, d = self._cluster_boxes, samples.shape[1]
+
+        shape = (samples.shape[0], boxes.shape[1])
+        weighted_l1 = np.zeros(shape, dtype=self.dtype)
+        gap, above = np.empty(shape, dtype=self.dtype), np.empty(shape, dtype=self.dtype)
+
+        def gap_to(lo, hi, q):
+            # q가 NaN인 행은 np.fmax로 0이 됩니다. (강신호가 아닌 비콘은 L1 하한에서 빠짐)
+            q = q[:, np.newaxis]
+            np.subtract(lo, q, out=gap)
+            np.subtract(q, hi, out=above)
+            np.maximum(gap, above, out=gap)
+            np.fmax(gap, 0, out=gap)
+            return gap
+
+        strong_samples = np.where(strong_mask, samples, np.nan)
+        for j in range(d):
+            if strong_mask[:, j].any():
+                weighted_l1 += gap_to(boxes[j], boxes[d + j], strong_samples[:, j])
+        return self._box_bound(weighted_l1, gap_to(boxes[2 * d], boxes[2 * d + 1], sample_norms),
+                               l1_scale[:, np.newaxis], alpha)
+
+    def leaf_bounds(self, samples, leaf_counts, leaves, alpha=0.6, beta=0.8, strong_threshold=-70, terms=None):
+        """
+        잎 단위 후보의 hybrid 거리 하한. cluster_bounds()와 같은 방식으로 잎 상자까지의 거리를 씁니다.
+        leaves / leaf_counts는 leaf_distances()와 같습니다. 반환: (len(leaves),)
+        """
+        samples = np.asarray(samples, dtype=self.dtype)
+        if terms is None:
+            terms = self._sample_terms(samples, beta, strong_threshold)
+        sample_norms, _, strong_mask, l1_scale = terms
+        boxes, d = np.take(self._leaf_boxes, leaves, axis=0), samples.shape[1]
+
+        def gap_to(lo, hi, q):
+            q = np.repeat(q, leaf_counts)
+            gap = lo - q
+            np.maximum(gap, q - hi, out=gap)
+            return np.fmax(gap, 0, out=gap)
+
+        strong_samples = np.where(strong_mask, samples, np.nan)
+        weighted_l1 = np.zeros(len(leaves), dtype=self.dtype)
+        for j in range(d):
+            if strong_mask[:, j].any():
+                weighted_l1 += gap_to(boxes[:, j], boxes[:, d + j], strong_samples[:, j])
+        return self._box_bound(weighted_l1, gap_to(boxes[:, 2 * d], boxes[:, 2 * d + 1], sample_norms),
+                               np.repeat(l1_scale, leaf_counts), alpha)
+
+    @classmethod
+    def top_k(cls, hybrid, k):
+        """
+        hybrid 거리 행렬의 각 행에서 가장 가까운 k개 인덱스와 거리를 오름차순으로 반환합니다.
+        작은 k에서는 hybrid 배열을 제자리에서 덮어씁니다.
+        """
+        n_samples, n_records = hybrid.shape
+        k = max(1, min(k, n_records))
+        if k <= cls.ARGMIN_TOPK_MAX:
+            rows = np.arange(n_samples)
+            idx = np.empty((n_samples, k), dtype=np.intp)
+            dists = np.empty((n_samples, k), dtype=hybrid.dtype)
+            for i in range(k):
+                best = hybrid.argmin(axis=1)
+                idx[:, i] = best
+                dists[:, i] = hybrid[rows, best]
+                hybrid[rows, best] = np.inf
+            return idx, dists
+        if k < n_records:
+            candidates = np.argpartition(hybrid, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(n_records), hybrid.shape)
+        cand_dists = np.take_along_axis(hybrid, candidates, axis=1)
+        order = np.argsort(cand_dists, axis=1, kind='stable')
+        idx = np.take_along_axis(candidates, order, axis=1)
+        return idx, np.take_along_axis(cand_dists, order, axis=1)
+
+    def _cluster_leaves(self, rows, clusters):
+        """(샘플 행, 군집) 쌍을 군집의 잎들로 펼칩니다. 반환: (잎별 샘플 행, 잎 번호). 입력이 행 순서면 출력도 행 순서입니다."""
+        counts = self._cluster_leaf_count[clusters]
+        ends = np.cumsum(counts)
+        leaves = np.repeat(self._cluster_leaf_start[clusters] - (ends - counts), counts) + np.arange(counts.sum())
+        return np.repeat(rows, counts), leaves
+
+    def _leaf_top_k(self, samples, leaf_rows, leaves, k, tau, alpha, beta, strong_threshold, terms):
+        """잎 후보의 레코드를 정확히 계산해 샘플별 top-k 키를 구합니다. tau가 있으면 tau보다 먼 레코드는 뺍니다."""
+        n_samples = samples.shape[0]
+        leaf_counts = np.bincount(leaf_rows, minlength=n_samples)
+        dists = self.leaf_distances(samples, leaf_counts, leaves, alpha, beta, strong_threshold, terms)
+        keep = np.take(self._leaf_valid, leaves, axis=0).ravel()
+        if tau is not None:
+            keep &= dists <= np.repeat(tau, leaf_counts * self.LEAF_SIZE)
+        kept = np.flatnonzero(keep)
+        records = np.take(self._leaf_records, leaves, axis=0).ravel()
+        return self.top_k_keys(leaf_rows[kept // self.LEAF_SIZE], records[kept], dists[kept], n_samples, k)
+
+    def _pruned_query(self, samples, k, alpha, beta, strong_threshold):
+        """군집 하한, 잎 하한 순으로 후보를 거른 뒤 남은 잎의 레코드만 정확히 계산하는 top-k 검색."""
+        n_samples = samples.shape[0]
+        rows = np.arange(n_samples)
+        terms = self._sample_terms(samples, beta, strong_threshold)
+        bound = self.cluster_bounds(samples, alpha, beta, strong_threshold, terms)
+
+        # 1) 하한이 가장 작은 군집들(평균 3k개 레코드 분량)을 정확히 계산해 k번째 거리의 상한(tau)을 구합니다.
+        #    (그 군집들의 레코드가 k개보다 적으면 tau = inf가 되어 그 샘플은 모든 군집을 봅니다.)
+        n_seeds = min(-(-3 * k // self.CLUSTER_SIZE), bound.shape[1])
+        if n_seeds == 1:
+            seed_clusters = bound.argmin(axis=1)
+        else:
+            seed_clusters = np.sort(np.argpartition(bound, n_seeds - 1, axis=1)[:, :n_seeds], axis=1).ravel()
+        seed_rows = np.repeat(rows, n_seeds)
+        seed_keys = self._leaf_top_k(samples, *self._cluster_leaves(seed_rows, seed_clusters), k, None,
+                                     alpha, beta, strong_threshold, terms)
+        tau = self.key_distances(seed_keys[:, k - 1], self.dtype)
+        threshold = self._prune_threshold(tau)
+
+        # 2) 씨앗 군집을 뺀 나머지 중 하한 <= tau 인 군집을 잎으로 펼치고, 잎 하한 <= tau 인 잎의 레코드만 정확히 계산
+        candidate = bound <= threshold[:, np.newaxis]
+        candidate[seed_rows, seed_clusters] = False
+        leaf_rows, leaves = self._cluster_leaves(*np.divmod(np.flatnonzero(candidate), candidate.shape[1]))
+        leaf_counts = np.bincount(leaf_rows, minlength=n_samples)
+        near = self.leaf_bounds(samples, leaf_counts, leaves, alpha, beta, strong_threshold, terms)
+        near = near <= np.repeat(threshold, leaf_counts)
+        cand_keys = self._leaf_top_k(samples, leaf_rows[near], leaves[near], k, tau,
+                                     alpha, beta, strong_threshold, terms)
+
+        # 3) 두 후보 집합의 top-k를 합쳐 (거리, 인덱스) 오름차순 앞의 k개 선택
+        best = np.sort(np.concatenate([seed_keys, cand_keys], axis=1), axis=1)[:, :k]
+        return (best & 0xFFFFFFFF).astype(np.intp), self.key_distances(best, self.dtype)
+
+    # 후보가 k개보다 적은 샘플의 빈 칸 키 (key_distances로 풀면 inf)
+    NO_KEY = np.iinfo(np.int64).max
+
+    @classmethod
+    def top_k_keys(cls, cand_rows, cand_records, cand_dists, n_samples, k):
+        """
+        샘플 행 순서로 정렬된 (샘플 행, 레코드, 거리) 후보 쌍 목록에서 샘플별로 (거리, 인덱스) 오름차순 앞의 k개 키를 고릅니다.
+        음이 아닌 float32 거리는 비트 패턴의 정수 순서가 값 순서와 같으므로 (거리 비트, 인덱스)를 int64 키 하나로 묶어
+        샘플 구간별 최솟값을 k번 구합니다. (거리가 같으면 인덱스가 작은 쪽, top_k와 동일)
+        반환: (n_samples, k) 키. 하위 32비트가 레코드 인덱스이고, 후보가 모자란 칸은 NO_KEY입니다.
+        """
+        best = np.full((n_samples, k), cls.NO_KEY, dtype=np.int64)
+        if len(cand_rows) == 0:
+            return best
+        keys = cand_dists.view(np.int32).astype(np.int64)
+        keys <<= 32
+        keys |= cand_records
+        counts = np.bincount(cand_rows, minlength=n_samples)
+        has = counts > 0
+        # 후보가 있는 샘플의 구간만 reduceat합니다. (빈 구간은 다음 구간의 첫 값을 돌려주므로)
+        starts = (np.cumsum(counts) - counts)[has]
+        for i in range(k):
+            best[has, i] = np.minimum.reduceat(keys, starts)
+            keys[keys == np.repeat(best[:, i], counts)] = cls.NO_KEY
+        return best
+
+    @classmethod
+    def key_distances(cls, keys, dtype):
+        """top_k_keys 키의 거리 부분 (NO_KEY는 inf)"""
+        dists = (keys >> 32).astype(np.int32).view(dtype)
+        return np.where(keys == cls.NO_KEY, dtype(np.inf), dists)
+
+    def query(self, samples, k=1, alpha=0.6, beta=0.8, strong_threshold=-70):
+        samples = np.asarray(samples, dtype=self.dtype)
+        k = max(1, min(k, len(self)))
+        if samples.shape[0] >= self.PRUNE_MIN_SAMPLES and self._leaf_records is not None and k <= self.ARGMIN_TOPK_MAX:
+            return self._pruned_query(samples, k, alpha, beta, strong_threshold)
+        hybrid = self.distances(samples, alpha, beta, strong_threshold)
+        return self.top_k(hybrid, k)
+
+    def state(self):
+        """
+        영속화할 색인 상태: 가지치기용 군집 (군집 순서로 놓은 레코드 번호, 군집 크기).
+        거리 계산용 배열과 잎/상자 표는 행렬에서 바로 다시 만들 수 있으므로 저장하지 않습니다.
+        """
+        if self._leaf_records is None:
+            return {}
+        return {'cluster_order': self._leaf_records[self._leaf_valid],
+                'cluster_sizes': np.add.reduceat(self._leaf_valid.sum(axis=1), self._cluster_leaf_start)}
+
+    @classmethod
+    def from_state(cls, rssi_matrix, state, **options):
+        """저장된 군집으로 k-means 없이 엔진을 복원합니다. (군집이 저장되지 않은 상태면 새로 만듭니다.)"""
+        groups = None
+        if 'cluster_order' in state and len(state['cluster_order']) == len(rssi_matrix):
+            groups = (np.asarray(state['cluster_order']), np.asarray(state['cluster_sizes']))
+        return cls(rssi_matrix, _groups=groups)
+
+
+class IVFSearchEngine:
+    """
+    IVF(inverted file) 근사 top-k 검색 엔진.
+    k-means 중심(coarse quantizer)으로 레코드를 n_lists개 목록으로 나눠 두고, 쿼리마다 중심이 가까운
+    nprobe개 목록의 레코드만 hybrid 거리로 정확히 비교합니다. 쿼리 비용은 약 nprobe / n_lists 로 줄어듭니다.
+    nprobe를 키우면 recall과 지연이 함께 늘고, nprobe = n_lists 이면 정확 검색과 같은 결과입니다.
+    """
+    dtype = np.float32
+    KMEANS_ITERATIONS = 20
+    # k-means 학습에 쓸 최대 레코드 수 (큰 DB에서는 무작위 부분 표본으로 중심만 학습합니다)
+    KMEANS_MAX_SAMPLES = 65_536
+
+    def __init__(self, rssi_matrix, n_lists=None, nprobe=8, seed=0, _lists=None):
+        self.exact = HybridSearchEngine(rssi_matrix, prune=False)  # 거리 계산용 배열만 씁니다.
+        self.rssi_matrix = self.exact.rssi_matrix
+        self.norms = self.exact.norms
+        self.normalized_matrix = self.exact.normalized_matrix
+        n_records = len(self.exact)
+        self.n_lists = max(1, min(n_lists or int(round(np.sqrt(n_records))), n_records))
+        self.nprobe = nprobe
+        self.seed = seed
+        if _lists is None:
+            centroids = self._kmeans(self.rssi_matrix, self.n_lists, seed)
+            _lists = (centroids, *self._build_lists(centroids))
+        self.centroids, self.list_records, self.list_offsets = _lists
+        self.n_lists = len(self.centroids)
+        self._centroid_sq = (self.centroids * self.centroids).sum(axis=1)
+        self.list_sizes = np.diff(self.list_offsets)
+
+    def __len__(self):
+        return len(self.exact)
+
+    @property
+    def candidates_per_query(self):
+        """쿼리당 평균 정확 거리 계산 수 (FingerprintDB 배치 크기 결정용)."""
+        return max(1, len(self) * min(self.nprobe, self.n_lists) // self.n_lists)
+
+    # --- 학습 ---
+    def _sq_dists(self, samples, centroids=None, centroid_sq=None):
+        if centroids is None:
+            centroids, centroid_sq = self.centroids, self._centroid_sq
+        return _sq_dists(samples, centroids, centroid_sq)
+
+    def _kmeans(self, matrix, n_lists, seed):
+        return _kmeans(matrix, n_lists, seed, self.KMEANS_ITERATIONS, self.KMEANS_MAX_SAMPLES, self.dtype)
+
+    def _build_lists(self, centroids):
+        assign = self._sq_dists(self.rssi_matrix, centroids, (centroids * centroids).sum(axis=1)).argmin(axis=1)
+        list_records = np.argsort(assign, kind='stable')
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))])
+        return list_records, list_offsets
+
+    # --- 검색 ---
+    def query(self, samples, k=1, alpha=0.6, beta=0.8, strong_threshold=-70, nprobe=None):
+        samples = np.asarray(samples, dtype=self.dtype)
+        n_samples = samples.shape[0]
+        k = max(1, min(k, len(self)))
+        nprobe = max(1, min(nprobe or self.nprobe, self.n_lists))
+
+        # 1) 중심이 가까운 순으로 목록을 고르되, 후보가 k개 이상이 될 때까지 더 엽니다.
+        list_order = np.argsort(self._sq_dists(samples), axis=1)
+        cum_sizes = np.cumsum(self.list_sizes[list_order], axis=1)
+        n_probe = np.maximum(nprobe, (cum_sizes < k).sum(axis=1) + 1)
+        probe_rows, probe_ranks = np.nonzero(np.arange(self.n_lists) < n_probe[:, np.newaxis])
+        lists = list_order[probe_rows, probe_ranks]
+
+        # 2) 고른 목록의 레코드를 샘플별 후보 행렬 (샘플 수 x 최대 후보 수)로 펼칩니다. 빈 칸은 거리 inf.
+        counts = self.list_sizes[lists]
+        row_totals = np.bincount(probe_rows, weights=counts, minlength=n_samples).astype(np.intp)
+        pair_rows = np.repeat(probe_rows, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_records = self.list_records[np.repeat(self.list_offsets[lists], counts) + within]
+        pair_cols = np.arange(len(pair_rows)) - np.repeat(np.cumsum(row_totals) - row_totals, row_totals)
+        candidates = np.zeros((n_samples, row_totals.max()), dtype=np.intp)
+        candidates[pair_rows, pair_cols] = pair_records
+        padding = np.arange(candidates.shape[1]) >= row_totals[:, np.newaxis]
+
+        # 3) 후보만 정확한 hybrid 거리로 계산해 top-k
+        hybrid = self._candidate_distances(samples, candidates, alpha, beta, strong_threshold)
+        hybrid[padding] = np.inf
+        cols, dists = HybridSearchEngine.top_k(hybrid, k)
+        return np.take_along_axis(candidates, cols, axis=1), dists
+
+    def _candidate_distances(self, samples, candidates, alpha, beta, strong_threshold):
+        """
+        candidates (샘플 수 x 후보 수) 레코드에 대한 hybrid 거리.
+        HybridSearchEngine.distances()와 같은 순서로 연산하므로 같은 쌍에 대해 값이 동일합니다.
+        """
+        exact = self.exact
+        sample_norms, sample_normed, strong_mask, l1_scale = exact._sample_terms(samples, beta, strong_threshold)
+        strong_f = strong_mask.astype(self.dtype)
+
+        dot = np.zeros(candidates.shape, dtype=self.dtype)
+        weighted_l1 = np.zeros(candidates.shape, dtype=self.dtype)
+        for j in range(samples.shape[1]):
+            dot += sample_normed[:, j, np.newaxis] * exact._normalized_cols[j][candidates]
+            tmp = np.abs(exact._rssi_cols[j][candidates] - samples[:, j, np.newaxis])
+            tmp *= strong_f[:, j, np.newaxis]
+            weighted_l1 += tmp
+
+        hybrid = dot
+        hybrid *= -2
+        hybrid += exact.normalized_sq[candidates]
+        hybrid += (sample_normed * sample_normed).sum(axis=1)[:, np.newaxis]
+        np.maximum(hybrid, 0, out=hybrid)
+        np.sqrt(hybrid, out=hybrid)
+        hybrid *= self.dtype(alpha)
+
+        norm_diff = np.abs(exact.norms[candidates] - sample_norms[:, np.newaxis])
+        norm_diff *= self.dtype(1 - alpha)
+        hybrid += norm_diff
+
+        weighted_l1 *= l1_scale[:, np.newaxis]
+        hybrid += weighted_l1
+        return hybrid
+
+    # --- 영속화 ---
+    def state(self):
+        return {'centroids': self.centroids, 'list_records': self.list_records, 'list_offsets': self.list_offsets,
+                'nprobe': np.array(self.nprobe), 'seed': np.array(self.seed)}
+
+    @classmethod
+    def from_state(cls, rssi_matrix, state, n_lists=None, nprobe=None, seed=None):
+        """
+        저장된 중심/목록으로 k-means 없이 엔진을 복원합니다. 파일에서는 학습된 목록만 가져오고,
+        nprobe(recall/지연 조절)는 지금 주어진 옵션을 따릅니다 (없을 때만 저장된 값).
+        n_lists나 seed를 저장된 것과 다르게 주면 목록이 맞지 않으므로 새로 학습합니다.
+        """
+        nprobe = int(state['nprobe']) if nprobe is None else nprobe
+        stored_lists = len(state['centroids'])
+        if ((n_lists is not None and max(1, min(n_lists, len(rssi_matrix))) != stored_lists)
+                or (seed is not None and seed != int(state['seed']))):
+            return cls(rssi_matrix, n_lists=n_lists or stored_lists, nprobe=nprobe,
+                       seed=int(state['seed']) if seed is None else seed)
+        lists = (np.asarray(state['centroids'], dtype=cls.dtype), np.asarray(state['list_records']),
+                 np.asarray(state['list_offsets']))
+        return cls(rssi_matrix, nprobe=nprobe, seed=int(state['seed']), _lists=lists)
+
+
+class SparseSearchEngine:
+    """
+    CSR(수신 비콘만 저장) 레코드에 대한 정확한 hybrid top-k 검색 엔진.
+    비콘이 수백 개인 건물에서는 한 위치에서 들리는 비콘이 소수이므로, RSSI를 s = x - missing (미수신 = 0)으로
+    옮겨 두고 쿼리가 수신한 비콘의 역색인(posting) 목록만 훑습니다.
+      - 내적:   m.q = S(m, q) + M*sum(s_m) + M*sum(s_q) + M^2*D   (S: 공통 수신 비콘의 s 곱 합, M: missing, D: 비콘 수)
+      - 노름^2: sum(s^2) + 2M*sum(s) + M^2*D
+      - 강신호 L1: 미수신 레코드의 기본값 sum_strong |M - q_j| 에 수신 레코드만 |v - q_j| - |M - q_j| 를 보정
+    따라서 쿼리 비용은 비콘 수 D가 아니라 (쿼리가 수신한 비콘의 posting 길이 합 + 레코드 수)에 비례합니다.
+    HybridSearchEngine.distances()와 수식은 같고, 자릿수 손실을 막기 위해 레코드별 합은 float64로 계산합니다.
+    strong_threshold는 missing 값 이상이어야 합니다. (미수신 비콘은 강신호가 아님)
+    """
+    dtype = np.float32
+    normalized_matrix = None  # 조밀 정규화 행렬은 만들지 않습니다.
+
+    def __init__(self, rssi_matrix, missing=-100.0):
+        if not isinstance(rssi_matrix, CSRMatrix):
+            rssi_matrix = CSRMatrix.from_dense(rssi_matrix, missing)
+        self.rssi_matrix = rssi_matrix
+        self.missing = float(rssi_matrix.missing)
+        self.n_columns = rssi_matrix.n_columns
+        self._sum, self._sum_sq = self._row_sums(rssi_matrix)
+        self.norms = np.sqrt(self._sq_norms(self._sum, self._sum_sq))
+        self._col_ptr, self._post_rows, post_values = rssi_matrix.column_postings()
+        self._post_values = post_values.astype(np.float64)
+        self._post_shifted = self._post_values - self.missing
+
+    def __len__(self):
+        return len(self.rssi_matrix)
+
+    def _row_sums(self, csr):
+        shifted = csr.data.astype(np.float64) - self.missing
+        rows = csr.row_ids()
+        return (np.bincount(rows, weights=shifted, minlength=len(csr)),
+                np.bincount(rows, weights=shifted * shifted, minlength=len(csr)))
+
+    def _sq_norms(self, shifted_sum, shifted_sq_sum):
+        m = self.missing
+        return np.maximum(shifted_sq_sum + 2 * m * shifted_sum + m * m * self.n_columns, 0)
+
+    def _as_csr(self, samples):
+        if isinstance(samples, CSRMatrix):
+            return samples
+        samples = np.asarray(samples, dtype=self.dtype)
+        if samples.ndim == 1:
+            samples = samples[np.newaxis, :]
+        return CSRMatrix.from_dense(samples, self.missing)
+
+    def distances(self, samples, alpha=0.6, beta=0.8, strong_threshold=-70):
+        """
+        samples: (n, 비콘 수) RSSI 행렬 또는 CSRMatrix
+        반환: (n, 레코드 수) hybrid 거리 행렬
+        """
+        q = self._as_csr(samples)
+        n_samples, n_records = len(q), len(self)
+        q_rows = q.row_ids()
+        q_values = q.data.astype(np.float64)
+        q_shifted = q_values - self.missing
+        q_sum, q_sum_sq = self._row_sums(q)
+        q_norms = np.sqrt(self._sq_norms(q_sum, q_sum_sq))
+        strong = q.data > strong_threshold
+        l1_scale = beta / np.maximum(np.bincount(q_rows[strong], minlength=n_samples), 1)
+
+        # 쿼리가 수신한 (샘플, 비콘) 항목마다 그 비콘의 posting 목록을 펼칩니다.
+        counts = self._col_ptr[q.indices + 1] - self._col_ptr[q.indices]
+        entry = np.repeat(np.arange(q.nnz), counts)
+        within = np.arange(len(entry)) - np.repeat(np.cumsum(counts) - counts, counts)
+        post = np.repeat(self._col_ptr[q.indices], counts) + within
+        flat = q_rows[entry] * n_records + self._post_rows[post]
+        size = n_samples * n_records
+
+        # 1) cosine distance
+        m = self.missing
+        dot = np.bincount(flat, weights=q_shifted[entry] * self._post_shifted[post], minlength=size)
+        dot = dot.reshape(n_samples, n_records)
+        dot += m * self._sum
+        dot += (m * q_sum + m * m * self.n_columns)[:, np.newaxis]
+        rec_norms = np.where(self.norms == 0, 1, self.norms)
+        dot /= rec_norms
+        dot /= np.where(q_norms == 0, 1, q_norms)[:, np.newaxis]
+        hybrid = dot
+        hybrid *= -2
+        hybrid += (self.norms > 0)
+        hybrid += (q_norms > 0)[:, np.newaxis]
+        np.maximum(hybrid, 0, out=hybrid)
+        np.sqrt(hybrid, out=hybrid)
+        hybrid *= alpha
+
+        # 2) norm difference
+        hybrid += (1 - alpha) * np.abs(self.norms - q_norms[:, np.newaxis])
+
+        # 3) weighted L1: 미수신(missing) 기본값 + 강신호 비콘을 수신한 레코드만 보정
+        base = np.bincount(q_rows, weights=np.abs(m - q_values) * strong, minlength=n_samples)
+        sel = strong[entry]
+        correction = np.abs(self._post_values[post[sel]] - q_values[entry[sel]]) - np.abs(m - q_values[entry[sel]])
+        weighted_l1 = np.bincount(flat[sel], weights=correction, minlength=size).reshape(n_samples, n_records)
+        weighted_l1 += base[:, np.newaxis]
+        weighted_l1 *= l1_scale[:, np.newaxis]
+        hybrid += weighted_l1
+        return hybrid.astype(self.dtype)
+
+    def query(self, samples, k=1, alpha=0.6, beta=0.8, strong_threshold=-70):
+        k = max(1, min(k, len(self)))
+        return HybridSearchEngine.top_k(self.distances(samples, alpha, beta, strong_threshold), k)
+
+    def state(self):
+        """역색인은 CSR 행렬에서 바로 다시 만들 수 있으므로 비어 있습니다."""
+        return {}
+
+    @classmethod
+    def from_state(cls, rssi_matrix, state, **options):
+        return cls(rssi_matrix)
+
+
+# 이름 → 검색 엔진 클래스. 모든 엔진은 (rssi_matrix, **옵션) 생성자, __len__, query(), state()/from_state(행렬, 상태, **옵션)를 제공합니다.
+SEARCH_BACKENDS = {
+    'exact': HybridSearchEngine,
+    'ivf': IVFSearchEngine,
+    'sparse': SparseSearchEngine,
+}
+
+
+def make_search_engine(backend, rssi_matrix, state=None, **options):
+    """
+    backend 이름(또는 엔진 클래스)으로 검색 엔진을 만듭니다. state가 있으면 저장된 색인에서 복원하고,
+    options(예: IVF의 nprobe)는 복원한 상태보다 우선합니다.
+    """
+    engine_cls = SEARCH_BACKENDS.get(backend) if isinstance(backend, str) else backend
+    if engine_cls is None:
+        raise ValueError(f"알 수 없는 검색 백엔드입니다: {backend} (가능한 값: {sorted(SEARCH_BACKENDS)})")
+    if isinstance(rssi_matrix, CSRMatrix) and engine_cls is not SparseSearchEngine:
+        rssi_matrix = rssi_matrix.toarray()  # 조밀 행렬 기반 엔진
+    if state is not None:
+        return engine_cls.from_state(rssi_matrix, state, **options)
+    if engine_cls in (HybridSearchEngine, SparseSearchEngine):
+        return engine_cls(rssi_matrix)
+    return engine_cls(rssi_matrix, **options)
@@ -1,11 +1,14 @@
 #시리얼 통신 받는 파일.
 
+import time
 from PyQt5.QtCore import QThread, pyqtSignal
 import serial
 
 class SerialReader(QThread):
     heading_received = pyqtSignal(float)  # heading
     speed_received = pyqtSignal(float)  # speed
+    heading_received_at = pyqtSignal(float, float)  # heading, 수신 시각(time.monotonic())
+    speed_received_at = pyqtSignal(float, float)  # speed, 수신 시각
     #두개의 시그널을 정의. 매개변수의 값을 외부로 전달한다고 선언. 
     def __init__(self, port="COM8", baudrate=115200):
         super().__init__()
@@ -16,11 +19,13 @@ class SerialReader(QThread):
         while self.running:
             try:
                 line = self.ser.readline().decode().strip()
+                received_at = time.monotonic()
                 if line.startswith("Y"):
                     try:
                         heading = (int(line[1:].strip()) / 10 - 90) % 360
                         #print("Heading:", heading)
                         self.heading_received.emit(heading)
+                        self.heading_received_at.emit(heading, received_at)
                     except ValueError:
                         pass
 
@@ -29,6 +34,7 @@ class SerialReader(QThread):
                         speed = int(line[1:].strip()) / 10
                         #print("Speed:", speed)
                         self.speed_received.emit(speed)
+                        self.speed_received_at.emit(speed, received_at)
                     except ValueError:
                         pass
             except Exception as e:
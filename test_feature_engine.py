@@ -0,0 +1,83 @@
+#feature_engine.py 테스트: 실시간 라운드 조립(RoundAssembler)과 학습용 replay가 같은 피처 행을 만드는지 확인합니다.
+
+import numpy as np
+
+from beacon_store import RecordStore
+from feature_engine import FeatureEngine, RoundAssembler
+from fingerprinting import read_record_store
+
+DB_PATH = 'fingerprint_db_4dir.json'
+TIMEOUT = 1.0
+
+
+def recorded_stream(n_points=6, dropout=0.3, seed=0):
+    """녹화 DB의 앞쪽 측정 지점 레코드. 비콘 하나가 몇 라운드 연속 끊기는 구간과 무작위 미수신(-100)을 넣습니다."""
+    rng = np.random.default_rng(seed)
+    records = read_record_store(DB_PATH).to_records()
+    keys = []
+    for rec in records:
+        if tuple(rec['pos']) not in keys:
+            keys.append(tuple(rec['pos']))
+    records = [rec for rec in records if tuple(rec['pos']) in keys[:n_points]]
+    macs = list(records[0]['rssi'])
+    for n, rec in enumerate(records):
+        rssi = dict(rec['rssi'])
+        if 10 <= n % 40 < 20:
+            rssi[macs[0]] = RecordStore.MISSING_RSSI        # 비콘 하나가 10라운드 동안 끊김
+        for mac in macs[1:]:
+            if rng.random() < dropout / len(macs):
+                rssi[mac] = RecordStore.MISSING_RSSI
+        if all(v <= RecordStore.MISSING_RSSI for v in rssi.values()):
+            rssi[macs[-1]] = rec['rssi'][macs[-1]]
+        rec['rssi'] = rssi
+    return records
+
+
+def live_rows(engine, records, seed=1):
+    """레코드마다 수신된 비콘을 콜백 하나씩 무작위 순서로 흘리고, 덜 찬 라운드는 타이머 확인으로 닫습니다."""
+    rng = np.random.default_rng(seed)
+    rows, key, t = [], None, 0.0
+    assembler = RoundAssembler(engine, TIMEOUT, clock=lambda: t)
+    for rec in records:
+        if tuple(rec['pos']) != key:
+            # 측정 지점이 바뀌면 replay처럼 처음부터 (실시간으로는 새로 시작한 것과 같음)
+            engine.reset()
+            assembler.reset()
+            key = tuple(rec['pos'])
+        heard = [(mac, v) for mac, v in rec['rssi'].items() if v > RecordStore.MISSING_RSSI]
+        closed = None
+        for j in rng.permutation(len(heard)):
+            t += 0.01
+            closed = assembler.add(dict([heard[j]]), t) or closed
+        if closed is None:
+            t += TIMEOUT
+            closed = assembler.add({}, t)
+        assert closed is not None
+        rows.append([closed[name] for name in engine.feature_names])
+        t += 0.05
+    return np.array(rows)
+
+
+def test_live_rounds_match_replay():
+    records = recorded_stream()
+    store = RecordStore.from_records(records)
+    engine = FeatureEngine(store.registry.macs, windows=(5, 20))
+    expected = engine.replay(store, np.arange(len(store)))
+    live = live_rows(FeatureEngine(store.registry.macs, windows=(5, 20)), records)
+    assert live.shape == expected.shape
+    np.testing.assert_array_equal(live, expected)
+    # 끊긴 비콘이 있는 라운드에서도 피처가 나오고, 경과 라운드(age)가 실제로 올라갑니다.
+    age = engine.feature_names.index(f"{store.registry.macs[0].replace(':', '_')}__age")
+    assert live[:, age].max() > 0
+
+
+def test_round_closes_on_timeout_only_once():
+    engine = FeatureEngine(['A', 'B'], windows=(3,))
+    assembler = RoundAssembler(engine, timeout=0.5)
+    assert assembler.add({'A': -60}, 0.0) is None
+    assert not assembler.expired(0.4)
+    features = assembler.add({}, 0.6)
+    assert features['A'] == -60 and features['B'] == RecordStore.MISSING_RSSI
+    assert features['B__age'] == engine.max_age
+    assert assembler.add({}, 2.0) is None
+    assert assembler.add({'A': -61, 'B': -70}, 2.1)['B'] == -70
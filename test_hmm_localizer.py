@@ -0,0 +1,48 @@
+#hmm_localizer.py 테스트: 이벤트 융합이 predict를 자주 불러도 belief가 호출 횟수가 아니라 경과 시간만큼 퍼지는지 확인합니다.
+
+import numpy as np
+
+from event_fusion import EventFusion
+from hmm_localizer import GridHMM
+
+CELL_SIZE_M = (0.05, 0.05)
+
+
+def make_hmm():
+    """벽 없는 200 x 200 격자 (block 4 → 50 x 50 상태, 칸 0.2 m), 가운데에서 시작합니다."""
+    hmm = GridHMM(np.zeros((200, 200)), CELL_SIZE_M, block=4)
+    hmm.reset(position=(5.0, 5.0), spread=0.3)
+    return hmm
+
+
+def belief_std(hmm):
+    mean = hmm.belief @ hmm.centers
+    return float(np.sqrt(hmm.belief @ ((hmm.centers - mean) ** 2).sum(axis=1)))
+
+
+def run(rate_hz, seconds=2.0, speed=0.0, yaw=30.0):
+    """rate_hz로 들어오는 yaw 이벤트만으로 seconds 동안 융합합니다. (speed는 처음 한 번만)"""
+    hmm = make_hmm()
+    fusion = EventFusion(hmm, reorder_delay=0.0)
+    fusion.push(0.0, 'speed', speed)
+    n_events = int(round(seconds * rate_hz))
+    for i in range(n_events + 1):
+        fusion.push(i / rate_hz, 'yaw', yaw)
+    fusion.flush()
+    return hmm
+
+
+def test_standing_still_spread_depends_on_time_not_event_rate():
+    stds = [belief_std(run(rate)) for rate in (1, 10, 50)]
+    assert np.allclose(stds, stds[0], rtol=1e-9), stds
+    # 2초 동안 두 번 퍼진 것과 같습니다.
+    hmm = make_hmm()
+    hmm.predict(30.0, 0.0)
+    hmm.predict(30.0, 0.0)
+    assert np.isclose(stds[0], belief_std(hmm), rtol=1e-9)
+
+
+def test_walking_belief_matches_across_event_rates():
+    slow, fast = run(1, speed=1.0), run(50, speed=1.0)
+    assert np.allclose(slow.belief, fast.belief, atol=1e-12)
+    assert np.allclose(slow.get_state()[:2], fast.get_state()[:2], atol=1e-9)
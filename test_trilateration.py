@@ -0,0 +1,50 @@
+#trilateration.py 테스트: FilterBank가 비콘별 SuperFilter / KalmanFilter 객체와 비트 단위로 같은 출력을 내는지 확인합니다.
+
+import numpy as np
+
+from fingerprinting import read_record_store
+from trilateration import FilterBank, KalmanFilter, SuperFilter
+
+DB_PATH = 'fingerprint_db_4dir.json'
+
+
+def recorded_adverts():
+    """녹화 DB의 광고 순서 그대로 (MAC, RSSI) 목록과 MAC 목록"""
+    records = read_record_store(DB_PATH).to_records()
+    macs = list(records[0]['rssi'])
+    return [(mac, rssi) for rec in records for mac, rssi in rec['rssi'].items() if mac in macs], macs
+
+
+def spiky_adverts(macs, n=5000, seed=0):
+    """조용하다가 가끔 크게 튀는 실수 RSSI (누적 합의 반올림 오차가 튐 판정에 닿는 경우)"""
+    rng = np.random.default_rng(seed)
+    return [(macs[int(rng.integers(len(macs)))], float(rng.normal(-70, 1.0) + (12 if rng.random() < 0.1 else 0)))
+            for _ in range(n)]
+
+
+def check_bank_matches(adverts, macs, smoothing, filter_cls):
+    reference = {mac: filter_cls() for mac in macs}
+    expected = np.array([reference[mac].filtering(rssi) for mac, rssi in adverts])
+
+    bank = FilterBank(macs, smoothing=smoothing)
+    assert np.array_equal([bank.filtering(mac, rssi) for mac, rssi in adverts], expected)
+
+    # 녹화 재생 경로: 조각으로 나눠 넣어도 같아야 합니다.
+    bank = FilterBank(macs, smoothing=smoothing)
+    indices = np.array([bank.index[mac] for mac, _ in adverts])
+    rssi = np.array([rssi for _, rssi in adverts], dtype=float)
+    bounds = [0, 1, 7, len(adverts) // 2, len(adverts)]
+    replayed = np.concatenate([bank.update_many(indices[a:b], rssi[a:b]) for a, b in zip(bounds, bounds[1:])])
+    assert np.array_equal(replayed, expected)
+
+
+def test_filter_bank_matches_super_filter():
+    adverts, macs = recorded_adverts()
+    check_bank_matches(adverts, macs, True, SuperFilter)
+    check_bank_matches(spiky_adverts(macs), macs, True, SuperFilter)
+
+
+def test_filter_bank_without_smoothing_matches_kalman_filter():
+    adverts, macs = recorded_adverts()
+    check_bank_matches(adverts, macs, False, KalmanFilter)
+    check_bank_matches(spiky_adverts(macs), macs, False, KalmanFilter)
@@ -1,11 +1,21 @@
 # train_model.py (수정)
-import joblib
+import argparse
 from lgbm_predictor import LGBM_Classifier_Predictor
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="LGBM 위치 분류 모델을 학습해 저장합니다.")
+    parser.add_argument('--headings', action='store_true',
+                        help="방향별 작은 모델(lgbm_predictor_{방향}.npz + lgbm_predictor_headings.json)을 학습합니다.")
+    args = parser.parse_args()
+
     predictor = LGBM_Classifier_Predictor()
-    predictor.train("fingerprint_db_4dir.json")
-    
-    # [수정] 모델 객체 대신 predictor 인스턴스 전체를 저장
-    joblib.dump(predictor, 'lgbm_predictor.pkl')
-    print("학습된 Predictor 객체가 'lgbm_predictor.pkl' 파일로 저장되었습니다.")
\ No newline at end of file
+    if args.headings:
+        # config.yaml의 lgbm_model에 'lgbm_predictor_headings.json'을 지정하면 main.py가 방향별 모델을 씁니다.
+        predictor.train_heading_models("fingerprint_db_4dir.json")
+    else:
+        predictor.train("fingerprint_db_4dir.json")
+
+        # [수정] load_model()이 읽는 형식({'model', 'feature_columns', ...})으로 저장하고 컴파일된 모델도 함께 내보냅니다.
+        # 파라미터 탐색까지 하려면 train_pipeline.py를 사용하세요.
+        predictor.save_model('lgbm_predictor.pkl')
+        predictor.export_compiled('lgbm_predictor.npz')
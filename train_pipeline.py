@@ -0,0 +1,233 @@
+#LightGBM 위치 분류 모델의 병렬 하이퍼파라미터 탐색 + 셀 단위 교차 검증 학습 파일.
+
+import os
+import json
+import time
+import shutil
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lgbm_predictor import LGBM_Classifier_Predictor
+from tree_compiler import CompiledForest
+
+# 기본 탐색 공간. num_leaves는 CompiledForest.MAX_LEAVES(64) 이하여야 .npz로 내보낼 수 있습니다.
+DEFAULT_GRID = {
+    'num_leaves': [15, 31, 63],
+    'learning_rate': [0.05, 0.1],
+    'n_estimators': [100, 200],
+    'min_child_samples': [10, 20],
+}
+
+# 작업 프로세스마다 한 번만 받는 학습 데이터 (작업마다 피클링하지 않도록 initializer로 전달)
+_X = _y = _xy = _feature_columns = None
+
+
+def _init_worker(X, y, xy, feature_columns):
+    global _X, _y, _xy, _feature_columns
+    _X, _y, _xy, _feature_columns = X, y, xy, feature_columns
+
+
+def make_groups(y, directions, group_by='cell'):
+    """
+    교차 검증 그룹. 'cell'이면 (x, y) 셀 전체, 'cell_heading'이면 (x, y, 방향)을 한 번에 검증용으로 뺍니다.
+    같은 자리에서 연속으로 측정한 샘플은 서로 매우 비슷하므로 무작위 분할보다 실제 일반화 성능에 가깝습니다.
+    """
+    if group_by == 'cell':
+        keys = y
+    elif group_by == 'cell_heading':
+        keys = np.char.add(np.char.add(y.astype(str), '_'), directions.astype(str))
+    else:
+        raise ValueError(f"알 수 없는 그룹 기준입니다: {group_by}")
+    return np.unique(keys, return_inverse=True)[1]
+
+
+def label_xy(labels):
+    """'x_y' 레이블 배열 → (N, 2) 좌표 배열"""
+    return np.array([label.split('_') for label in labels], dtype=np.float64)
+
+
+def parameter_grid(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sample_parameters(grid, n_iter, seed=0):
+    """격자에서 중복 없이 n_iter개 조합을 무작위로 고릅니다. (랜덤 탐색)"""
+    configs = parameter_grid(grid)
+    if n_iter >= len(configs):
+        return configs
+    rng = np.random.default_rng(seed)
+    return [configs[i] for i in sorted(rng.choice(len(configs), n_iter, replace=False))]
+
+
+def _fit_fold(task):
+    """작업 프로세스: 한 설정 x 한 폴드를 학습하고 검증 지표를 계산합니다."""
+    import lightgbm as lgb
+
+    config_id, params, train_idx, test_idx, measure_latency = task
+    model = lgb.LGBMClassifier(**{**LGBM_Classifier_Predictor.DEFAULT_PARAMS, **params,
+                                  'n_jobs': 1, 'verbose': -1})
+    start = time.perf_counter()
+    model.fit(_X[train_idx], _y[train_idx])
+    fit_s = time.perf_counter() - start
+
+    predicted = model.booster_.predict(_X[test_idx]).argmax(axis=1)
+    pred_labels = model.classes_[predicted]
+    errors = np.linalg.norm(label_xy(pred_labels) - _xy[test_idx], axis=1)
+    result = {'config_id': config_id, 'fit_s': fit_s, 'n_test': len(test_idx),
+              'accuracy': float((pred_labels == _y[test_idx]).mean()),
+              'mean_error': float(errors.mean()), 'within_1_cell': float((errors <= 1.0).mean())}
+
+    if measure_latency:
+        # 실시간 경로(컴파일된 모델, 한 행씩 호출)의 지연 시간
+        forest = CompiledForest.from_booster(model.booster_, model.classes_, _feature_columns)
+        rows = _X[test_idx[:200]]
+        start = time.perf_counter()
+        for i in range(len(rows)):
+            forest.predict_proba(rows[i:i + 1])
+        result['latency_ms'] = (time.perf_counter() - start) / len(rows) * 1000
+    return result
+
+
+def search(db_path, configs, n_splits=4, group_by='cell', workers=None, temporal_windows=None):
+    """
+    모든 설정 x 폴드를 프로세스 풀에서 학습하고 설정별 평균 지표를 반환합니다. (평균 위치 오차 오름차순)
+    group_by='cell'이면 검증 셀의 레이블은 학습에 없으므로 정확도는 0이고, 가장 가까운 학습 셀로 얼마나
+    잘 옮겨 가는지를 위치 오차(셀 단위)로 비교합니다.
+    temporal_windows: 주어지면 feature_engine.FeatureEngine의 시계열 피처로 탐색합니다.
+    """
+    from sklearn.model_selection import GroupKFold
+
+    loader = LGBM_Classifier_Predictor()
+    X_df, y_series = loader._prepare_data(db_path, {'windows': list(temporal_windows)} if temporal_windows else None)
+    if X_df is None:
+        return None
+    feature_columns = X_df.columns.tolist()
+    X = X_df.to_numpy(dtype=np.float64)
+    y = y_series.to_numpy().astype(str)
+    directions = np.array([c[len('dir_'):] for c in feature_columns if c.startswith('dir_')])
+    dir_cols = [j for j, c in enumerate(feature_columns) if c.startswith('dir_')]
+    heading = directions[X[:, dir_cols].argmax(axis=1)] if dir_cols else np.zeros(len(y), dtype=str)
+    groups = make_groups(y, heading, group_by)
+
+    folds = list(GroupKFold(n_splits=n_splits).split(X, y, groups))
+    tasks = [(i, params, train_idx, test_idx, f == 0)
+             for i, params in enumerate(configs) for f, (train_idx, test_idx) in enumerate(folds)]
+
+    workers = workers or os.cpu_count() or 1
+    print(f"설정 {len(configs)}개 x 폴드 {len(folds)}개 = 학습 {len(tasks)}회 (프로세스 {workers}개)")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X, y, label_xy(y), feature_columns)) as pool:
+        fold_results = list(pool.map(_fit_fold, tasks))
+    elapsed = time.perf_counter() - start
+
+    results = []
+    for i, params in enumerate(configs):
+        rows = [r for r in fold_results if r['config_id'] == i]
+        weights = np.array([r['n_test'] for r in rows], dtype=np.float64)
+        summary = {'params': params, 'fit_s': float(np.mean([r['fit_s'] for r in rows])),
+                   'latency_ms': next(r['latency_ms'] for r in rows if 'latency_ms' in r)}
+        for metric in ('accuracy', 'mean_error', 'within_1_cell'):
+            summary[metric] = float(np.average([r[metric] for r in rows], weights=weights))
+        results.append(summary)
+    results.sort(key=lambda r: (r['mean_error'], -r['accuracy'], r['latency_ms']))
+    return {'db_path': db_path, 'n_samples': len(y), 'n_splits': len(folds), 'group_by': group_by,
+            'temporal_windows': temporal_windows, 'workers': workers, 'search_s': elapsed, 'results': results}
+
+
+def train_best(db_path, params, model_path="lgbm_predictor.pkl", compiled_path="lgbm_predictor.npz",
+               temporal_windows=None):
+    """선택된 파라미터로 전체 데이터를 학습하고 load_model()이 읽는 형식(.pkl + .npz)으로 저장합니다."""
+    predictor = LGBM_Classifier_Predictor()
+    predictor.train(db_path, test_size=None, params=params, temporal_windows=temporal_windows)
+    if predictor.model is None:
+        return None
+    predictor.save_model(model_path)
+    if compiled_path:
+        predictor.export_compiled(compiled_path)
+    return predictor
+
+
+def prepare_candidate(kind, source, staging_path, current_path=None, validation_db=None, params=None,
+                      db_path=None, holdout=0.3):
+    """
+    새 DB로 학습하거나(kind='db') 새 모델 파일을 복사해 와(kind='model') 교체 후보를 만들고 검증합니다.
+    model_watcher.py가 별도 프로세스에서 호출하므로 결과는 파일 경로와 지표만 dict로 돌려줍니다.
+    current_path: 지금 실행 중인 모델의 사본 (model_watcher가 교체 때마다 떠 둔 파일). 후보와 같은 세트로 평가해 비교합니다.
+    검증 세트는 validation_db, 없으면 DB(kind='db'면 source, 아니면 db_path)에서 train()이 떼어 두는 holdout 몫입니다.
+    검증 세트가 없으면 후보를 만들지 않습니다. 새 DB로 학습할 때는 현재 모델과 같은 시계열 피처 설정을 씁니다.
+    """
+    start = time.perf_counter()
+    eval_db, split = (validation_db, None) if validation_db else (source if kind == 'db' else db_path, holdout)
+    if not eval_db or not os.path.exists(eval_db):
+        return {'ok': False, 'error': "검증 세트가 없어 후보를 검증할 수 없습니다 (validation_db 또는 db_path)."}
+    current = LGBM_Classifier_Predictor()
+    if not (current_path and os.path.exists(current_path) and current.load_model(current_path)):
+        current = None
+    candidate = LGBM_Classifier_Predictor()
+    if kind == 'db':
+        windows = current.feature_engine['windows'] if current and current.feature_engine else None
+        candidate.train(source, test_size=holdout, params=params, temporal_windows=windows)
+        if candidate.model is None or candidate.export_compiled(staging_path) is None:
+            return {'ok': False, 'error': f"'{source}'로 모델을 학습하지 못했습니다."}
+        candidate_path = staging_path
+    elif kind == 'model':
+        # 검증하는 동안 원본이 또 바뀌어도 검증한 파일 그대로 쓰도록 사본을 만들어 둡니다 (확장자 유지).
+        candidate_path = os.path.splitext(staging_path)[0] + os.path.splitext(source)[1]
+        shutil.copyfile(source, candidate_path)
+        if not candidate.load_model(candidate_path):
+            return {'ok': False, 'error': f"'{source}' 모델을 불러오지 못했습니다."}
+    else:
+        raise ValueError(f"알 수 없는 후보 종류입니다: {kind}")
+
+    accuracy = candidate.score(eval_db, split)
+    current_accuracy = current.score(eval_db, split) if current is not None else None
+    return {'ok': True, 'kind': kind, 'source': source, 'path': candidate_path, 'accuracy': accuracy,
+            'current_accuracy': current_accuracy, 'validation': eval_db if split is None else f"{eval_db} ({split:.0%})",
+            'elapsed_s': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="LightGBM 파라미터를 병렬로 탐색하고 가장 좋은 모델을 저장합니다.")
+    parser.add_argument('db_path', nargs='?', default='fingerprint_db_4dir.json')
+    parser.add_argument('--grid', default=None, help="탐색 격자 JSON 파일 (기본: DEFAULT_GRID)")
+    parser.add_argument('--n-iter', type=int, default=None, help="랜덤 탐색할 조합 수 (기본: 격자 전체)")
+    parser.add_argument('--splits', type=int, default=4)
+    parser.add_argument('--group-by', choices=['cell', 'cell_heading'], default='cell')
+    parser.add_argument('--windows', type=int, nargs='*', default=None,
+                        help="시계열 피처 창 크기 (라운드 수, 예: --windows 5 20). 기본: 스냅샷 피처만 사용")
+    parser.add_argument('--workers', type=int, default=None, help="프로세스 수 (기본: CPU 코어 수)")
+    parser.add_argument('--model', default='lgbm_predictor.pkl')
+    parser.add_argument('--compiled', default='lgbm_predictor.npz', help="''이면 .npz를 만들지 않습니다.")
+    parser.add_argument('--output', default='train_report.json', help="설정별 결과를 저장할 JSON 경로")
+    parser.add_argument('--no-save', action='store_true', help="탐색만 하고 모델은 저장하지 않습니다.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    if max(grid.get('num_leaves', [31])) > CompiledForest.MAX_LEAVES:
+        print(f"⚠️ num_leaves가 {CompiledForest.MAX_LEAVES}보다 큰 설정은 .npz로 내보낼 수 없습니다.")
+        grid = {**grid, 'num_leaves': [n for n in grid['num_leaves'] if n <= CompiledForest.MAX_LEAVES]}
+    configs = sample_parameters(grid, args.n_iter, args.seed) if args.n_iter else parameter_grid(grid)
+
+    report = search(args.db_path, configs, args.splits, args.group_by, args.workers, args.windows)
+    if report is None:
+        raise SystemExit(1)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    print(f"탐색 시간 {report['search_s']:.1f}초, 결과를 '{args.output}'에 저장했습니다.")
+    for r in report['results'][:5]:
+        print(f"  오차 {r['mean_error']:.3f}셀, 1셀 이내 {r['within_1_cell']:.3f}, 정확도 {r['accuracy']:.3f}, "
+              f"학습 {r['fit_s']:.2f}초, 지연 {r['latency_ms']:.3f} ms  {r['params']}")
+    best = report['results'][0]['params']
+    print(f"✅ 선택된 파라미터: {best}")
+    if not args.no_save:
+        train_best(args.db_path, best, args.model, args.compiled or None, args.windows)
@@ -0,0 +1,225 @@
+#학습된 LightGBM 부스터를 NumPy 배열로 펼친 트리 앙상블 평가기 파일. (실행 시 lightgbm/pandas/sklearn 불필요)
+
+import json
+import numpy as np
+
+# LightGBM missing_type 코드
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_CODES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+# LightGBM이 0으로 보는 절댓값 한계 (kZeroThreshold)
+ZERO_THRESHOLD = 1e-35
+
+
+class CompiledForest:
+    """
+    트리 앙상블을 NumPy 배열로 펼친 평가기. (QuickScorer 방식)
+    - 트리마다 잎을 왼쪽부터 번호 매기고, 분기 노드마다 '조건이 거짓(오른쪽으로 감)이면 도달할 수 없는 잎'
+      (= 왼쪽 서브트리의 잎)을 0으로 둔 비트마스크를 저장합니다.
+    - 샘플마다 거짓인 분기 노드의 마스크를 트리별로 AND하면 남은 비트 중 가장 낮은 비트가 도착 잎입니다.
+    - 피처 f의 분기 노드는 임계값 순으로 정렬하면 'x_f > 임계값'인 노드가 앞쪽 구간이 되므로,
+      (피처별 임계값 순위 x 트리) 누적 AND 표를 미리 만들어 두면 샘플마다 피처 수만큼의 행 조회와 AND로
+      모든 트리를 분기 없이 한꺼번에 평가합니다. (결측 규칙이 있는 모델은 노드별 비교 경로 사용)
+    - 트리 t는 클래스 t % n_classes의 점수에 더해지고, 클래스 점수는 softmax(다중 분류) / sigmoid(이진)로 확률이 됩니다.
+    """
+    # 한 번에 만드는 (샘플 x 분기 노드) 배열의 최대 원소 수
+    CHUNK_ELEMENTS = 1 << 22
+    MAX_LEAVES = 64
+
+    def __init__(self, split_feature, threshold, default_left, missing_type, node_mask, tree_starts,
+                 leaf_value, leaf_offsets, n_classes, objective, classes, feature_columns, feature_encoding='dense',
+                 feature_engine=None):
+        self.split_feature = np.asarray(split_feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing_type = np.asarray(missing_type, dtype=np.int8)
+        self.node_mask = np.asarray(node_mask)
+        self.tree_starts = np.asarray(tree_starts, dtype=np.intp)  # 트리별 첫 분기 노드 위치
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float64)
+        self.leaf_offsets = np.asarray(leaf_offsets, dtype=np.intp)  # 트리별 첫 잎 위치
+        self.n_classes = int(n_classes)
+        self.objective = objective
+        self.classes = np.asarray(classes)
+        self.feature_columns = list(feature_columns)
+        self.feature_encoding = feature_encoding
+        self.feature_engine = feature_engine  # 시계열 피처 설정 (feature_engine.FeatureEngine.config())
+        self._all_ones = ~self.node_mask.dtype.type(0)
+        # 결측 규칙이 있는 노드가 없으면 단순 비교(x <= threshold)만 하므로 누적 AND 표를 씁니다.
+        self._plain_splits = not (self.missing_type != MISSING_NONE).any()
+        self._tables = self._build_tables() if self._plain_splits else None
+
+    def __len__(self):
+        return len(self.tree_starts)
+
+    # --- 변환 ---
+    @classmethod
+    def from_booster(cls, booster, classes, feature_columns, feature_encoding='dense', feature_engine=None):
+        """lightgbm.Booster.dump_model() 결과를 분기 노드 / 잎 배열로 펼칩니다."""
+        model = booster.dump_model()
+        objective = model['objective'].split()[0]
+        if objective not in ('multiclass', 'binary'):
+            raise ValueError(f"지원하지 않는 목적 함수입니다: {model['objective']}")
+        max_leaves = max(tree['num_leaves'] for tree in model['tree_info'])
+        if max_leaves > cls.MAX_LEAVES:
+            raise ValueError(f"트리당 잎은 {cls.MAX_LEAVES}개 이하여야 합니다. (num_leaves={max_leaves})")
+        mask_type = np.uint32 if max_leaves <= 32 else np.uint64
+        all_ones = int(~mask_type(0))
+
+        nodes = {name: [] for name in ('split_feature', 'threshold', 'default_left', 'missing_type', 'node_mask')}
+        leaf_value, tree_starts, leaf_offsets = [], [], []
+
+        def add_subtree(node):
+            """node 아래 잎을 leaf_value에 추가하고 (첫 잎 번호, 잎 수)를 반환합니다. (트리 내 번호)"""
+            if 'split_feature' not in node:
+                leaf_value.append(node['leaf_value'])
+                return len(leaf_value) - 1 - leaf_offsets[-1], 1
+            if node.get('decision_type', '<=') != '<=':
+                raise ValueError("범주형 분할은 지원하지 않습니다.")
+            index = len(nodes['node_mask'])
+            nodes['split_feature'].append(node['split_feature'])
+            nodes['threshold'].append(node['threshold'])
+            nodes['default_left'].append(node['default_left'])
+            nodes['missing_type'].append(_MISSING_CODES[node['missing_type']])
+            nodes['node_mask'].append(0)
+            first, n_left = add_subtree(node['left_child'])
+            _, n_right = add_subtree(node['right_child'])
+            nodes['node_mask'][index] = all_ones ^ (((1 << n_left) - 1) << first)
+            return first, n_left + n_right
+
+        for tree in model['tree_info']:
+            tree_starts.append(len(nodes['node_mask']))
+            leaf_offsets.append(len(leaf_value))
+            add_subtree(tree['tree_structure'])
+            if len(nodes['node_mask']) == tree_starts[-1]:
+                # 잎 하나뿐인 트리: 항상 참인 가짜 분기 노드를 넣어 reduceat 구간을 비우지 않습니다.
+                for name, value in (('split_feature', 0), ('threshold', np.inf), ('default_left', True),
+                                    ('missing_type', MISSING_NONE), ('node_mask', all_ones)):
+                    nodes[name].append(value)
+
+        nodes['node_mask'] = np.array(nodes['node_mask'], dtype=mask_type)
+        return cls(**nodes, tree_starts=tree_starts, leaf_value=leaf_value, leaf_offsets=leaf_offsets,
+                   n_classes=model['num_class'], objective=objective, classes=classes,
+                   feature_columns=feature_columns, feature_encoding=feature_encoding, feature_engine=feature_engine)
+
+    def _build_tables(self):
+        """
+        피처별 (정렬된 고유 임계값, 누적 AND 표). 표의 r행은 임계값 순위 r 미만(x > 임계값)인 노드들의
+        마스크를 트리별로 AND한 값이고, 0행은 모두 1입니다.
+        """
+        node_tree = np.repeat(np.arange(len(self)), np.diff(np.append(self.tree_starts, len(self.node_mask))))
+        tables = []
+        for f in range(int(self.split_feature.max()) + 1):
+            nodes = np.flatnonzero(self.split_feature == f)
+            thresholds = np.unique(self.threshold[nodes])
+            table = np.full((len(thresholds) + 1, len(self)), self._all_ones, dtype=self.node_mask.dtype)
+            ranks = np.searchsorted(thresholds, self.threshold[nodes])
+            np.bitwise_and.at(table, (ranks + 1, node_tree[nodes]), self.node_mask[nodes])
+            tables.append((thresholds, np.bitwise_and.accumulate(table, axis=0)))
+        return tables
+
+    # --- 평가 ---
+    def _goes_right(self, x):
+        """x: (샘플 수, 분기 노드 수) 피처 값 → 조건이 거짓(오른쪽)인지 여부"""
+        if self._plain_splits:
+            return x > self.threshold
+        nan = np.isnan(x)
+        x = np.where(nan & (self.missing_type != MISSING_NAN), 0.0, x)
+        go_left = x <= self.threshold
+        use_default = ((self.missing_type == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD)) | \
+                      ((self.missing_type == MISSING_NAN) & nan)
+        return ~np.where(use_default, self.default_left, go_left)
+
+    def leaf_indices(self, X):
+        """X: (샘플 수, 피처 수) → 트리별 도착 잎의 전역 인덱스 (샘플 수, 트리 수)"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        leaves = np.empty((len(X), len(self)), dtype=np.intp)
+        if self._tables is not None:
+            X = np.where(np.isnan(X), 0.0, X)  # missing_type 'None': NaN은 0으로 봅니다.
+            chunk = max(1, self.CHUNK_ELEMENTS // len(self))
+        else:
+            chunk = max(1, self.CHUNK_ELEMENTS // max(len(self.node_mask), 1))
+        for start in range(0, len(X), chunk):
+            bits = self._leaf_bits(X[start:start + chunk])
+            lowest = bits & (~bits + 1)
+            leaves[start:start + chunk] = np.frexp(lowest.astype(np.float64))[1] - 1
+        leaves += self.leaf_offsets
+        return leaves
+
+    def _leaf_bits(self, X):
+        """(샘플 수, 트리 수) 도달 가능한 잎 비트마스크"""
+        if self._tables is not None:
+            bits = np.full((len(X), len(self)), self._all_ones, dtype=self.node_mask.dtype)
+            for f, (thresholds, table) in enumerate(self._tables):
+                bits &= table[np.searchsorted(thresholds, X[:, f])]
+            return bits
+        bits = np.where(self._goes_right(X[:, self.split_feature]), self.node_mask, self._all_ones)
+        return np.bitwise_and.reduceat(bits, self.tree_starts, axis=1)
+
+    def raw_scores(self, X):
+        """X: (샘플 수, 피처 수) → 클래스별 원점수 (샘플 수, n_classes)"""
+        values = self.leaf_value[self.leaf_indices(X)]
+        return values.reshape(len(values), -1, self.n_classes).sum(axis=1)
+
+    def predict_proba(self, X):
+        raw = self.raw_scores(X)
+        if self.objective == 'binary':
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        raw -= raw.max(axis=1, keepdims=True)
+        np.exp(raw, out=raw)
+        raw /= raw.sum(axis=1, keepdims=True)
+        return raw
+
+    def predict(self, X):
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+    # --- 영속화 ---
+    def save(self, path):
+        meta = {'n_classes': self.n_classes, 'objective': self.objective, 'classes': self.classes.tolist(),
+                'feature_columns': self.feature_columns, 'feature_encoding': self.feature_encoding,
+                'feature_engine': self.feature_engine}
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                     split_feature=self.split_feature, threshold=self.threshold, default_left=self.default_left,
+                     missing_type=self.missing_type, node_mask=self.node_mask, tree_starts=self.tree_starts,
+                     leaf_value=self.leaf_value, leaf_offsets=self.leaf_offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = dict(data)
+        meta = json.loads(str(arrays.pop('meta')))
+        return cls(**arrays, **meta)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="학습된 LGBM 모델(.pkl)을 NumPy 트리 평가기(.npz)로 변환하고 검증합니다.")
+    parser.add_argument('model_path', nargs='?', default='lgbm_predictor.pkl')
+    parser.add_argument('--output', default=None, help="출력 .npz 경로 (기본: 모델 경로의 확장자를 .npz로)")
+    parser.add_argument('--db', default='fingerprint_db_4dir.json', help="검증용 핑거프린트 DB")
+    args = parser.parse_args()
+
+    from lgbm_predictor import LGBM_Classifier_Predictor
+
+    predictor = LGBM_Classifier_Predictor()
+    if not predictor.load_model(args.model_path):
+        raise SystemExit(1)
+    output = args.output or args.model_path.rsplit('.', 1)[0] + '.npz'
+    forest = predictor.export_compiled(output)
+
+    # DB 전체에서 부스터와 결과 비교
+    X, _ = predictor.feature_matrix(args.db)
+    start = time.perf_counter()
+    expected = predictor.model.booster_.predict(X)
+    booster_s = time.perf_counter() - start
+    start = time.perf_counter()
+    proba = forest.predict_proba(X)
+    forest_s = time.perf_counter() - start
+    print(f"트리 {len(forest)}개, 분기 노드 {len(forest.node_mask)}개, 잎 {len(forest.leaf_value)}개")
+    print(f"샘플 {len(X)}개: lightgbm {booster_s * 1000:.1f} ms, NumPy {forest_s * 1000:.1f} ms")
+    print(f"최대 확률 차이 {np.abs(proba - expected).max():.2e}, "
+          f"레이블 일치 {(proba.argmax(axis=1) == expected.argmax(axis=1)).mean():.4f}")
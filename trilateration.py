@@ -1,5 +1,6 @@
 # 칼만필터.
 import math
+from array import array
 from scipy.optimize import least_squares
 from collections import deque
 import numpy as np
@@ -116,6 +117,218 @@ class KalmanFilter:
 
 
 
+###############################################################################
+# 필터 뱅크 (여러 비콘의 칼만 + 이동평균 필터를 배열 하나로)
+###############################################################################
+class FilterBank:
+    """
+    비콘마다 SuperFilter / KalmanFilter 객체를 두는 대신, 모든 비콘의 필터 상태를 연속된 NumPy 배열에 담습니다.
+    - 칼만 상태: 예측 RSSI, 오차 공분산, 측정 잡음, 직전 RSSI
+    - 튐 감지: 최근 diff 5개의 링 버퍼
+    - 이동평균: window_size 크기의 링 버퍼 (smoothing=False면 KalmanFilter와 같이 칼만 출력만 돌려줍니다.)
+    링 버퍼의 평균은 누적 합(더하고 빼기)으로 갱신하지 않고 SuperFilter처럼 매번 오래된 순서로 sum()합니다.
+    누적 합은 반올림 오차가 쌓여 diff_mean < 2 튐 판정을 뒤집을 수 있으므로, 출력은 SuperFilter.filtering /
+    KalmanFilter.filtering과 비트 단위로 같아야 합니다. (창이 5칸이라 다시 더하는 비용은 작습니다.)
+    """
+    DIFF_HISTORY = 5
+    SPIKE_THRESHOLD = 6     # dBm 튐 기준
+    SPIKE_QUIET = 2         # 최근 변화가 이 값보다 작으면 조용한 상황
+    SPIKE_NOISE = 20
+    BASE_NOISE = 7
+    # 비콘별 상태 배열 (행 = 비콘)
+    _STATE = ('initialized', 'predicted', 'error_cov', 'noise', 'prev_rssi',
+              'diffs', 'diff_count', 'diff_pos', 'window', 'win_count', 'win_pos')
+
+    def __init__(self, macs=(), process_noise=0.08, measurement_noise=7, window_size=5, smoothing=True, capacity=8):
+        self.processNoise = process_noise
+        self.measurementNoise = measurement_noise
+        self.window_size = window_size
+        self.smoothing = smoothing
+        self.index = {}     # MAC -> 배열 행 번호
+        self._allocate(max(capacity, len(macs)))
+        for mac in macs:
+            self.add(mac)
+
+    def _allocate(self, capacity):
+        self.initialized = np.zeros(capacity, dtype=bool)
+        self.predicted = np.zeros(capacity)
+        self.error_cov = np.zeros(capacity)
+        self.noise = np.full(capacity, float(self.measurementNoise))
+        self.prev_rssi = np.zeros(capacity)
+        # 링 버퍼: 덜 찼으면 0..count-1에 오래된 순서로, 다 찼으면 pos부터 한 바퀴가 오래된 순서입니다. (pos = 다음에 쓸 칸)
+        self.diffs = np.zeros((capacity, self.DIFF_HISTORY))
+        self.diff_count = np.zeros(capacity, dtype=np.int64)
+        self.diff_pos = np.zeros(capacity, dtype=np.int64)
+        self.window = np.zeros((capacity, self.window_size))
+        self.win_count = np.zeros(capacity, dtype=np.int64)
+        self.win_pos = np.zeros(capacity, dtype=np.int64)
+        # 원소 하나씩 읽고 쓰는 update용: 같은 메모리를 1차원으로 펼친 memoryview (파이썬 float/int로 바로 읽힘)
+        self._views = tuple(memoryview(getattr(self, name).reshape(-1)) for name in self._STATE)
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in self._STATE}
+        self._allocate(2 * len(old['predicted']))
+        for name, values in old.items():
+            getattr(self, name)[:len(values)] = values
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, mac):
+        """비콘을 등록하고 행 번호를 돌려줍니다. 이미 있으면 기존 번호."""
+        if mac not in self.index:
+            if len(self.index) == len(self.predicted):
+                self._grow()
+            self.index[mac] = len(self.index)
+        return self.index[mac]
+
+    def reset(self, i=None):
+        """i번 비콘(None이면 전부)의 필터 상태를 처음으로 되돌립니다."""
+        rows = slice(None) if i is None else i
+        self.initialized[rows] = False
+        self.predicted[rows] = self.error_cov[rows] = self.prev_rssi[rows] = 0.0
+        self.noise[rows] = self.measurementNoise
+        self.diff_count[rows] = self.diff_pos[rows] = 0
+        self.win_count[rows] = self.win_pos[rows] = 0
+
+    def filtering(self, mac, rssi):
+        """SuperFilter.filtering과 같은 역할을 MAC 주소로 (처음 보는 MAC이면 등록)"""
+        return self.update(self.add(mac), rssi)
+
+    @staticmethod
+    def _ring_push(buf, count, pos, i, size, value):
+        """i번 비콘의 링 버퍼에 value를 넣고 들어 있는 값을 오래된 순서의 리스트로 돌려줍니다."""
+        base = i * size
+        p = pos[i]
+        buf[base + p] = value
+        pos[i] = p + 1 if p + 1 < size else 0
+        n = count[i]
+        if n < size:
+            count[i] = n + 1
+            return buf[base:base + n + 1].tolist()
+        p = pos[i]
+        return buf[base + p:base + size].tolist() + buf[base:base + p].tolist()
+
+    @staticmethod
+    def _ring_values(buf, count, pos, row):
+        """row번 비콘의 링 버퍼 값을 오래된 순서의 리스트로 (update_many용)"""
+        values = buf[row].tolist()
+        if count[row] < buf.shape[1]:
+            return values[:count[row]]
+        return values[pos[row]:] + values[:pos[row]]
+
+    @staticmethod
+    def _ring_store(buf, count, pos, row, values):
+        """오래된 순서의 값들을 row번 비콘의 링 버퍼에 다시 씁니다. (앞에서부터 채우고 pos는 다음 칸)"""
+        n = len(values)
+        buf[row, :n] = values
+        count[row] = n
+        pos[row] = n % buf.shape[1]
+
+    def update(self, i, rssi):
+        """i번 비콘에 RSSI 하나를 넣고 필터 출력을 돌려줍니다."""
+        (initialized, predicted, error_cov, noise, prev_rssi,
+         diffs, diff_count, diff_pos, window, win_count, win_pos) = self._views
+        rssi = float(rssi)
+        if not initialized[i]:
+            initialized[i] = True
+            prior_rssi = rssi
+            prior_cov = 1.0
+            prev_rssi[i] = rssi
+        else:
+            prior_rssi = predicted[i]
+            prior_cov = error_cov[i] + self.processNoise
+
+            diff = abs(rssi - prev_rssi[i])
+            recent = self._ring_push(diffs, diff_count, diff_pos, i, self.DIFF_HISTORY, diff)
+            if diff > self.SPIKE_THRESHOLD and sum(recent) / len(recent) < self.SPIKE_QUIET:
+                noise[i] = self.SPIKE_NOISE
+            else:
+                noise[i] = self.BASE_NOISE
+            prev_rssi[i] = rssi
+
+        kalman_gain = prior_cov / (prior_cov + noise[i])
+        kalmaned = prior_rssi + (kalman_gain * (rssi - prior_rssi))
+        predicted[i] = kalmaned
+        error_cov[i] = (1 - kalman_gain) * prior_cov
+        if not self.smoothing:
+            return kalmaned
+
+        recent = self._ring_push(window, win_count, win_pos, i, self.window_size, kalmaned)
+        return sum(recent) / len(recent)
+
+    def update_many(self, indices, rssi):
+        """
+        (비콘 번호, RSSI) 시퀀스를 순서대로 넣은 결과를 한꺼번에 계산합니다 (녹화 데이터 재생용).
+        update를 차례로 부른 것과 비트 단위로 같습니다. 칼만 재귀와 튐 판정이 순차적이라 비콘별로 묶어
+        파이썬 지역 변수만 쓰는 루프 한 번으로 돌고, 배열 상태는 비콘마다 시작과 끝에 한 번씩만 읽고 씁니다.
+        반환: 입력 순서대로의 필터 출력 배열
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        rssi = np.asarray(rssi, dtype=np.float64)
+        if indices.shape != rssi.shape:
+            raise ValueError("indices와 rssi의 길이가 다릅니다.")
+        if not len(indices):
+            return np.empty(0)
+        if indices.min() < 0 or indices.max() >= len(self.predicted):
+            raise ValueError("등록되지 않은 비콘 번호가 있습니다.")
+
+        # 비콘별로 묶기 (안정 정렬이라 같은 비콘 안에서는 입력 순서가 유지됩니다)
+        order = np.argsort(indices, kind='stable')
+        z_list = rssi[order].tolist()
+        starts = np.flatnonzero(np.r_[True, indices[order][1:] != indices[order][:-1]])
+        ends = np.r_[starts[1:], len(z_list)]
+        rows = indices[order][starts]
+
+        q, smoothing = self.processNoise, self.smoothing
+        history, window_size = self.DIFF_HISTORY, self.window_size
+        spike_threshold, spike_quiet = self.SPIKE_THRESHOLD, self.SPIKE_QUIET
+        spike_noise, base_noise = self.SPIKE_NOISE, self.BASE_NOISE
+        out = []
+        append = out.append
+        for b, s, e in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+            initialized = bool(self.initialized[b])
+            x, p, r, prev = (self.predicted[b].item(), self.error_cov[b].item(),
+                             self.noise[b].item(), self.prev_rssi[b].item())
+            recent_diffs = self._ring_values(self.diffs, self.diff_count, self.diff_pos, b)
+            window = self._ring_values(self.window, self.win_count, self.win_pos, b)
+            for z in z_list[s:e]:
+                if not initialized:
+                    initialized = True
+                    prior, prior_cov = z, 1.0
+                    prev = z
+                else:
+                    prior, prior_cov = x, p + q
+                    diff = abs(z - prev)
+                    recent_diffs.append(diff)
+                    if len(recent_diffs) > history:
+                        del recent_diffs[0]
+                    if diff > spike_threshold and sum(recent_diffs) / len(recent_diffs) < spike_quiet:
+                        r = spike_noise
+                    else:
+                        r = base_noise
+                    prev = z
+                gain = prior_cov / (prior_cov + r)
+                x = prior + (gain * (z - prior))
+                p = (1 - gain) * prior_cov
+                if smoothing:
+                    window.append(x)
+                    if len(window) > window_size:
+                        del window[0]
+                    append(sum(window) / len(window))
+                else:
+                    append(x)
+            self.initialized[b] = initialized
+            self.predicted[b], self.error_cov[b], self.noise[b], self.prev_rssi[b] = x, p, r, prev
+            self._ring_store(self.diffs, self.diff_count, self.diff_pos, b, recent_diffs)
+            if smoothing:
+                self._ring_store(self.window, self.win_count, self.win_pos, b, window)
+
+        result = np.empty(len(z_list))
+        result[order] = out
+        return result
+
+
 import numpy as np
 
 class EKF:
@@ -138,60 +351,162 @@ class EKF:
         # 기존: self.R = np.diag([0.2, 0.2])
         self.R = np.diag([4.0, 4.0])  # 표준편차 2m에 해당하는 분산 값으로 설정 (환경에 맞게 조절)
 
-    def predict(self, imu_yaw, imu_speed):
-        self.x[2] = np.deg2rad(imu_yaw)
-        self.x[3] = imu_speed * 0.65
-
-        theta = self.x[2]
-        v = self.x[3]
-        dt = self.dt
-
-        self.x[0] += v * np.cos(theta) * dt
-        self.x[1] += v * np.sin(theta) * dt
-
-        A = np.eye(self.n)
-        A[0, 2] = -v * np.sin(theta) * dt
-        A[0, 3] = np.cos(theta) * dt
-        A[1, 2] = v * np.cos(theta) * dt
-        A[1, 3] = np.sin(theta) * dt
-
-        self.P = A @ self.P @ A.T + self.Q
+        # P와 같은 메모리를 가리키는 1차원 view. predict/update는 새 배열을 만들지 않고 self.x, self.P에 제자리로 씁니다.
+        # (main.py처럼 밖에서 ekf.x[0] = ..., ekf.P[:2, :2] *= 1.2 로 고쳐 써도 그대로 반영됩니다.)
+        self._P_flat = self.P.reshape(-1)
+        self._refresh_noise()
+
+    # 최대 허용 보정 거리 (m). 한 번의 비콘 측정으로 위치가 이보다 크게 튀지 않게 합니다.
+    max_update_distance = 0.25
+    # 속도 측정값에 곱하는 보정 계수
+    speed_scale = 0.65
+
+    def _buffers(self):
+        # self.P를 통째로 새 배열로 바꿔 넣었으면 view를 다시 잡습니다.
+        if self._P_flat.base is not self.P:
+            self._P_flat = self.P.reshape(-1)
+        return self.x, self._P_flat
+
+    def _predict_step(self, x, P, imu_yaw, imu_speed, dt=None):
+        """
+        x: [px, py, theta, v] (list), P: 행 우선으로 펼친 4x4 공분산 (list 16개). 둘 다 제자리에서 바뀝니다.
+        A = I + (0,2),(0,3),(1,2),(1,3) 원소뿐이므로 A P A^T 의 0, 1행/열만 풀어 쓴 식으로 계산합니다.
+        dt를 주면 self.dt 대신 그 시간만큼 진행하고, 과정 잡음 Q도 dt / self.dt 비율로 줄이거나 늘립니다.
+        """
+        q0, q1, q2, q3 = self._Q_diag
+        if dt is None:
+            dt = self.dt
+        else:
+            ratio = dt / self.dt
+            q0, q1, q2, q3 = q0 * ratio, q1 * ratio, q2 * ratio, q3 * ratio
+        theta = math.radians(imu_yaw)
+        v = imu_speed * self.speed_scale
+        c, s = math.cos(theta), math.sin(theta)
+        x[2] = theta
+        x[3] = v
+        x[0] += v * c * dt
+        x[1] += v * s * dt
+
+        a02, a03 = -v * s * dt, c * dt
+        a12, a13 = v * c * dt, s * dt
+        (p00, p01, p02, p03, p10, p11, p12, p13,
+         p20, p21, p22, p23, p30, p31, p32, p33) = P
+        # B = A P : 0, 1행만 바뀜
+        b00, b01, b02, b03 = (p00 + a02 * p20 + a03 * p30, p01 + a02 * p21 + a03 * p31,
+                              p02 + a02 * p22 + a03 * p32, p03 + a02 * p23 + a03 * p33)
+        b10, b11, b12, b13 = (p10 + a12 * p20 + a13 * p30, p11 + a12 * p21 + a13 * p31,
+                              p12 + a12 * p22 + a13 * p32, p13 + a12 * p23 + a13 * p33)
+        # P = B A^T + Q : 0, 1열만 바뀜
+        P[:] = (b00 + a02 * b02 + a03 * b03 + q0, b01 + a12 * b02 + a13 * b03, b02, b03,
+                b10 + a02 * b12 + a03 * b13, b11 + a12 * b12 + a13 * b13 + q1, b12, b13,
+                p20 + a02 * p22 + a03 * p23, p21 + a12 * p22 + a13 * p23, p22 + q2, p23,
+                p30 + a02 * p32 + a03 * p33, p31 + a12 * p32 + a13 * p33, p32, p33 + q3)
+
+    def _update_step(self, x, P, zx, zy):
+        """H = [I2 0] 이므로 S = P[:2, :2] + R 이고, 2x2 역행렬은 닫힌 식으로 구합니다."""
+        r00, r01, r10, r11 = self._R_flat
+        s00, s01, s10, s11 = P[0] + r00, P[1] + r01, P[4] + r10, P[5] + r11
+        det = s00 * s11 - s01 * s10
+        i00, i01, i10, i11 = s11 / det, -s01 / det, -s10 / det, s00 / det
+
+        y0, y1 = zx - x[0], zy - x[1]
+        (p00, p01, p02, p03, p10, p11, p12, p13,
+         p20, p21, p22, p23, p30, p31, p32, p33) = P
+        # K = P[:, :2] S^-1 (4x2)
+        k00, k01 = p00 * i00 + p01 * i10, p00 * i01 + p01 * i11
+        k10, k11 = p10 * i00 + p11 * i10, p10 * i01 + p11 * i11
+        k20, k21 = p20 * i00 + p21 * i10, p20 * i01 + p21 * i11
+        k30, k31 = p30 * i00 + p31 * i10, p30 * i01 + p31 * i11
+
+        # 보정량 = K y. 위치 보정량이 max_update_distance를 넘으면 방향은 유지하고 크기만 줄입니다.
+        d0, d1 = k00 * y0 + k01 * y1, k10 * y0 + k11 * y1
+        d2, d3 = k20 * y0 + k21 * y1, k30 * y0 + k31 * y1
+        update_distance = math.hypot(d0, d1)
+        if update_distance > self.max_update_distance:
+            scale_factor = self.max_update_distance / update_distance
+            d0, d1, d2, d3 = d0 * scale_factor, d1 * scale_factor, d2 * scale_factor, d3 * scale_factor
+        x[0] += d0
+        x[1] += d1
+        x[2] += d2
+        x[3] += d3
+
+        # P = (I - K H) P  →  i행 -= K_i0 * (0행) + K_i1 * (1행)
+        P[:] = (p00 - (k00 * p00 + k01 * p10), p01 - (k00 * p01 + k01 * p11),
+                p02 - (k00 * p02 + k01 * p12), p03 - (k00 * p03 + k01 * p13),
+                p10 - (k10 * p00 + k11 * p10), p11 - (k10 * p01 + k11 * p11),
+                p12 - (k10 * p02 + k11 * p12), p13 - (k10 * p03 + k11 * p13),
+                p20 - (k20 * p00 + k21 * p10), p21 - (k20 * p01 + k21 * p11),
+                p22 - (k20 * p02 + k21 * p12), p23 - (k20 * p03 + k21 * p13),
+                p30 - (k30 * p00 + k31 * p10), p31 - (k30 * p01 + k31 * p11),
+                p32 - (k30 * p02 + k31 * p12), p33 - (k30 * p03 + k31 * p13))
+
+    def _refresh_noise(self):
+        # Q, R을 밖에서 바꿔도 다음 단계부터 반영되도록 매번 읽습니다 (원소 몇 개라 비용은 작습니다).
+        Q, R = self.Q, self.R
+        self._Q_diag = (Q.item(0, 0), Q.item(1, 1), Q.item(2, 2), Q.item(3, 3))
+        self._R_flat = (R.item(0, 0), R.item(0, 1), R.item(1, 0), R.item(1, 1))
+
+    def predict(self, imu_yaw, imu_speed, dt=None):
+        x_buf, P_buf = self._buffers()
+        self._refresh_noise()
+        x, P = x_buf.tolist(), P_buf.tolist()
+        self._predict_step(x, P, imu_yaw, imu_speed, dt)
+        x_buf[:] = x
+        P_buf[:] = P
 
     def update(self, z):
         # z: [x_ble, y_ble]
-        z_pred = self.x[:2]
-        H = np.zeros((2, self.n))
-        H[0, 0] = 1.0
-        H[1, 1] = 1.0
-
-        y = z - z_pred
-        S = H @ self.P @ H.T + self.R
-        K = self.P @ H.T @ np.linalg.inv(S)
-
-        # --- 수정된 부분 ②: 상태 업데이트 크기 제한 ---
-        # 칼만 이득(K)과 측정 오차(y)를 통해 계산된 보정량을 구합니다.
-        update_vector = K @ y
-
-        # 위치에 대한 보정량 [dx, dy]를 추출합니다.
-        position_update = update_vector[:2]
-        
-        # 보정량의 크기(이동 거리)를 계산합니다.
-        update_distance = np.linalg.norm(position_update)
-        
-        # 최대 허용 거리(20cm)를 정의합니다.
-        max_update_distance = 0.25
-
-        # 만약 계산된 보정 거리가 20cm를 초과하면
-        if update_distance > max_update_distance:
-            # 보정 벡터의 방향은 유지하되, 크기를 20cm로 줄입니다.
-            scale_factor = max_update_distance / update_distance
-            update_vector = update_vector * scale_factor
-
-        # 크기가 조절된 보정량을 최종 상태에 적용합니다.
-        self.x = self.x + update_vector
-        # ---------------------------------------------
-        
-        self.P = (np.eye(self.n) - K @ H) @ self.P
+        x_buf, P_buf = self._buffers()
+        self._refresh_noise()
+        x, P = x_buf.tolist(), P_buf.tolist()
+        self._update_step(x, P, float(z[0]), float(z[1]))
+        x_buf[:] = x
+        P_buf[:] = P
+
+    def run_sequence(self, events):
+        """
+        녹화된 predict / update 이벤트 열을 한 루프로 처리합니다 (오프라인 재생용).
+        events: ('predict', imu_yaw, imu_speed) / ('update', x_ble, y_ble) 튜플의 열,
+                또는 (N, 3) 배열 [종류(0=predict, 1=update), 값1, 값2]
+        반환: (states (N, 4), covariances (N, 4, 4)) - 각 이벤트를 처리한 직후의 상태와 공분산.
+        처리가 끝나면 필터 상태도 마지막 값으로 바뀝니다 (predict/update를 차례로 부른 것과 같습니다).
+        """
+        if isinstance(events, np.ndarray):
+            events = events.tolist()
+        x_buf, P_buf = self._buffers()
+        self._refresh_noise()
+        x, P = x_buf.tolist(), P_buf.tolist()
+        predict_step, update_step = self._predict_step, self._update_step
+        # 결과는 파이썬 배열(array 모듈)에 이어 붙였다가 마지막에 한 번만 NumPy 배열로 바꿉니다.
+        states, covariances = array('d'), array('d')
+        for kind, a, b in events:
+            if kind == 'predict' or kind == 0:
+                predict_step(x, P, a, b)
+            elif kind == 'update' or kind == 1:
+                update_step(x, P, float(a), float(b))
+            else:
+                raise ValueError(f"알 수 없는 EKF 이벤트입니다: {kind}")
+            states.extend(x)
+            covariances.extend(P)
+        x_buf[:] = x
+        P_buf[:] = P
+        return (np.frombuffer(states, dtype=np.float64).reshape(-1, self.n),
+                np.frombuffer(covariances, dtype=np.float64).reshape(-1, self.n, self.n))
 
     def get_state(self):
-        return self.x.copy()
\ No newline at end of file
+        return self.x.copy()
+
+    def shift(self, dx, dy, cov_scale=1.0):
+        """위치를 (dx, dy) m만큼 직접 옮기고 위치 공분산을 cov_scale배로 키웁니다 (main.py의 벽 회피 보정)."""
+        self.x[0] += dx
+        self.x[1] += dy
+        self.P[:2, :2] *= cov_scale
+
+    def snapshot(self):
+        """되돌리기(event_fusion.EventFusion)용 상태 사본"""
+        return self.x.copy(), self.P.copy()
+
+    def restore(self, snapshot):
+        x, P = snapshot
+        self.x[:] = x
+        self.P[:] = P
\ No newline at end of file